@@ -0,0 +1,245 @@
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# Linux FICLONE ioctl: copy-on-write clone on filesystems that support it (btrfs, xfs)
+FICLONE = 0x40049409
+
+class ZDArtifactError(RuntimeError):
+    """Raised when declared outputs are missing or inputs can't be materialized."""
+
+class ZDArtifactStore:
+    """Content-addressed store for files and results that steps hand to later steps.
+
+    Files live once under objects/<sha256>, read-only, and are materialized
+    into workspaces by reflink, hardlink or copy (first that works). A manifest
+    maps relative paths to object hashes plus key=value results; manifests can
+    be indexed by an action key so an identical step can be restored instead
+    of re-run. Objects are evicted least-recently-used beyond max_mb, except
+    those a live run has pinned: each store instance serves one run and pins
+    every object its manifests reference until zd_unpin, in a file under pins/
+    so runs in other processes sharing the store honour it too.
+    """
+
+    def __init__(self, root: Path, max_mb: Optional[float] = None):
+        self.root = Path(root).expanduser()
+        self.objects_dir = self.root / "objects"
+        self.index_dir = self.root / "index"
+        self.pins_dir = self.root / "pins"
+        self.max_mb = max_mb
+        for directory in (self.objects_dir, self.index_dir, self.pins_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        self._pin_file = self.pins_dir / f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._pinned: Set[str] = set()
+        # Parallel steps pin from worker threads
+        self._pin_lock = threading.Lock()
+
+    def zd_object_path(self, digest: str) -> Path:
+        """Where the object with this sha256 is stored."""
+        return self.objects_dir / digest[:2] / digest
+
+    def zd_collect(self, base: Path, paths: List[str], results: Dict[str, str]) -> dict:
+        """Ingest the declared files/directories under base and return their manifest."""
+        files: Dict[str, dict] = {}
+        for declared in paths:
+            source = base / declared
+            if not source.exists():
+                raise ZDArtifactError(f"Declared output '{declared}' was not produced")
+            candidates = [source] if source.is_file() else sorted(p for p in source.rglob("*") if p.is_file())
+            for path in candidates:
+                if path.is_symlink():
+                    continue
+                digest = self._zd_ingest(path)
+                files[str(path.relative_to(base))] = {
+                    "sha256": digest,
+                    "size": path.stat().st_size,
+                    "executable": bool(path.stat().st_mode & stat.S_IXUSR),
+                }
+        # Pinned before the manifest is saved, so the eviction that follows can't take them
+        self.zd_pin({"files": files})
+        return {"files": files, "results": dict(results)}
+
+    def zd_save_manifest(self, manifest: dict, action_key: Optional[str] = None) -> str:
+        """Store a manifest, optionally index it under an action key, and return its hash."""
+        data = json.dumps(manifest, sort_keys=True).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        self._zd_write_atomic(self.index_dir / f"manifest-{digest}.json", data)
+        if action_key:
+            self._zd_write_atomic(self.index_dir / f"action-{action_key}", digest.encode())
+        self.zd_evict()
+        return digest
+
+    def zd_lookup(self, action_key: str) -> Optional[dict]:
+        """Return the manifest recorded for an action key if all its objects are still stored."""
+        try:
+            digest = (self.index_dir / f"action-{action_key}").read_text().strip()
+            manifest = json.loads((self.index_dir / f"manifest-{digest}.json").read_text())
+        except (OSError, ValueError):
+            return None
+        self.zd_pin(manifest)
+        for entry in manifest["files"].values():
+            if not self.zd_object_path(entry["sha256"]).exists():
+                return None
+        self._zd_touch(manifest)
+        return manifest
+
+    def zd_materialize(self, manifest: dict, destination: Path) -> int:
+        """Place a manifest's files under destination; returns the number of files."""
+        self.zd_pin(manifest)
+        self._zd_touch(manifest)
+        for relative, entry in manifest["files"].items():
+            target = destination / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists():
+                target.unlink()
+            try:
+                self._zd_place(self.zd_object_path(entry["sha256"]), target, entry["executable"])
+            except FileNotFoundError:
+                raise ZDArtifactError(
+                    f"Stored file '{relative}' ({entry['sha256'][:12]}) is missing from the artifact store"
+                ) from None
+        return len(manifest["files"])
+
+    def zd_pin(self, manifest: dict) -> None:
+        """Keep a manifest's objects from eviction until zd_unpin."""
+        digests = {entry["sha256"] for entry in manifest["files"].values()}
+        with self._pin_lock:
+            if digests <= self._pinned:
+                return
+            self._pinned |= digests
+            self._zd_write_atomic(self._pin_file, json.dumps(sorted(self._pinned)).encode())
+
+    def zd_unpin(self) -> None:
+        """Release this run's pins."""
+        with self._pin_lock:
+            self._pinned.clear()
+            self._pin_file.unlink(missing_ok=True)
+
+    def zd_evict(self) -> int:
+        """Delete least recently used objects until the store fits max_mb; returns count removed."""
+        if not self.max_mb:
+            return 0
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            pinned = self._zd_live_pins()
+            objects: List[Tuple[float, int, Path]] = []
+            total = 0
+            for path in self.objects_dir.rglob("*"):
+                if path.is_file() and path.name not in pinned:
+                    info = path.stat()
+                    objects.append((info.st_mtime, info.st_size, path))
+                    total += info.st_size
+            # Pinned objects still count towards the limit; the store may exceed it until their runs end
+            limit = self.max_mb * 1024 * 1024
+            total += sum(self._zd_object_size(digest) for digest in pinned)
+            removed = 0
+            for _, size, path in sorted(objects):
+                if total <= limit:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            return removed
+
+    @staticmethod
+    def zd_hash(path: Path) -> str:
+        """sha256 of a file's contents."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _zd_live_pins(self) -> Set[str]:
+        """Objects pinned by runs whose process is still alive; pins of exited processes are removed."""
+        pinned: Set[str] = set()
+        for pin_file in self.pins_dir.iterdir():
+            if pin_file.name.startswith("."):
+                continue
+            pid = pin_file.name.partition("-")[0]
+            if not self._zd_pid_alive(pid):
+                pin_file.unlink(missing_ok=True)
+                continue
+            try:
+                pinned.update(json.loads(pin_file.read_text()))
+            except (OSError, ValueError):
+                continue
+        return pinned
+
+    def _zd_object_size(self, digest: str) -> int:
+        try:
+            return self.zd_object_path(digest).stat().st_size
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _zd_pid_alive(pid: str) -> bool:
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, ValueError):
+            pass
+        return True
+
+    def _zd_ingest(self, path: Path) -> str:
+        digest = self.zd_hash(path)
+        target = self.zd_object_path(digest)
+        if target.exists():
+            return digest
+        target.parent.mkdir(exist_ok=True)
+        # Unique per call: parallel steps in this process may ingest the same content at once
+        scratch = target.with_name(f".ingest-{digest}.{uuid.uuid4().hex}")
+        try:
+            self._zd_place(path, scratch, executable=False)
+            scratch.chmod(0o444)
+            scratch.replace(target)
+        finally:
+            scratch.unlink(missing_ok=True)
+        return digest
+
+    def _zd_place(self, source: Path, target: Path, executable: bool) -> None:
+        # A reflink is a private copy-on-write copy, so it may be made writable/executable
+        try:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            target.chmod(0o755 if executable else 0o644)
+            return
+        except OSError:
+            target.unlink(missing_ok=True)
+        # Hardlinks share the read-only object, so scripts can't modify the store through
+        # them; root ignores file modes, so it always gets a private copy
+        if not executable and os.geteuid() != 0:
+            try:
+                os.link(source, target)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        shutil.copyfile(source, target)
+        target.chmod(0o755 if executable else 0o644)
+
+    def _zd_touch(self, manifest: dict) -> None:
+        # mtime marks recent use for LRU eviction (atime is often disabled)
+        for entry in manifest["files"].values():
+            try:
+                os.utime(self.zd_object_path(entry["sha256"]))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _zd_write_atomic(path: Path, data: bytes) -> None:
+        scratch = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        try:
+            scratch.write_bytes(data)
+            scratch.replace(path)
+        finally:
+            scratch.unlink(missing_ok=True)
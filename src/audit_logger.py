@@ -1,17 +1,32 @@
 import asyncio
+import re
 from datetime import datetime
 from pathlib import Path
+from typing import List, Optional, Set
 import os
+import socket
+from audit_sink import ZDAuditShipper
+
+# Shown in place of secret values
+REDACTED = "********"
 
 class ZDLogger:
     """Session-based audit logger that handles both action logging and deployment output."""
     
-    def __init__(self, log_dir: str = "logs"):
+    def __init__(self, log_dir: str = "logs", shippers: Optional[List[ZDAuditShipper]] = None):
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
         self.session_id = int(datetime.now().timestamp())
         self.username = os.getenv('USER', 'unknown')
         self.log_file = self.log_dir / f"{self.username}_{self.session_id}_zd_session.log"
+        # External sinks get a copy of every entry; the local file stays the primary record
+        self.shippers = shippers or []
+        for shipper in self.shippers:
+            shipper.on_error = lambda message, name=shipper.sink.name: self._zd_sink_error(name, message)
+        self.hostname = socket.gethostname()
+        # Secret values seen this session, masked wherever they appear in entries
+        self._secrets: Set[str] = set()
+        self._secret_pattern: Optional[re.Pattern] = None
         
         # Create session log with header
         with open(self.log_file, "w") as f:
@@ -19,8 +34,25 @@ class ZDLogger:
             f.write(f"User: {self.username}\n")
             f.write("=" * 50 + "\n\n")
 
+    def zd_add_secret(self, value: str) -> None:
+        """Redact value from every later entry, in the log file and the sinks."""
+        if not value or value in self._secrets:
+            return
+        self._secrets.add(value)
+        # Longest first, so a secret containing another is masked whole
+        self._secret_pattern = re.compile(
+            "|".join(re.escape(secret) for secret in sorted(self._secrets, key=len, reverse=True))
+        )
+
+    def zd_redact(self, text: str) -> str:
+        """text with every known secret value masked."""
+        if self._secret_pattern is None or not text:
+            return text
+        return self._secret_pattern.sub(REDACTED, text)
+
     async def zd_log_action(self, action: str, details: str = "") -> None:
         """Log an action to the session log."""
+        details = self.zd_redact(details)
         timestamp = datetime.now().isoformat()
         log_entry = f"[ACTION] {timestamp} | {self.username} | {action}"
         if details:
@@ -30,9 +62,12 @@ class ZDLogger:
         async with asyncio.Lock():
             with open(self.log_file, "a") as f:
                 f.write(log_entry)
+        self._zd_ship(timestamp, "action", action=action, details=details)
 
     async def zd_log_output(self, step_name: str, command: str, output: str) -> None:
         """Log detailed deployment output to the session log."""
+        command = self.zd_redact(command)
+        output = self.zd_redact(output)
         timestamp = datetime.now().isoformat()
         deployment_log = (
             f"\n[ZD] Step: {step_name}\n"
@@ -45,6 +80,35 @@ class ZDLogger:
         async with asyncio.Lock():
             with open(self.log_file, "a") as f:
                 f.write(deployment_log)
+        self._zd_ship(timestamp, "output", step=step_name, command=command, output=output)
+
+    def _zd_ship(self, timestamp: str, kind: str, **fields) -> None:
+        """Hand an entry to each sink's queue; never waits on the sink."""
+        if not self.shippers:
+            return
+        record = {"timestamp": timestamp, "kind": kind, "host": self.hostname,
+                  "user": self.username, "session": self.session_id, **fields}
+        for shipper in self.shippers:
+            shipper.zd_submit(record)
+
+    async def zd_close(self) -> None:
+        """Flush the audit sinks, spooling anything they can't take now."""
+        for shipper in self.shippers:
+            await shipper.zd_close()
+            if shipper.spooled or shipper.dropped or shipper.corrupt or shipper.errors:
+                # Written directly: the sinks are closed
+                with open(self.log_file, "a") as f:
+                    f.write(f"[ACTION] {datetime.now().isoformat()} | {self.username} | audit_sink | "
+                            f"{shipper.sink.name}: {shipper.sent} sent, {shipper.spooled} spooled, "
+                            f"{shipper.dropped} dropped, {shipper.corrupt} unreadable, "
+                            f"{shipper.errors} errors | {shipper.last_error or ''}\n")
+        self.shippers = []
+
+    def _zd_sink_error(self, sink: str, message: str) -> None:
+        # Written directly rather than shipped, so a failing sink can't feed itself errors
+        with open(self.log_file, "a") as f:
+            f.write(f"[ACTION] {datetime.now().isoformat()} | {self.username} | audit_sink_error | "
+                    f"{sink}: {message}\n")
 
     async def __aenter__(self):
         return self
@@ -56,4 +120,7 @@ class ZDLogger:
                 f.write(f"\n=== ZenDeploy Session Ended: {datetime.now().isoformat()} ===\n")
                 if exc_type:
                     f.write(f"Session ended with error: {exc_val}\n")
-                f.write("=" * 50 + "\n") 
\ No newline at end of file
+                f.write("=" * 50 + "\n")
+        self._zd_ship(datetime.now().isoformat(), "action", action="session_end",
+                      details=f"error: {exc_val}" if exc_type else "")
+        await self.zd_close() 
\ No newline at end of file
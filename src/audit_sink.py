@@ -0,0 +1,479 @@
+import argparse
+import asyncio
+import fcntl
+import gzip
+import json
+import os
+import random
+import socket
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+# RFC 5424 facility codes accepted in sink configuration
+SYSLOG_FACILITIES = {"user": 1, "auth": 4, "authpriv": 10, **{f"local{i}": 16 + i for i in range(8)}}
+
+class ZDAuditSink:
+    """A destination for batches of audit records; zd_send raises when delivery fails."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def zd_send(self, batch: List[dict]) -> None:
+        raise NotImplementedError
+
+    async def zd_close(self) -> None:
+        pass
+
+class ZDHTTPSink(ZDAuditSink):
+    """POSTs each batch to a collector as (optionally gzip'd) JSON lines."""
+
+    def __init__(self, name: str, url: str, headers: Optional[dict] = None,
+                 compress: bool = True, timeout: float = 10.0):
+        super().__init__(name)
+        self.url = url
+        self.headers = dict(headers or {})
+        self.compress = compress
+        self.timeout = timeout
+
+    async def zd_send(self, batch: List[dict]) -> None:
+        body = b"".join(json.dumps(record).encode() + b"\n" for record in batch)
+        headers = {"Content-Type": "application/x-ndjson", **self.headers}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        await asyncio.to_thread(self._zd_post, body, headers)
+
+    def _zd_post(self, body: bytes, headers: dict) -> None:
+        request = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        # Error statuses raise HTTPError
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class ZDSyslogSink(ZDAuditSink):
+    """Sends each record as an RFC 5424 message to a local socket or a UDP/TCP syslog server."""
+
+    def __init__(self, name: str, address: str = "/dev/log", protocol: str = "udp",
+                 facility: str = "local0", max_message: int = 8192):
+        super().__init__(name)
+        if facility not in SYSLOG_FACILITIES:
+            raise ValueError(f"Unknown syslog facility '{facility}'")
+        if protocol not in ("udp", "tcp"):
+            raise ValueError(f"Unknown syslog protocol '{protocol}'")
+        self.address = address
+        self.protocol = protocol
+        # severity 6: informational
+        self.priority = SYSLOG_FACILITIES[facility] * 8 + 6
+        self.max_message = max_message
+        self.hostname = socket.gethostname()
+        self._sock: Optional[socket.socket] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def zd_send(self, batch: List[dict]) -> None:
+        messages = [self._zd_format(record) for record in batch]
+        try:
+            if self.address.startswith("/"):
+                await self._zd_send_datagrams(messages, socket.AF_UNIX, self.address)
+            elif self.protocol == "udp":
+                host, port = self._zd_host_port()
+                await self._zd_send_datagrams(messages, socket.AF_INET, (host, port))
+            else:
+                if self._writer is None:
+                    _, self._writer = await asyncio.open_connection(*self._zd_host_port())
+                # Octet-counting framing (RFC 6587), so messages may contain newlines
+                self._writer.write(b"".join(b"%d " % len(m) + m for m in messages))
+                await self._writer.drain()
+        except OSError:
+            await self.zd_close()
+            raise
+
+    async def zd_close(self) -> None:
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    async def _zd_send_datagrams(self, messages: List[bytes], family: int, address) -> None:
+        loop = asyncio.get_running_loop()
+        if self._sock is None:
+            self._sock = socket.socket(family, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+            self._sock.connect(address)
+        for message in messages:
+            await loop.sock_sendall(self._sock, message)
+
+    def _zd_host_port(self) -> tuple:
+        host, _, port = self.address.rpartition(":")
+        return host or "localhost", int(port or 514)
+
+    def _zd_format(self, record: dict) -> bytes:
+        header = (f"<{self.priority}>1 {record['timestamp']} {self.hostname} zendeploy "
+                  f"{os.getpid()} {record['kind']} - ").encode()
+        body = json.dumps(record, ensure_ascii=False).encode()
+        room = self.max_message - len(header)
+        if len(body) > room:
+            body = body[:max(room - 15, 0)] + b"...[truncated]"
+        return header + body
+
+class ZDSocketSink(ZDAuditSink):
+    """Writes JSON lines to a local Unix stream socket, reconnecting after failures."""
+
+    def __init__(self, name: str, path: str):
+        super().__init__(name)
+        self.path = os.path.expanduser(path)
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def zd_send(self, batch: List[dict]) -> None:
+        try:
+            if self._writer is None:
+                _, self._writer = await asyncio.open_unix_connection(self.path)
+            self._writer.write(b"".join(json.dumps(record).encode() + b"\n" for record in batch))
+            await self._writer.drain()
+        except OSError:
+            await self.zd_close()
+            raise
+
+    async def zd_close(self) -> None:
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+def zd_build_sink(spec: dict) -> ZDAuditSink:
+    """Create a sink from one entry of the audit.sinks configuration."""
+    kind = spec.get("type")
+    name = spec.get("name", kind)
+    if kind == "http":
+        return ZDHTTPSink(name, spec["url"], spec.get("headers"), spec.get("compress", True),
+                          spec.get("timeout", 10.0))
+    if kind == "syslog":
+        return ZDSyslogSink(name, spec.get("address", "/dev/log"), spec.get("protocol", "udp"),
+                            spec.get("facility", "local0"), spec.get("max_message", 8192))
+    if kind == "socket":
+        return ZDSocketSink(name, spec["path"])
+    raise ValueError(f"Unknown audit sink type '{kind}'")
+
+class ZDAuditShipper:
+    """Ships audit records to one sink from a bounded queue, off the logging path.
+
+    zd_submit never waits: records are queued, or appended to the on-disk spool
+    when the queue is full. A background worker sends batches; when the sink
+    fails, batches go to the spool and are retried with exponential backoff
+    before newer batches are sent. Spool segments left by sessions that ended
+    while the sink was down are picked up by the next shipper for the same
+    sink. Delivery is at least once; records carry their log timestamp.
+    Spooled lines that can't be parsed (a write torn by a crash) are skipped
+    and counted, and an unexpected error in the worker is reported through
+    on_error and retried after a backoff rather than ending shipping.
+    """
+
+    def __init__(self, sink: ZDAuditSink, spool_dir: Path, queue_size: int = 10000,
+                 batch_size: int = 200, flush_interval: float = 1.0, max_backoff: float = 60.0,
+                 spool_max_mb: Optional[float] = 512, send_timeout: float = 30.0):
+        self.sink = sink
+        self.spool_dir = Path(spool_dir).expanduser() / sink.name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.spool_max_bytes = spool_max_mb * 1024 * 1024 if spool_max_mb else None
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sent = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.corrupt = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        # Called with a description of unexpected worker errors and skipped spool lines
+        self.on_error: Optional[Callable[[str], None]] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+        # Records taken from the queue but not yet delivered or spooled
+        self._inflight: List[dict] = []
+        # Assume a previous session left a spool until the first drain shows otherwise
+        self._spool_pending = True
+        self._spool_bytes: Optional[int] = None
+        self._segment = None
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+    @classmethod
+    def for_config(cls, config) -> List['ZDAuditShipper']:
+        """One shipper per configured sink."""
+        spool_dir = config.audit_spool_dir or Path(config.cache_dir).expanduser() / "audit-spool"
+        shippers = []
+        for spec in config.audit_sinks:
+            sink = zd_build_sink(spec)
+            if any(shipper.sink.name == sink.name for shipper in shippers):
+                raise ValueError(f"Duplicate audit sink name '{sink.name}'")
+            shippers.append(cls(sink, spool_dir, config.audit_queue_size, config.audit_batch_size,
+                                config.audit_flush_interval, config.audit_max_backoff,
+                                config.audit_spool_max_mb))
+        return shippers
+
+    def zd_submit(self, record: dict) -> None:
+        """Queue a record for shipping; must be called from the event loop."""
+        if self._closed:
+            return
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._zd_run())
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            # A local append costs no more than the session log write, and loses nothing;
+            # queued records go first so they stay ahead of this one
+            records = []
+            while not self.queue.empty():
+                records.append(self.queue.get_nowait())
+            self._zd_spool(records + [record])
+
+    async def zd_close(self, timeout: float = 5.0) -> None:
+        """Stop the worker, make one last delivery attempt, and spool whatever is left."""
+        self._closed = True
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        records = self._inflight
+        self._inflight = []
+        while not self.queue.empty():
+            records.append(self.queue.get_nowait())
+        if records and not self._spool_pending:
+            try:
+                for start in range(0, len(records), self.batch_size):
+                    await asyncio.wait_for(self.sink.zd_send(records[start:start + self.batch_size]), timeout)
+                    self.sent += len(records[start:start + self.batch_size])
+                records = []
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                records = records[start:]
+        if records:
+            self._zd_spool(records)
+        self._zd_close_segment()
+        await self.sink.zd_close()
+
+    async def _zd_run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._closed:
+            try:
+                # Idle until a record arrives, or the spool is due for another attempt;
+                # a batch kept from a failed iteration goes straight away
+                timeout = max(self._retry_at - loop.time(), 0) if self._spool_pending else None
+                if self._inflight:
+                    timeout = 0
+                await self._zd_next_batch(timeout)
+                # wait_for can swallow a cancel that races a queued record, so check as well
+                if self._closed:
+                    return
+                if self._inflight:
+                    if self._spool_pending:
+                        self._zd_spool(self._inflight)
+                    elif not await self._zd_try_send(self._inflight):
+                        self._zd_spool(self._inflight)
+                    self._inflight = []
+                if self._spool_pending and loop.time() >= self._retry_at:
+                    await self._zd_drain()
+            except Exception as e:
+                # A dead worker would silently stop shipping for the rest of the session
+                self.errors += 1
+                self._zd_report(f"worker error: {type(e).__name__}: {e}")
+                self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2))
+                self._retry_at = loop.time() + self._backoff
+                await asyncio.sleep(self._backoff)
+
+    async def _zd_next_batch(self, timeout: Optional[float]) -> None:
+        """Collect up to batch_size records into _inflight, waiting at most flush_interval after the first."""
+        loop = asyncio.get_running_loop()
+        try:
+            self._inflight.append(await asyncio.wait_for(self.queue.get(), timeout))
+        except asyncio.TimeoutError:
+            return
+        deadline = loop.time() + self.flush_interval
+        while len(self._inflight) < self.batch_size:
+            try:
+                self._inflight.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                self._inflight.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                return
+
+    async def _zd_try_send(self, batch: List[dict]) -> bool:
+        try:
+            await asyncio.wait_for(self.sink.zd_send(batch), self.send_timeout)
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            # Exponential backoff with jitter, so many hosts don't retry in lockstep
+            self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2))
+            self._retry_at = asyncio.get_running_loop().time() + self._backoff * random.uniform(0.5, 1.0)
+            return False
+        self.sent += len(batch)
+        self._backoff = 0.0
+        return True
+
+    async def _zd_drain(self) -> None:
+        """Send spooled segments oldest first, stopping at the first failure."""
+        # Start a new segment so the ones being drained are no longer appended to
+        self._zd_close_segment()
+        segments = sorted(self.spool_dir.glob("*.ndjson")) if self.spool_dir.exists() else []
+        for path in segments:
+            fd = self._zd_claim(path)
+            if fd is None:
+                continue
+            try:
+                with os.fdopen(os.dup(fd), "r+", encoding="utf-8", errors="replace") as f:
+                    lines = await asyncio.to_thread(f.readlines)
+                    records = self._zd_parse(path, lines)
+                    for start in range(0, len(records), self.batch_size):
+                        if not await self._zd_try_send(records[start:start + self.batch_size]):
+                            # Keep only what wasn't delivered
+                            f.seek(0)
+                            f.writelines(json.dumps(record) + "\n" for record in records[start:])
+                            f.truncate()
+                            self._spool_bytes = None
+                            return
+                    path.unlink()
+                    self._spool_bytes = None
+            finally:
+                os.close(fd)
+        # Records spooled while draining went to a new segment, still to be sent
+        self._spool_pending = self._segment is not None
+
+    def _zd_parse(self, path: Path, lines: List[str]) -> List[dict]:
+        """Records from spooled lines, skipping (and counting) any that are torn or garbled."""
+        records = []
+        skipped = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                records.append(record)
+            else:
+                skipped += 1
+        if skipped:
+            self.corrupt += skipped
+            self._zd_report(f"skipped {skipped} unreadable spooled lines in {path.name}")
+        return records
+
+    def _zd_report(self, message: str) -> None:
+        self.last_error = message
+        if self.on_error:
+            try:
+                self.on_error(message)
+            except Exception:
+                pass
+
+    def _zd_claim(self, path: Path) -> Optional[int]:
+        """Lock a segment for draining; None if it is being written or drained elsewhere, or gone."""
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Another drainer may have finished and removed it while we waited to open it
+            if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _zd_spool(self, records: List[dict]) -> None:
+        if self._spool_bytes is None:
+            self._spool_bytes = sum(p.stat().st_size for p in self.spool_dir.glob("*.ndjson")) \
+                if self.spool_dir.exists() else 0
+        data = "".join(json.dumps(record) + "\n" for record in records)
+        if self.spool_max_bytes and self._spool_bytes + len(data) > self.spool_max_bytes:
+            self.dropped += len(records)
+            return
+        if self._segment is None:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            path = self.spool_dir / f"{time.time_ns()}-{os.getpid()}.ndjson"
+            self._segment = open(path, "a", encoding="utf-8")
+            # Held while the segment is written, so drainers leave it alone
+            fcntl.flock(self._segment, fcntl.LOCK_EX)
+        self._segment.write(data)
+        self._segment.flush()
+        self._spool_bytes += len(data)
+        self.spooled += len(records)
+        self._spool_pending = True
+
+    def _zd_close_segment(self) -> None:
+        if self._segment:
+            self._segment.close()
+            self._segment = None
+
+async def _zd_collect(args) -> None:
+    """Local stand-in collector: prints every record received over HTTP or a Unix socket."""
+    def emit(line: bytes) -> None:
+        if line.strip():
+            print(json.dumps(json.loads(line)), flush=True)
+
+    async def handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if args.fail:
+                    writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                else:
+                    if headers.get("content-encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    for line in body.splitlines():
+                        emit(line)
+                    writer.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_socket(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async for line in reader:
+            emit(line)
+        writer.close()
+
+    servers = []
+    if args.http:
+        host, _, port = args.http.rpartition(":")
+        servers.append(await asyncio.start_server(handle_http, host or "127.0.0.1", int(port)))
+    if args.socket:
+        servers.append(await asyncio.start_unix_server(handle_socket, path=args.socket))
+    print(f"Collecting at {datetime.now().isoformat()}", file=sys.stderr, flush=True)
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Stand-in audit collector for testing audit sinks")
+    parser.add_argument('--http', help="Listen for HTTP batches on [host:]port")
+    parser.add_argument('--socket', help="Listen for JSON lines on a Unix socket path")
+    parser.add_argument('--fail', action='store_true', help="Reject HTTP batches, as a collector outage")
+    args = parser.parse_args()
+    if not args.http and not args.socket:
+        parser.error("--http or --socket is required")
+    try:
+        asyncio.run(_zd_collect(args))
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
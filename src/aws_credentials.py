@@ -0,0 +1,304 @@
+import asyncio
+import configparser
+import itertools
+import json
+import os
+import re
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+# Profile settings that decide where credentials come from; brokered profiles get credential_process instead
+_SOURCE_KEYS = {
+    "aws_access_key_id", "aws_secret_access_key", "aws_session_token", "credential_process",
+    "role_arn", "source_profile", "credential_source", "role_session_name", "external_id",
+    "mfa_serial", "duration_seconds", "web_identity_token_file", "sso_session", "sso_start_url",
+    "sso_region", "sso_account_id", "sso_role_name",
+}
+
+# The credential_process brokered profiles point at: asks the broker's socket
+# (argv[1]) for a profile's (argv[2]) current credentials.
+HELPER = """import json, socket, sys
+sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+sock.connect(sys.argv[1])
+sock.sendall(sys.argv[2].encode() + b"\\n")
+reply = json.loads(b"".join(iter(lambda: sock.recv(65536), b"")))
+if "error" in reply:
+    sys.stderr.write(reply["error"] + "\\n")
+    sys.exit(1)
+sys.stdout.write(json.dumps(reply))
+"""
+
+class ZDCredentialError(RuntimeError):
+    """Raised when a profile's credentials can't be resolved."""
+
+@dataclass
+class ZDCredentials:
+    """Temporary credentials for one profile, as credential_process reports them."""
+    access_key_id: str
+    secret_access_key: str
+    session_token: Optional[str] = None
+    expiration: Optional[datetime] = None
+    issued: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @classmethod
+    def from_process(cls, data: dict) -> 'ZDCredentials':
+        expiration = datetime.fromisoformat(data["Expiration"]) if data.get("Expiration") else None
+        if expiration and expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=timezone.utc)
+        return cls(data["AccessKeyId"], data["SecretAccessKey"], data.get("SessionToken"), expiration)
+
+    def zd_process_output(self) -> dict:
+        output = {"Version": 1, "AccessKeyId": self.access_key_id, "SecretAccessKey": self.secret_access_key}
+        if self.session_token:
+            output["SessionToken"] = self.session_token
+        if self.expiration:
+            output["Expiration"] = self.expiration.isoformat()
+        return output
+
+    def zd_expires_in(self) -> float:
+        """Seconds until expiry; infinite for long-term credentials."""
+        if self.expiration is None:
+            return float("inf")
+        return (self.expiration - datetime.now(timezone.utc)).total_seconds()
+
+    def zd_refresh_in(self, margin: float) -> float:
+        """Seconds until these should be replaced: margin before expiry, or half-way for short-lived ones."""
+        if self.expiration is None:
+            return float("inf")
+        lifetime = (self.expiration - self.issued).total_seconds()
+        return self.zd_expires_in() - min(margin, lifetime / 2)
+
+class ZDCredentialBroker:
+    """Resolves each AWS profile once per session and hands the credentials to steps.
+
+    A profile's own credential_process is run directly; other profiles (SSO,
+    assumed roles, static keys) go through `aws configure export-credentials`.
+    Credentials are refreshed in the background refresh_margin seconds before
+    they expire. Steps get either a generated AWS config whose credential_process
+    asks this broker over a unix socket, so SDKs in long steps pick up refreshed
+    credentials, or (inject: env) the credentials as environment variables.
+    The generated config and credentials files are copies of the user's with
+    only the brokered profile changed, so scripts can still use other profiles.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self._credentials: Dict[str, ZDCredentials] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        # Profiles whose resolver can't be started (e.g. no aws CLI) aren't retried every step
+        self._unavailable: Dict[str, ZDCredentialError] = {}
+        # profile -> (AWS config, shared credentials file) given to its steps
+        self._files: Dict[str, Tuple[Path, Path]] = {}
+        # One write per profile, however many of its steps start at once
+        self._writing: Dict[str, asyncio.Task] = {}
+        self._file_ids = itertools.count()
+        self._dir: Optional[Path] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._refresher: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def zd_prefetch(self, profiles) -> None:
+        """Start resolving profiles concurrently; failures surface when a step asks for them."""
+        for profile in profiles:
+            if profile and profile not in self._credentials and profile not in self._pending:
+                self._zd_lookup(profile).add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def zd_credentials(self, profile: str) -> ZDCredentials:
+        """A profile's credentials, resolved now only if not cached or about to expire."""
+        credentials = self._credentials.get(profile)
+        if credentials and credentials.zd_refresh_in(self.config.aws_broker_refresh_margin) > 0:
+            return credentials
+        if profile in self._unavailable:
+            raise self._unavailable[profile]
+        return await asyncio.shield(self._zd_lookup(profile))
+
+    async def zd_env(self, profile: str) -> Dict[str, str]:
+        """Environment variables giving a step the profile's brokered credentials."""
+        credentials = await self.zd_credentials(profile)
+        if self.config.aws_broker_inject == "env":
+            env = {"AWS_ACCESS_KEY_ID": credentials.access_key_id,
+                   "AWS_SECRET_ACCESS_KEY": credentials.secret_access_key}
+            if credentials.session_token:
+                env["AWS_SESSION_TOKEN"] = credentials.session_token
+            return env
+        await self._zd_serve()
+        if profile not in self._files:
+            if profile not in self._writing:
+                # Named before the thread starts, so parallel steps of different profiles can't collide
+                name = f"{next(self._file_ids)}-{re.sub(r'[^A-Za-z0-9_.-]', '_', profile)}"
+                self._writing[profile] = asyncio.create_task(asyncio.to_thread(self._zd_write_files, profile, name))
+            task = self._writing[profile]
+            try:
+                self._files[profile] = await asyncio.shield(task)
+            finally:
+                # A failed write is retried by the next step of the profile
+                if task.done():
+                    self._writing.pop(profile, None)
+        config_file, credentials_file = self._files[profile]
+        return {
+            "AWS_CONFIG_FILE": str(config_file),
+            "AWS_SHARED_CREDENTIALS_FILE": str(credentials_file),
+            "AWS_SDK_LOAD_CONFIG": "1",
+        }
+
+    async def zd_close(self) -> None:
+        """Stop serving and refreshing, and remove the generated files."""
+        if self._refresher:
+            self._refresher.cancel()
+            self._refresher = None
+        for task in list(self._pending.values()):
+            task.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._dir:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+        self._files.clear()
+        self._writing.clear()
+        self._unavailable.clear()
+        self._credentials.clear()
+
+    def _zd_lookup(self, profile: str) -> asyncio.Task:
+        if profile not in self._pending:
+            self._pending[profile] = asyncio.create_task(self._zd_fetch(profile))
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._zd_refresh())
+        return self._pending[profile]
+
+    async def _zd_fetch(self, profile: str) -> ZDCredentials:
+        started = time.monotonic()
+        try:
+            try:
+                source = await asyncio.to_thread(self._zd_profile_settings, profile)
+            except configparser.Error as e:
+                raise ZDCredentialError(f"Profile '{profile}': unreadable AWS config ({e})") from e
+            if source.get("credential_process"):
+                command = shlex.split(source["credential_process"])
+            else:
+                command = [part.format(profile=profile) for part in self.config.aws_broker_command]
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except OSError as e:
+                error = ZDCredentialError(f"Profile '{profile}': cannot run {command[0]}: {e}")
+                self._unavailable[profile] = error
+                raise error from e
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), self.config.aws_broker_timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise ZDCredentialError(f"Profile '{profile}': timed out after {self.config.aws_broker_timeout:g}s")
+            if process.returncode != 0:
+                error = stderr.decode(errors="replace").strip().splitlines()
+                raise ZDCredentialError(
+                    f"Profile '{profile}': exit code {process.returncode}{': ' + error[-1] if error else ''}"
+                )
+            try:
+                credentials = ZDCredentials.from_process(json.loads(stdout))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ZDCredentialError(f"Profile '{profile}': unreadable credentials ({e})") from e
+            self._credentials[profile] = credentials
+            self.audit_logger.zd_add_secret(credentials.secret_access_key)
+            self.audit_logger.zd_add_secret(credentials.session_token)
+            self._changed.set()
+            expires = credentials.expiration.isoformat() if credentials.expiration else "never"
+            await self.audit_logger.zd_log_action(
+                "aws_credentials",
+                f"{profile}: resolved in {time.monotonic() - started:.2f}s, expires {expires}"
+            )
+            return credentials
+        finally:
+            del self._pending[profile]
+
+    async def _zd_refresh(self) -> None:
+        """Re-resolve cached credentials refresh_margin seconds before they expire."""
+        margin = self.config.aws_broker_refresh_margin
+        while True:
+            self._changed.clear()
+            due = {profile: credentials.zd_refresh_in(margin) for profile, credentials in self._credentials.items()}
+            wait = min(due.values(), default=float("inf"))
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), None if wait == float("inf") else wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for profile, remaining in due.items():
+                if remaining <= 0 and profile not in self._pending:
+                    try:
+                        await self._zd_lookup(profile)
+                    except ZDCredentialError as e:
+                        await self.audit_logger.zd_log_action("aws_credentials_error", str(e))
+                        # Steps asking for it will retry; don't spin on a failing profile
+                        await asyncio.sleep(min(margin, 30))
+
+    async def _zd_serve(self) -> None:
+        if self._server:
+            return
+        # Socket paths are length-limited (~104 bytes), so keep the directory short
+        self._dir = Path(tempfile.mkdtemp(prefix="zdaws_"))
+        (self._dir / "zd-credentials.py").write_text(HELPER)
+        self._server = await asyncio.start_unix_server(self._zd_handle, path=str(self._dir / "broker.sock"))
+
+    async def _zd_handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            profile = (await reader.readline()).decode().strip()
+            try:
+                reply = (await self.zd_credentials(profile)).zd_process_output()
+            except ZDCredentialError as e:
+                reply = {"error": str(e)}
+            writer.write(json.dumps(reply).encode())
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def _zd_write_files(self, profile: str, name: str) -> Tuple[Path, Path]:
+        """Copies of the AWS config and credentials files in which only profile asks the broker."""
+        config = self._zd_read_config()
+        section = "default" if profile == "default" else f"profile {profile}"
+        if not config.has_section(section):
+            config.add_section(section)
+        for key in _SOURCE_KEYS:
+            config.remove_option(section, key)
+        config.set(section, "credential_process", shlex.join([
+            sys.executable, str(self._dir / "zd-credentials.py"), str(self._dir / "broker.sock"), profile
+        ]))
+        # Keys for the profile in the credentials file would take precedence over credential_process;
+        # other profiles keep theirs, including those other profiles' source_profile chains use
+        credentials = self._zd_read_config(('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials'))
+        credentials.remove_section(profile)
+        paths = (self._dir / f"config-{name}", self._dir / f"credentials-{name}")
+        for parser, path in zip((config, credentials), paths):
+            with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                parser.write(f)
+        return paths
+
+    def _zd_profile_settings(self, profile: str) -> dict:
+        parser = self._zd_read_config()
+        section = "default" if profile == "default" else f"profile {profile}"
+        return dict(parser.items(section)) if parser.has_section(section) else {}
+
+    @staticmethod
+    def _zd_read_config(source: Tuple[str, str] = ('AWS_CONFIG_FILE', '~/.aws/config')) -> configparser.RawConfigParser:
+        """The file named by the environment variable, or its default location, parsed."""
+        variable, default = source
+        parser = configparser.RawConfigParser()
+        parser.read(os.path.expanduser(os.environ.get(variable, default)))
+        return parser
@@ -0,0 +1,135 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+@dataclass
+class ZDHostSignals:
+    """Point-in-time host load read from /proc. Missing signals are None."""
+    load_avg: Optional[float]
+    cpu_count: int
+    mem_available_mb: Optional[float]
+    cpu_pressure: Optional[float]
+    memory_pressure: Optional[float]
+    io_pressure: Optional[float]
+
+    @classmethod
+    def read(cls, proc: Path = Path("/proc")) -> 'ZDHostSignals':
+        return cls(
+            load_avg=cls._read_loadavg(proc),
+            cpu_count=os.cpu_count() or 1,
+            mem_available_mb=cls._read_mem_available(proc),
+            cpu_pressure=cls._read_pressure(proc, "cpu"),
+            memory_pressure=cls._read_pressure(proc, "memory"),
+            io_pressure=cls._read_pressure(proc, "io"),
+        )
+
+    @staticmethod
+    def _read_loadavg(proc: Path) -> Optional[float]:
+        try:
+            return float((proc / "loadavg").read_text().split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _read_mem_available(proc: Path) -> Optional[float]:
+        try:
+            for line in (proc / "meminfo").read_text().splitlines():
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    @staticmethod
+    def _read_pressure(proc: Path, resource: str) -> Optional[float]:
+        """Return the PSI 'some avg10' percentage for a resource."""
+        try:
+            for line in (proc / "pressure" / resource).read_text().splitlines():
+                if line.startswith("some"):
+                    fields = dict(field.split("=") for field in line.split()[1:])
+                    return float(fields["avg10"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def overload_reason(self, config: ZDConfig) -> Optional[str]:
+        """Describe why the host is overloaded, or None if it has headroom."""
+        if self.load_avg is not None and self.load_avg / self.cpu_count > config.max_load_per_cpu:
+            return f"load {self.load_avg:.2f} on {self.cpu_count} CPUs"
+        if self.mem_available_mb is not None and self.mem_available_mb < config.min_free_memory_mb:
+            return f"{self.mem_available_mb:.0f}MB memory available"
+        for name, value in (("cpu", self.cpu_pressure), ("memory", self.memory_pressure),
+                            ("io", self.io_pressure)):
+            if value is not None and value > config.max_pressure:
+                return f"{name} pressure {value:.1f}%"
+        return None
+
+class ZDGovernor:
+    """Adaptive limit on the total weight of steps in flight.
+
+    The limit grows by one while every slot is busy and the host has
+    headroom, and shrinks by a quarter when load, free memory or PSI
+    pressure cross their thresholds, always staying within
+    [min_parallel, max_parallel].
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self.limit = config.min_parallel
+        self.in_flight = 0
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    async def zd_acquire(self, weight: int = 1) -> bool:
+        """Wait for capacity for a step of the given weight.
+
+        Returns False if the governor was closed while waiting. A step
+        heavier than the whole limit still runs once nothing else is in flight.
+        """
+        while not self.closed:
+            if self.in_flight == 0 or self.in_flight + weight <= self.limit:
+                self.in_flight += weight
+                return True
+            self._changed.clear()
+            await self._changed.wait()
+        return False
+
+    def zd_release(self, weight: int = 1) -> None:
+        self.in_flight -= weight
+        self._zd_wake()
+
+    def zd_close(self) -> None:
+        """Stop handing out capacity and wake every waiter."""
+        self.closed = True
+        self._zd_wake()
+
+    def _zd_wake(self) -> None:
+        self._changed.set()
+
+    async def zd_adjust(self, signals: ZDHostSignals) -> None:
+        """Grow or shrink the limit based on one sample of host signals."""
+        previous = self.limit
+        reason = signals.overload_reason(self.config)
+        if reason:
+            self.limit = max(self.config.min_parallel, self.limit - max(1, self.limit // 4))
+        elif self.in_flight >= self.limit:
+            self.limit = min(self.config.max_parallel, self.limit + 1)
+
+        if self.limit != previous:
+            await self.audit_logger.zd_log_action(
+                "concurrency_limit",
+                f"{previous} -> {self.limit} ({reason or 'host has headroom'})"
+            )
+            self._zd_wake()
+
+    async def zd_run(self) -> None:
+        """Sample the host and adjust the limit until closed."""
+        while not self.closed:
+            signals = await asyncio.to_thread(ZDHostSignals.read)
+            await self.zd_adjust(signals)
+            await asyncio.sleep(self.config.governor_interval)
@@ -1,86 +1,604 @@
 import asyncio
-import tempfile
 import os
+import signal
+import resource
+import hashlib
+import json
+import statistics
+import tempfile
+import sys
+import time
+from dataclasses import dataclass, field
+from collections import deque
 from pathlib import Path
-import shutil
 import git
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, Callable, Deque, Dict, List, Optional
 import subprocess
-from audit_logger import ZDLogger
+from audit_logger import REDACTED, ZDLogger
+from zd_config import ZDConfig
+from repo_cache import ZDRepoCache, zd_resolve_repo_url
+from output_store import ZDOutputStore
+from concurrency_governor import ZDGovernor
+from workspace_pool import ZDWorkspacePool
+from shared_checkout import ZDSharedCheckouts
+from event_bus import BLOCK, ZDEventBus, ZDOutputEvent, ZDStatus, ZDSubscription
+from line_reader import ZDLineReader
+from ssh_transport import ZDSSHTransport, zd_git_ssh_command
+from preflight import ZDPreflight, ZDPreflightIssue
+from run_history import ZDRunHistory
+from session_recording import ZDSessionRecorder
+from resource_report import RUSAGE_WRAPPER, ZDResourceMonitor
+from artifact_store import ZDArtifactError, ZDArtifactStore
+from tool_cache import ZDCacheLease, ZDToolCaches
+from output_classifier import ZDOutputClassifier, ZDOutputSummary
+from python_pool import ZDPythonPool
+from env_resolver import ZDEnvResolver, ZDInterpolationError
+from aws_credentials import ZDCredentialBroker, ZDCredentialError
+from resource_limits import ZDResourceLease, ZDResourceLimits
+
+# stderr lines kept for the failure message of a script
+STDERR_TAIL_LINES = 200
+
+@dataclass
+class ZDScriptRun:
+    """Outcome of a single script execution."""
+    returncode: Optional[int] = None
+    kill_reason: Optional[str] = None
+    # Script rusage when resource reporting is on; approximate if the wrapper was killed, in which
+    # case RUSAGE_CHILDREN only offers the session's peak RSS (session_max_rss_kb), not the script's
+    usage: Optional[dict] = None
+    usage_exact: bool = True
+    # Classified output lines, when the script ran with a classifier
+    summary: Optional[ZDOutputSummary] = None
+
+@dataclass
+class ZDPreparedStep:
+    """A step whose workspace has been checked out and validated."""
+    step: object
+    step_dir: Optional[Path] = None
+    script_path: Optional[Path] = None
+    ok: bool = False
+    clone_seconds: Optional[float] = None
+    commit: Optional[str] = None
+    messages: List[tuple[str, str]] = field(default_factory=list)
 
 class ZDExecutor:
-    def __init__(self, zd_manager, audit_logger: ZDLogger):
+    def __init__(self, zd_manager, audit_logger: ZDLogger, config: Optional[ZDConfig] = None,
+                 repo_cache: Optional[ZDRepoCache] = None, workspace_pool: Optional[ZDWorkspacePool] = None,
+                 ssh_transport: Optional[ZDSSHTransport] = None,
+                 history: Optional[ZDRunHistory] = None,
+                 prior_outputs: Optional[Dict[str, tuple]] = None,
+                 python_pool: Optional[ZDPythonPool] = None,
+                 env_resolver: Optional[ZDEnvResolver] = None,
+                 credential_broker: Optional[ZDCredentialBroker] = None,
+                 resource_limits: Optional[ZDResourceLimits] = None):
         self.zd_manager = zd_manager
         self.audit_logger = audit_logger
-        self.temp_dir = None
+        self.config = config or ZDConfig()
+        self.repo_cache = repo_cache
+        self.workspace_pool = workspace_pool or ZDWorkspacePool(self.config, audit_logger)
+        # Repositories several steps of this run use, cloned once
+        self.shared_checkouts: Optional[ZDSharedCheckouts] = None
+        # Without a session-wide transport, connections are still shared within this run
+        self._owns_transport = ssh_transport is None and self.config.ssh_multiplex
+        self.ssh_transport = ssh_transport or (
+            ZDSSHTransport(self.config, audit_logger) if self.config.ssh_multiplex else None
+        )
+        # Likewise a warm Python worker for entry point steps, kept only for this run
+        self._owns_python_pool = python_pool is None and self.config.python_pool
+        self.python_pool = python_pool or (
+            ZDPythonPool(self.config, audit_logger) if self.config.python_pool else None
+        )
+        self.prepared = False
         self.current_step = None
+        # Output fans out from zd_run to the screen, daemon clients and the output files
+        self.bus = ZDEventBus()
+        self._file_logger: Optional[asyncio.Task] = None
+        self.output_store: Optional[ZDOutputStore] = None
+        self.recorder: Optional[ZDSessionRecorder] = None
+        self.resources: Optional[ZDResourceMonitor] = None
+        # Declared step outputs of this run: step name -> (manifest hash, manifest)
+        self.artifacts: Optional[ZDArtifactStore] = None
+        # Re-runs of part of a plan start from the outputs of the steps not being re-run
+        self.step_outputs: Dict[str, tuple[str, dict]] = dict(prior_outputs or {})
+        self._outputs_ready: Dict[str, asyncio.Event] = {}
+        # Tool caches shared across steps and runs, and the ones this run used
+        self.tool_caches: Optional[ZDToolCaches] = None
+        if self.config.tool_caches:
+            self.tool_caches = ZDToolCaches(
+                self.config.tool_cache_dir or Path(self.config.cache_dir).expanduser() / "tools",
+                self.config.tool_cache_builtin
+            )
+        self._caches_used: set = set()
+        self._cache_prune: Optional[asyncio.Task] = None
+        # AWS credentials per profile; a broker of this run's own is closed with it
+        self._owns_broker = credential_broker is None and self.config.aws_broker
+        self.credential_broker = credential_broker or (
+            ZDCredentialBroker(self.config, audit_logger) if self.config.aws_broker else None
+        )
+        self._credential_fallbacks: set = set()
+        # ${...} values in env_vars, memoized across runs when the resolver is session-wide
+        self.env_resolver = env_resolver or ZDEnvResolver(self.config, audit_logger)
+        # Named locks and rate limits steps claim; session-wide so concurrent runs share them
+        self.resource_limits = resource_limits or ZDResourceLimits(self.config, audit_logger)
+        self._leases: Dict[int, ZDResourceLease] = {}
+        # Output rules compiled once per run, and what they matched per step order
+        self.classifier = ZDOutputClassifier.for_config(self.config)
+        self.summaries: Dict[int, ZDOutputSummary] = {}
+        # Cooperative cancellation shared by the plan and the running script
+        self._cancel_event = asyncio.Event()
+        self.cancel_reason: Optional[str] = None
+        self.governor: Optional[ZDGovernor] = None
+        self.preflight_issues: List[ZDPreflightIssue] = []
+        # Bounds clones running at once, whether inline or ahead of time
+        self._checkout_slots = asyncio.Semaphore(self.config.max_checkouts)
+        # Run history: expected duration per step order, and progress against it
+        self.history = history
+        self.estimates: Dict[int, float] = {}
+        self._run_id: Optional[int] = None
+        self._step_started: Dict[int, float] = {}
+        self._step_outcomes: Dict[int, str] = {}
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation has been requested for this run."""
+        return self._cancel_event.is_set()
+
+    def zd_cancel(self, reason: str = "cancelled by operator") -> None:
+        """Request cancellation of the running deployment."""
+        if not self._cancel_event.is_set():
+            self.cancel_reason = reason
+            self._cancel_event.set()
+            if self.governor:
+                self.governor.zd_close()
 
     async def zd_prepare(self) -> bool:
         """Prepare the deployment environment."""
         try:
-            # Create temporary directory for deployments
-            self.temp_dir = Path(tempfile.mkdtemp(prefix="zd_"))
-            await self.audit_logger.zd_log_action("zd_prepare", f"Created temp dir: {self.temp_dir}")
+            # Step workspaces come from the (possibly shared) pool
+            await self.workspace_pool.zd_start()
+            self.prepared = True
+            if self.config.share_checkouts:
+                shared = ZDSharedCheckouts(
+                    self.zd_manager.steps, self.workspace_pool, self.audit_logger, self.zd_clone_repo
+                )
+                self.shared_checkouts = shared if shared.shared else None
+            if self.python_pool and any(step.entry_point for step in self.zd_manager.steps):
+                # Imports warm up while preflight and checkouts run
+                self.python_pool.zd_start()
+            if self.config.output_store:
+                self.output_store = ZDOutputStore.for_session(self.audit_logger)
+                await self.audit_logger.zd_log_action("zd_prepare", f"Step output stored in: {self.output_store.directory}")
+            if any(step.outputs or step.inputs for step in self.zd_manager.steps):
+                self.artifacts = ZDArtifactStore(
+                    self.config.artifact_dir or Path(self.config.cache_dir).expanduser() / "artifacts",
+                    self.config.artifact_max_mb
+                )
+                self._outputs_ready = {step.name: asyncio.Event() for step in self.zd_manager.steps}
+            if self.tool_caches and (self.config.tool_cache_max_mb or self.config.tool_cache_max_age_days):
+                # Caches in use are skipped, so pruning can overlap the run
+                self._cache_prune = asyncio.create_task(asyncio.to_thread(
+                    self.tool_caches.zd_prune, self.config.tool_cache_max_mb, self.config.tool_cache_max_age_days
+                ))
+            if self.config.resource_report:
+                self.resources = ZDResourceMonitor(self.config.resource_top_sites, self.config.resource_frames)
+                self.resources.zd_start()
+            if self.config.record_session:
+                self.recorder = ZDSessionRecorder.for_session(self.audit_logger, self.zd_manager.steps)
+                await self.audit_logger.zd_log_action("zd_prepare", f"Recording session to: {self.recorder.path}")
+            if self.output_store or self.recorder:
+                # Lossless: the run waits for the files rather than skip output
+                self._file_logger = asyncio.create_task(self._zd_log_files(
+                    self.bus.zd_subscribe("output-files", self.config.event_queue_size, BLOCK)
+                ))
             return True
         except Exception as e:
             await self.audit_logger.zd_log_action("zd_prepare_error", str(e))
             return False
 
     async def zd_execute(self) -> AsyncGenerator[tuple[str, str], None]:
-        """Execute all deployment steps and yield tuples of (formatted_output, raw_output)."""
-        if not self.temp_dir:
-            yield (
+        """Execute all deployment steps and yield tuples of (formatted_output, raw_output).
+
+        Shorthand for a lossless subscription to the bus while zd_run runs, so
+        the caller paces the run; consumers that must not, subscribe themselves.
+        """
+        subscription = self.bus.zd_subscribe("zd_execute", self.config.event_queue_size)
+        runner = asyncio.create_task(self.zd_run())
+        try:
+            async for event in subscription:
+                yield event.formatted, event.raw
+            await runner
+        finally:
+            self.bus.zd_unsubscribe(subscription)
+            if not runner.done():
+                # The consumer stopped early; let the run stop and clean up as on any cancellation
+                self.zd_cancel("output consumer stopped")
+                await asyncio.gather(runner, return_exceptions=True)
+
+    async def zd_run(self) -> None:
+        """Execute all deployment steps, publishing their output on the bus.
+
+        The bus is closed when the run ends, and the output files are complete
+        when this returns.
+        """
+        try:
+            async for step, output in self._zd_outputs():
+                states = (output.state,) if isinstance(output, ZDStatus) else ()
+                # Every consumer (output store, recording, screen) only ever sees redacted output
+                redact = self.audit_logger.zd_redact
+                await self.bus.zd_publish(ZDOutputEvent(step, redact(output[0]), redact(output[1]), states))
+        finally:
+            self.bus.zd_close()
+            for subscription in self.bus.subscriptions:
+                if subscription.dropped or subscription.coalesced:
+                    await self.audit_logger.zd_log_action(
+                        "event_bus",
+                        f"{subscription.name}: {subscription.dropped} events dropped, "
+                        f"{subscription.coalesced} coalesced, peak queue {subscription.peak}"
+                    )
+            if self._file_logger:
+                await self._file_logger
+
+    async def _zd_outputs(self) -> AsyncGenerator[tuple[object, tuple[str, str]], None]:
+        """Run the plan, yielding (step, output); step is None for output about the whole run."""
+        if not self.prepared:
+            yield None, (
                 "[red]Error: Deployment not prepared[/red]\n",
                 "ERROR: Deployment not prepared\n"
             )
             return
 
+        # Plan-level timeout is enforced by cancelling the whole run
+        plan_watchdog = None
+        if self.config.plan_timeout:
+            plan_watchdog = asyncio.create_task(self._zd_plan_watchdog(self.config.plan_timeout))
+
         try:
-            for step in self.zd_manager.steps:
-                self.current_step = step
-                async for output in self.zd_execute_step(step):
-                    yield output  # output is already a tuple from zd_execute_step
+            if self.history:
+                self._run_id = await asyncio.to_thread(self.history.zd_start_run, len(self.zd_manager.steps))
+                self.estimates = await asyncio.to_thread(self.history.zd_estimates, self.zd_manager.steps)
+
+            if self.config.preflight:
+                async for output in self._zd_preflight():
+                    yield None, output
+                if self.resources:
+                    await self.resources.zd_phase("preflight")
+
+            if not self.preflight_issues:
+                # Shared values resolve concurrently while the first steps check out
+                self.env_resolver.zd_prefetch(self.zd_manager.steps)
+                if self.credential_broker:
+                    self.credential_broker.zd_prefetch({step.aws_profile for step in self.zd_manager.steps})
+
+            if self.preflight_issues:
+                await self.audit_logger.zd_log_action(
+                    "preflight_failed", f"{len(self.preflight_issues)} problems, nothing deployed"
+                )
+            elif self.config.parallel:
+                async for step, output in self._zd_execute_parallel():
+                    yield step, output
+            elif self.config.pipeline_depth > 0:
+                async for step, output in self._zd_execute_pipelined():
+                    yield step, output
+            else:
+                for step in self.zd_manager.steps:
+                    if self.cancelled:
+                        break
+                    self.current_step = step
+                    async for output in self.zd_execute_step(step):
+                        yield step, output
+
+            if any(summary.matched for summary in self.summaries.values()):
+                async for output in self._zd_output_summary():
+                    yield None, output
+
+            if self._caches_used:
+                async for output in self._zd_cache_report():
+                    yield None, output
+
+            if self.resources:
+                await self.resources.zd_phase("steps")
+                async for output in self._zd_resource_report():
+                    yield None, output
+
+            if self.cancelled:
+                output = (
+                    f"[red]✗ Deployment cancelled: {self.cancel_reason}[/red]\n",
+                    f"=== Deployment Cancelled: {self.cancel_reason} ===\n"
+                )
+                yield None, output
+                await self.audit_logger.zd_log_action("zd_cancelled", self.cancel_reason)
 
         finally:
+            if plan_watchdog:
+                plan_watchdog.cancel()
+            if self._cache_prune:
+                await self._zd_finish_prune()
+            if self.resources:
+                self.resources.zd_stop()
+            if self._run_id is not None:
+                await asyncio.to_thread(self.history.zd_finish_run, self._run_id, self._zd_run_outcome())
+            if self.shared_checkouts:
+                await self.shared_checkouts.zd_close()
+            # Leases of steps stopped between claiming and running must not block other runs
+            for lease in self._leases.values():
+                self.resource_limits.zd_release(lease)
+            self._leases.clear()
             # Cleanup
             await self.zd_cleanup()
 
-    async def zd_execute_step(self, step) -> AsyncGenerator[tuple[str, str], None]:
-        """Execute a single deployment step."""
-        step_dir = self.temp_dir / f"step_{step.order}"
-        step_dir.mkdir(exist_ok=True)
-        success = False
+    async def _zd_output_summary(self) -> AsyncGenerator[tuple[str, str], None]:
+        """Show the errors and warnings each step's output contained, with the first few of each."""
+        yield ("\n[bold]Output summary[/bold]\n", "\n=== Output Summary ===\n")
+        colors = {"fatal": "red", "error": "red", "warning": "yellow"}
+        for step in self.zd_manager.steps:
+            summary = self.summaries.get(step.order)
+            if not summary or not summary.matched:
+                continue
+            counts = ", ".join(f"{count} {severity}" for severity, count in summary.counts.items() if count)
+            await self.audit_logger.zd_log_action("output_summary", f"{step.name}: {counts}")
+            yield (
+                f"Step {step.order + 1} ({step.name}): {counts}\n",
+                f"Step {step.order + 1} ({step.name}): {counts}\n"
+            )
+            for severity, lines in summary.samples.items():
+                for line in lines:
+                    yield (f"  [{colors[severity]}]{severity}[/{colors[severity]}] {line}\n", f"  {severity.upper()}: {line}\n")
 
+    async def _zd_cache_report(self) -> AsyncGenerator[tuple[str, str], None]:
+        """Show the size of each tool cache this run used."""
+        sizes = await asyncio.to_thread(self.tool_caches.zd_sizes)
+        summary = ", ".join(f"{name} {sizes.get(name, 0):.1f}MB" for name in sorted(self._caches_used))
+        await self.audit_logger.zd_log_action("tool_caches", summary)
+        yield (f"[dim]Tool caches: {summary}[/dim]\n", f"Tool caches: {summary}\n")
+
+    async def _zd_finish_prune(self) -> None:
+        """Wait for the start-of-run prune and log what it freed."""
         try:
-            # Header
-            yield (
-                f"\n[bold blue]Step {step.order + 1}: {step.name}[/bold blue]\n",
-                f"\n=== Step {step.order + 1}: {step.name} ===\n"
+            freed = await self._cache_prune
+        except Exception as e:
+            await self.audit_logger.zd_log_action("tool_cache_prune_error", str(e))
+            return
+        if freed:
+            await self.audit_logger.zd_log_action(
+                "tool_cache_pruned", ", ".join(f"{name} {mb:.1f}MB" for name, mb in freed.items())
             )
 
-            # Clone repository
-            # Don't show the raw command yet - let zd_clone_repo handle it
+    async def _zd_resource_report(self) -> AsyncGenerator[tuple[str, str], None]:
+        """Show the run's resource report and write it beside the session log."""
+        lines = self.resources.zd_report()
+        path = await asyncio.to_thread(self.resources.zd_write, self.audit_logger)
+        await self.audit_logger.zd_log_action("resource_report", str(path))
+        yield (f"\n[bold]{lines[0]}[/bold]\n", f"\n{lines[0]}\n")
+        for line in lines[1:]:
+            yield (f"[dim]{line}[/dim]\n", f"{line}\n")
+        yield (f"[dim]Written to {path}[/dim]\n", f"Resource report written to {path}\n")
+
+    def _zd_run_outcome(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        if self.preflight_issues or any(o not in ("succeeded", "restored") for o in self._step_outcomes.values()):
+            return "failed"
+        return "succeeded"
+
+    def zd_eta(self) -> Optional[tuple[float, float]]:
+        """Return (fraction done, seconds remaining) from run history, or None without any."""
+        if not self.estimates:
+            return None
+        # Steps never seen before are assumed to take a typical time
+        typical = statistics.median(self.estimates.values())
+        now = time.monotonic()
+        done = remaining = 0.0
+        for step in self.zd_manager.steps:
+            expected = self.estimates.get(step.order, typical)
+            if step.order in self._step_outcomes:
+                done += expected
+            elif step.order in self._step_started:
+                elapsed = now - self._step_started[step.order]
+                done += min(elapsed, expected)
+                remaining += max(expected - elapsed, 0.0)
+            else:
+                remaining += expected
+        if self.governor:
+            remaining /= max(self.governor.limit, 1)
+        total = done + remaining
+        return (done / total if total else 1.0), remaining
+
+    async def _zd_execute_parallel(self) -> AsyncGenerator[tuple[object, tuple[str, str]], None]:
+        """Run steps concurrently under the governor, yielding (step, output) as it interleaves.
+
+        current_step is set to the producing step before each yield.
+        """
+        self.governor = ZDGovernor(self.config, self.audit_logger)
+        governor_task = asyncio.create_task(self.governor.zd_run())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        done = object()
+
+        async def run_step(step) -> None:
+            # Wait for the steps this one takes inputs or results from before taking a slot
+            for name in step.dependencies:
+                ready = self._outputs_ready.get(name)
+                if ready:
+                    await ready.wait()
+            # Likewise for its resources, so a step waiting on a lock doesn't hold a slot
+            if step.resources:
+                async for output in self._zd_claim_resources(step):
+                    await queue.put((step, output))
+                if step.order not in self._leases:
+                    return
+            if not await self.governor.zd_acquire(step.weight):
+                self._zd_release_resources(step)
+                return
+            try:
+                async for output in self.zd_execute_step(step):
+                    await queue.put((step, output))
+            except Exception:
+                # zd_execute_step has already reported the error
+                pass
+            finally:
+                self.governor.zd_release(step.weight)
+
+        # Longest steps first (unknown ones count as the longest) shortens the critical path;
+        # the governor wakes waiters in creation order
+        unknown = max(self.estimates.values(), default=0.0)
+        steps = sorted(self.zd_manager.steps, key=lambda s: -self.estimates.get(s.order, unknown))
+
+        async def run_all() -> None:
+            try:
+                await asyncio.gather(*(run_step(step) for step in steps))
+            finally:
+                await queue.put(done)
+
+        runner = asyncio.create_task(run_all())
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                step, output = item
+                self.current_step = step
+                yield step, output
+        finally:
+            self.governor.zd_close()
+            governor_task.cancel()
+            if not runner.done():
+                self.zd_cancel("deployment aborted")
+                runner.cancel()
+
+    async def _zd_preflight(self) -> AsyncGenerator[tuple[str, str], None]:
+        """Validate the whole plan before any step runs, reporting every problem."""
+        yield (
+            f"[yellow]Running preflight checks for {len(self.zd_manager.steps)} steps...[/yellow]\n",
+            "=== Preflight Checks ===\n"
+        )
+        preflight = ZDPreflight(self.config, self.audit_logger, self.repo_cache, self.ssh_transport)
+        issues = await preflight.zd_check(self.zd_manager.steps, self.step_outputs)
+        self.preflight_issues = [issue for issue in issues if not issue.warning]
+        for issue in issues:
+            if issue.warning:
+                yield (f"[yellow]⚠ {issue}[/yellow]\n", f"WARNING: {issue}\n")
+        if not self.preflight_issues:
             yield (
-                "[yellow]Cloning repository...[/yellow]\n",
-                ""  # Empty string for raw output, will be handled by zd_clone_repo
+                "[green]✓ Preflight checks passed[/green]\n",
+                "Preflight checks passed\n"
             )
+            return
+        for issue in self.preflight_issues:
+            yield (f"[red]✗ {issue}[/red]\n", f"ERROR: {issue}\n")
+        yield ZDStatus(
+            f"[red]✗ Preflight failed with {len(self.preflight_issues)} problems; nothing was deployed[/red]\n",
+            f"=== Preflight Failed: {len(self.preflight_issues)} problems ===\n",
+            "failed"
+        )
 
-            repo = await self.zd_clone_repo(step, step_dir)
-            if not repo:
-                error_msg = "Failed to clone repository"
-                yield (
-                    f"[red]✗ {error_msg}[/red]\n",
-                    f"ERROR: {error_msg}\n"
+    async def _zd_execute_pipelined(self) -> AsyncGenerator[tuple[object, tuple[str, str]], None]:
+        """Run steps strictly in order while checking out the next pipeline_depth steps."""
+        steps = self.zd_manager.steps
+        checkouts: Dict[int, asyncio.Task] = {}
+        try:
+            for index, step in enumerate(steps):
+                if self.cancelled:
+                    break
+                # Keep the lookahead window full
+                for ahead in range(index, min(len(steps), index + self.config.pipeline_depth + 1)):
+                    if ahead not in checkouts:
+                        checkouts[ahead] = asyncio.create_task(self._zd_checkout_buffered(steps[ahead]))
+
+                self.current_step = step
+                async for output in self.zd_execute_step(step, checkouts.pop(index)):
+                    yield step, output
+        finally:
+            # Checkouts for steps that will never run still hold workspaces
+            for task in checkouts.values():
+                task.cancel()
+            for task in checkouts.values():
+                try:
+                    prepared = await task
+                except asyncio.CancelledError:
+                    continue
+                if prepared.step_dir:
+                    await self.workspace_pool.zd_release(prepared.step_dir)
+
+    async def _zd_log_files(self, subscription: ZDSubscription) -> None:
+        """Write every published output to the on-disk store and session recording, then close them."""
+        try:
+            async for event in subscription:
+                self._zd_store_output(event.step, (event.formatted, event.raw), event.states)
+        finally:
+            if self.output_store:
+                self.output_store.zd_close()
+            if self.recorder:
+                self.recorder.zd_close()
+                await self.audit_logger.zd_log_action(
+                    "session_recorded", f"{self.recorder.events} events -> {self.recorder.path}"
                 )
-                return
 
-            yield (
-                "[green]✓ Repository cloned successfully[/green]\n",
-                "Repository cloned successfully\n"
+    def _zd_store_output(self, step, output: tuple[str, str], states: tuple = ()) -> None:
+        """Append output to the session recording and a step's raw output to its on-disk segment."""
+        if self.recorder:
+            self.recorder.zd_record(step, output, states)
+        if self.output_store and step is not None and output[1]:
+            self.output_store.zd_segment(step).zd_append(output[1])
+
+    async def _zd_plan_watchdog(self, timeout: float) -> None:
+        """Cancel the run once the plan timeout expires."""
+        try:
+            await asyncio.wait_for(self._cancel_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.zd_cancel(f"plan timeout after {timeout:g}s")
+
+    async def zd_execute_step(self, step, checkout: Optional[asyncio.Task] = None) -> AsyncGenerator[tuple[str, str], None]:
+        """Execute a single deployment step.
+
+        checkout, if given, is a task already running _zd_checkout_buffered
+        for this step; its buffered output is replayed in place of an inline checkout.
+        """
+        prepared = ZDPreparedStep(step)
+        success = False
+        run: Optional[ZDScriptRun] = None
+        started_at = time.time()
+        self._step_started[step.order] = time.monotonic()
+        output_bytes = output_lines = 0
+        heap_before = self.resources.zd_heap_kb() if self.resources else 0.0
+        # Outputs of an earlier run of this step must not outlive a failed re-run
+        self.step_outputs.pop(step.name, None)
+        restored = False
+        results_file: Optional[Path] = None
+        cache_lease: Optional[ZDCacheLease] = None
+
+        try:
+            if step.resources and step.order not in self._leases:
+                async for output in self._zd_claim_resources(step):
+                    yield output
+                if step.order not in self._leases:
+                    return
+                # Time spent waiting is not part of the step's duration
+                started_at = time.time()
+                self._step_started[step.order] = time.monotonic()
+
+            # Header
+            yield ZDStatus(
+                f"\n[bold blue]Step {step.order + 1}: {step.name}[/bold blue]\n",
+                f"\n=== Step {step.order + 1}: {step.name} ===\n",
+                "running"
             )
 
+            if checkout is not None:
+                prepared = await checkout
+                for output in prepared.messages:
+                    yield output
+            elif not self.cancelled:
+                async for output in self._zd_checkout(prepared):
+                    yield output
+
+            if not prepared.ok or self.cancelled:
+                return
+
+            # Each step gets its own environment so concurrent steps can't leak into each other
+            env = os.environ.copy()
+
             # Set AWS profile
-            os.environ['AWS_PROFILE'] = step.aws_profile
+            env['AWS_PROFILE'] = step.aws_profile
             yield (
                 f"[yellow]Setting AWS Profile to: {step.aws_profile}[/yellow]\n",
                 f"$ export AWS_PROFILE={step.aws_profile}\n"
@@ -89,48 +607,151 @@ class ZDExecutor:
                 "[green]✓ AWS Profile set[/green]\n",
                 "AWS Profile set\n"
             )
+            if self.credential_broker:
+                try:
+                    env.update(await self.credential_broker.zd_env(step.aws_profile))
+                    yield (
+                        "[green]✓ AWS credentials provided by the session broker[/green]\n",
+                        "AWS credentials provided by the session broker\n"
+                    )
+                except ZDCredentialError as e:
+                    # The script resolves the profile itself, as it would without the broker;
+                    # said once per profile and run rather than for every step
+                    if step.aws_profile not in self._credential_fallbacks:
+                        self._credential_fallbacks.add(step.aws_profile)
+                        await self.audit_logger.zd_log_action("aws_credentials_fallback", str(e))
+                        yield (
+                            f"[yellow]⚠ {e}; scripts will resolve the profile themselves[/yellow]\n",
+                            f"WARNING: {e}\n"
+                        )
 
-            # Set environment variables
-            for key, value in step.env_vars.items():
-                os.environ[key] = str(value)
+            # Set environment variables, resolving ${...} references
+            try:
+                env_vars = await self.env_resolver.zd_resolve(step.env_vars, self.step_outputs)
+            except ZDInterpolationError as e:
+                yield (f"[red]✗ {e}[/red]\n", f"ERROR: {e}\n")
+                await self.audit_logger.zd_log_action("step_error", f"{step.name}: {e}")
+                return
+            for key in step.secrets:
+                self.audit_logger.zd_add_secret(env_vars.get(key))
+            for key, value in env_vars.items():
+                env[key] = value
+                shown = REDACTED if key in step.secrets else value
                 yield (
-                    f"[yellow]Setting {key}={value}[/yellow]\n",
-                    f"$ export {key}={value}\n"
+                    f"[yellow]Setting {key}={shown}[/yellow]\n",
+                    f"$ export {key}={shown}\n"
                 )
             yield (
                 "[green]✓ Environment variables set[/green]\n",
                 "Environment variables set\n"
             )
 
-            # Execute script
-            # First, find the script in the cloned repository
-            repo_script_path = step_dir / step.script_path
-            if not repo_script_path.exists():
-                error_msg = f"Script not found at {repo_script_path}"
-                await self.audit_logger.zd_log_action("debug", f"Looking for script at: {repo_script_path}")
-                await self.audit_logger.zd_log_action("debug", f"Repository directory contents: {list(step_dir.glob('**/*'))}")
+            if step.inputs:
+                try:
+                    input_digests = await self._zd_materialize_inputs(step, prepared.step_dir, env)
+                except ZDArtifactError as e:
+                    yield (f"[red]✗ {e}[/red]\n", f"ERROR: {e}\n")
+                    await self.audit_logger.zd_log_action("step_error", str(e))
+                    return
                 yield (
-                    f"[red]✗ {error_msg}[/red]\n",
-                    f"ERROR: {error_msg}\n"
+                    f"[green]✓ Inputs from {', '.join(s['step'] for s in step.inputs)} materialized[/green]\n",
+                    "Inputs materialized\n"
                 )
-                await self.audit_logger.zd_log_action("step_error", error_msg)
-                return
+            else:
+                input_digests = []
 
-            # Make script executable
-            repo_script_path.chmod(0o755)
-            
-            yield (
-                f"[yellow]Executing script: {repo_script_path}[/yellow]\n",
-                f"$ {repo_script_path}\n"
-            )
-            async for formatted, raw in self.zd_run_script(repo_script_path, step.name):
+            # An identical earlier run of a reusable step stands in for running it again
+            action_key = None
+            if step.outputs.get('reuse') and prepared.commit:
+                action_key = self._zd_action_key(step, prepared.commit, input_digests, env_vars)
+                manifest = await asyncio.to_thread(self.artifacts.zd_lookup, action_key)
+                if manifest:
+                    digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+                    self.step_outputs[step.name] = (digest, manifest)
+                    restored = success = True
+                    await self.audit_logger.zd_log_action("outputs_restored", f"{step.name}: {action_key}")
+                    yield (
+                        f"[green]✓ Outputs restored from the artifact cache; {step.name} not re-run[/green]\n",
+                        f"Outputs restored from artifact cache ({len(manifest['files'])} files)\n"
+                    )
+                    yield ZDStatus(
+                        f"[green]✓ Step {step.order + 1} completed successfully[/green]\n",
+                        f"=== Step {step.order + 1} Completed Successfully ===\n",
+                        "succeeded"
+                    )
+                    return
+
+            if step.outputs or step.inputs:
+                # Scripts run from ZenDeploy's directory; outputs and inputs are relative to the checkout
+                env['ZD_WORKSPACE'] = str(prepared.step_dir)
+            if step.outputs:
+                # Scripts append KEY=value results here, like GitHub Actions' GITHUB_OUTPUT
+                fd, name = tempfile.mkstemp(prefix="zdoutputs_")
+                os.close(fd)
+                results_file = Path(name)
+                env['ZD_OUTPUTS'] = str(results_file)
+
+            if self.tool_caches:
+                cache_lease = await self.tool_caches.zd_acquire(step)
+                if cache_lease.names:
+                    env.update(cache_lease.env)
+                    self._caches_used.update(cache_lease.names)
+                    yield (
+                        f"[green]✓ Tool caches: {', '.join(cache_lease.names)}[/green]\n",
+                        "".join(f"$ export {key}={value}\n" for key, value in cache_lease.env.items())
+                    )
+
+            # Execute script, or call the entry point with the checkout importable
+            if step.entry_point:
+                repo_script_path = prepared.step_dir
+                yield (
+                    f"[yellow]Calling entry point: {step.entry_point}[/yellow]\n",
+                    f"$ {step.entry_point}\n"
+                )
+            else:
+                repo_script_path = prepared.script_path
+                yield (
+                    f"[yellow]Executing script: {repo_script_path}[/yellow]\n",
+                    f"$ {repo_script_path}\n"
+                )
+            timeout = step.timeout or self.config.step_timeout
+            run = ZDScriptRun(summary=ZDOutputSummary(self.config.classifier_samples))
+            self.summaries[step.order] = run.summary
+            classifier = self.classifier.zd_for_step(step.output_rules)
+            async for formatted, raw in self.zd_run_script(repo_script_path, step.name, timeout, env, run, classifier,
+                                                           step.entry_point or None):
+                output_bytes += len(raw)
+                output_lines += raw.count("\n")
                 yield formatted, raw
 
+            # A killed script, or one exiting non-zero, never counts as a successful step
+            if run.kill_reason or run.returncode != 0:
+                return
+
+            if step.outputs:
+                try:
+                    digest, manifest = await self._zd_store_outputs(step, prepared.step_dir, results_file, action_key)
+                except ZDArtifactError as e:
+                    yield (f"[red]✗ {e}[/red]\n", f"ERROR: {e}\n")
+                    await self.audit_logger.zd_log_action("step_error", str(e))
+                    return
+                self.step_outputs[step.name] = (digest, manifest)
+                size_mb = sum(entry['size'] for entry in manifest['files'].values()) / (1024 * 1024)
+                yield (
+                    f"[green]✓ Stored {len(manifest['files'])} output files ({size_mb:.1f}MB) "
+                    f"and {len(manifest['results'])} results[/green]\n",
+                    f"Stored outputs: {len(manifest['files'])} files, {len(manifest['results'])} results\n"
+                )
+
             # Only mark as successful if we get here
             success = True
-            yield (
+            warning = await self._zd_check_regression(step)
+            if warning:
+                yield (f"[yellow]⚠ {warning}[/yellow]\n", f"WARNING: {warning}\n")
+            yield ZDStatus(
                 f"[green]✓ Step {step.order + 1} completed successfully[/green]\n",
-                f"=== Step {step.order + 1} Completed Successfully ===\n"
+                f"=== Step {step.order + 1} Completed Successfully ===\n",
+                "succeeded"
             )
             yield ("-" * 40 + "\n", "-" * 40 + "\n")
 
@@ -144,15 +765,258 @@ class ZDExecutor:
             raise
 
         finally:
+            # Release before yielding so a closed generator still returns its workspace
+            kept = None
+            if prepared.step_dir:
+                keep = not success and self.config.keep_failed_workspaces
+                kept = await self.workspace_pool.zd_release(prepared.step_dir, keep=keep)
+            if self.shared_checkouts:
+                await self.shared_checkouts.zd_release(step)
+            self._zd_release_resources(step)
+            if results_file:
+                results_file.unlink(missing_ok=True)
+            if cache_lease:
+                self.tool_caches.zd_release(cache_lease)
+            ready = self._outputs_ready.get(step.name)
+            if ready:
+                ready.set()
+            if restored:
+                outcome = "restored"
+            elif success:
+                outcome = "succeeded"
+            elif run and run.kill_reason:
+                outcome = "killed"
+            else:
+                outcome = "cancelled" if self.cancelled else "failed"
+            self._step_outcomes[step.order] = outcome
+            if self.config.fail_fast and outcome in ("failed", "killed") and not self.cancelled:
+                # Stops the steps in flight as well as the ones not yet started
+                self.zd_cancel(f"fail-fast after step {step.order + 1} ({step.name}) failed")
+            if self.resources and run is not None:
+                self.resources.zd_record_step(
+                    step, time.monotonic() - self._step_started[step.order], heap_before,
+                    run.usage, run.usage_exact
+                )
+            if self._run_id is not None and outcome != "cancelled":
+                await asyncio.to_thread(
+                    self.history.zd_record_step, self._run_id, step, started_at,
+                    time.monotonic() - self._step_started[step.order], prepared.clone_seconds,
+                    output_bytes, output_lines, outcome
+                )
             if not success:
-                yield (
+                yield ZDStatus(
                     f"[red]✗ Step {step.order + 1} failed[/red]\n",
-                    f"=== Step {step.order + 1} Failed ===\n"
+                    f"=== Step {step.order + 1} Failed ===\n",
+                    "failed"
+                )
+            if kept:
+                yield (
+                    f"[yellow]Workspace kept for debugging: {kept}[/yellow]\n",
+                    f"Workspace kept for debugging: {kept}\n"
                 )
 
+    async def _zd_claim_resources(self, step) -> AsyncGenerator[tuple[str, str], None]:
+        """Wait until the step's resource claims are granted, reporting what it waits for.
+
+        The lease is kept in _leases until the step ends; none is kept if the run is cancelled first.
+        """
+        holder = f"step {step.order + 1} ({step.name})"
+        lease = self.resource_limits.zd_try_acquire(step.resources, holder)
+        if lease is not None:
+            self._leases[step.order] = lease
+            return
+        blockers = ", ".join(self.resource_limits.zd_blockers(step.resources))
+        yield ZDStatus(
+            f"[yellow]⏳ Step {step.order + 1} ({step.name}) waiting for {blockers}[/yellow]\n",
+            f"=== Step {step.order + 1} Waiting for {blockers} ===\n",
+            "waiting"
+        )
+        started = time.monotonic()
+        waiter = asyncio.ensure_future(self.resource_limits.zd_acquire(step.resources, holder))
+        cancelled = asyncio.ensure_future(self._cancel_event.wait())
+        try:
+            await asyncio.wait({waiter, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+            if not waiter.done():
+                waiter.cancel()
+                await asyncio.gather(waiter, return_exceptions=True)
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # Granted, possibly just as the wait was cancelled; the step's finally returns it
+                self._leases[step.order] = waiter.result()
+        if step.order not in self._leases:
+            return
+        waited = time.monotonic() - started
+        await self.audit_logger.zd_log_action("resource_wait", f"{holder}: {waited:.1f}s for {blockers}")
+        yield (
+            f"[green]✓ Resources acquired after {waited:.1f}s[/green]\n",
+            f"Resources acquired after {waited:.1f}s\n"
+        )
+
+    def _zd_release_resources(self, step) -> None:
+        lease = self._leases.pop(step.order, None)
+        if lease:
+            self.resource_limits.zd_release(lease)
+
+    async def _zd_materialize_inputs(self, step, step_dir: Path, env: Dict[str, str]) -> List[str]:
+        """Place earlier steps' output files in the workspace and export their results.
+
+        Returns the manifest hashes of the inputs, in declaration order.
+        """
+        digests = []
+        for source in step.inputs:
+            name = source.get('step')
+            if name not in self.step_outputs:
+                raise ZDArtifactError(f"Input from step '{name}' is not available (did it run and succeed?)")
+            digest, manifest = self.step_outputs[name]
+            destination = step_dir / source.get('path', '.')
+            count = await asyncio.to_thread(self.artifacts.zd_materialize, manifest, destination)
+            env.update(manifest['results'])
+            await self.audit_logger.zd_log_action(
+                "inputs_materialized", f"{step.name}: {count} files from {name} -> {destination}"
+            )
+            digests.append(digest)
+        return digests
+
+    async def _zd_store_outputs(self, step, step_dir: Path, results_file: Optional[Path],
+                                action_key: Optional[str]) -> tuple[str, dict]:
+        """Ingest a finished step's declared outputs into the artifact store."""
+        results: Dict[str, str] = {}
+        if results_file and results_file.exists():
+            for line in results_file.read_text().splitlines():
+                key, sep, value = line.partition("=")
+                if sep and key.strip():
+                    results[key.strip()] = value
+        missing = [key for key in step.outputs.get('results', []) if key not in results]
+        if missing:
+            raise ZDArtifactError(f"Declared results not written to $ZD_OUTPUTS: {', '.join(missing)}")
+        manifest = await asyncio.to_thread(
+            self.artifacts.zd_collect, step_dir, step.outputs.get('files', []), results
+        )
+        digest = await asyncio.to_thread(self.artifacts.zd_save_manifest, manifest, action_key)
+        await self.audit_logger.zd_log_action("outputs_stored", f"{step.name}: manifest {digest}")
+        return digest, manifest
+
+    @staticmethod
+    def _zd_action_key(step, commit: str, input_digests: List[str], env_vars: Dict[str, str]) -> str:
+        """Identify everything that determines a step's outputs."""
+        action = {
+            "repo": step.repo_url,
+            "commit": commit,
+            "script": step.command,
+            "aws_profile": step.aws_profile,
+            "env_vars": env_vars,
+            "inputs": input_digests,
+            "outputs": step.outputs,
+        }
+        return hashlib.sha256(json.dumps(action, sort_keys=True).encode()).hexdigest()
+
+    async def _zd_check_regression(self, step) -> Optional[str]:
+        """Describe how much slower this run of a step was than its history, if notably so."""
+        if self.history is None:
+            return None
+        baseline = await asyncio.to_thread(self.history.zd_baseline, step)
+        duration = time.monotonic() - self._step_started[step.order]
+        if (baseline is None or duration < baseline * self.config.regression_factor
+                or duration - baseline < self.config.regression_min_seconds):
+            return None
+        message = f"Step {step.order + 1} ({step.name}) took {duration:.1f}s, usually {baseline:.1f}s"
+        await self.audit_logger.zd_log_action("step_regression", message)
+        return message
+
+    async def _zd_checkout(self, prepared: ZDPreparedStep) -> AsyncGenerator[tuple[str, str], None]:
+        """Acquire a workspace, clone the step's repository and validate its script.
+
+        Sets prepared.ok only when the script is ready to run.
+        """
+        step = prepared.step
+        try:
+            prepared.step_dir = await self.workspace_pool.zd_acquire(f"step_{step.order}")
+        except Exception as e:
+            error_msg = f"Could not get a workspace: {str(e)}"
+            yield (
+                f"[red]✗ {error_msg}[/red]\n",
+                f"ERROR: {error_msg}\n"
+            )
+            await self.audit_logger.zd_log_action("step_error", error_msg)
+            return
+        step_dir = prepared.step_dir
+
+        # Clone repository
+        # Don't show the raw command yet - let zd_clone_repo handle it
+        yield (
+            "[yellow]Cloning repository...[/yellow]\n",
+            ""  # Empty string for raw output, will be handled by zd_clone_repo
+        )
+
+        async with self._checkout_slots:
+            clone_start = time.monotonic()
+            if self.shared_checkouts and self.shared_checkouts.zd_shares(step):
+                repo = await self.shared_checkouts.zd_checkout(step, step_dir)
+            else:
+                repo = await self.zd_clone_repo(step, step_dir)
+            prepared.clone_seconds = time.monotonic() - clone_start
+        if repo and step.outputs.get('reuse'):
+            try:
+                prepared.commit = await asyncio.to_thread(lambda: repo.head.commit.hexsha)
+            except Exception:
+                # Without a known commit the step can't be matched to earlier runs
+                prepared.commit = None
+        if not repo:
+            error_msg = "Failed to clone repository"
+            yield (
+                f"[red]✗ {error_msg}[/red]\n",
+                f"ERROR: {error_msg}\n"
+            )
+            return
+
+        yield (
+            "[green]✓ Repository cloned successfully[/green]\n",
+            "Repository cloned successfully\n"
+        )
+
+        if step.entry_point:
+            # Imported from the checkout (or the worker's environment) when called
+            prepared.ok = True
+            return
+
+        # Find the script in the cloned repository
+        repo_script_path = step_dir / step.script_path
+        if not repo_script_path.exists():
+            error_msg = f"Script not found at {repo_script_path}"
+            await self.audit_logger.zd_log_action("debug", f"Looking for script at: {repo_script_path}")
+            await self.audit_logger.zd_log_action("debug", f"Repository directory contents: {list(step_dir.glob('**/*'))}")
+            yield (
+                f"[red]✗ {error_msg}[/red]\n",
+                f"ERROR: {error_msg}\n"
+            )
+            await self.audit_logger.zd_log_action("step_error", error_msg)
+            return
+
+        # Make script executable
+        repo_script_path.chmod(0o755)
+        prepared.script_path = repo_script_path
+        prepared.ok = True
+
+    async def _zd_checkout_buffered(self, step) -> ZDPreparedStep:
+        """Run a step's checkout ahead of time, keeping its output for later replay."""
+        prepared = ZDPreparedStep(step)
+        try:
+            async for output in self._zd_checkout(prepared):
+                prepared.messages.append(output)
+        except asyncio.CancelledError:
+            if prepared.step_dir:
+                await self.workspace_pool.zd_release(prepared.step_dir)
+            raise
+        return prepared
+
     async def zd_clone_repo(self, step, directory: Path) -> Optional[git.Repo]:
         """Clone the git repository for a step."""
         try:
+            # Warm mirrors turn the clone into a local copy
+            if self.repo_cache:
+                return await self._zd_clone_from_cache(step, directory)
+
             # For local file:// repositories, handle differently
             if step.repo_url.startswith('file://'):
                 # Get the absolute path of the repository
@@ -188,7 +1052,8 @@ class ZDExecutor:
 
                 try:
                     # Attempt the clone
-                    repo = git.Repo.clone_from(
+                    repo = await asyncio.to_thread(
+                        git.Repo.clone_from,
                         url=repo_path,
                         to_path=str(directory),
                         multi_options=['--no-hardlinks']
@@ -210,11 +1075,13 @@ class ZDExecutor:
                 clone_cmd = f"$ git clone {step.repo_url} {directory}"
                 await self.audit_logger.zd_log_action("clone_attempt", clone_cmd)
                 
-                git_ssh_cmd = f'ssh -i {step.ssh_key}'
                 env = os.environ.copy()
-                env['GIT_SSH_COMMAND'] = git_ssh_cmd
+                git_ssh_cmd = self.zd_ssh_command(step)
+                if git_ssh_cmd:
+                    env['GIT_SSH_COMMAND'] = git_ssh_cmd
 
-                repo = git.Repo.clone_from(
+                repo = await asyncio.to_thread(
+                    git.Repo.clone_from,
                     url=step.repo_url,
                     to_path=str(directory),
                     env=env
@@ -229,29 +1096,129 @@ class ZDExecutor:
             await self.audit_logger.zd_log_action("error", f"Full error: {traceback.format_exc()}")
             return None
 
-    async def zd_run_script(self, script_path: Path, step_name: str) -> AsyncGenerator[tuple[str, str], None]:
-        """Execute a deployment script and yield tuples of (formatted_output, raw_output)"""
+    @staticmethod
+    def zd_resolve_repo_url(step) -> str:
+        """Return the clone source for a step, resolving file:// paths against the project root."""
+        return zd_resolve_repo_url(step.repo_url)
+
+    def zd_ssh_command(self, step) -> Optional[str]:
+        """Return the GIT_SSH_COMMAND for a step's remote repository."""
+        return zd_git_ssh_command(self.ssh_transport, step.repo_url, step.ssh_key)
+
+    async def _zd_clone_from_cache(self, step, directory: Path) -> git.Repo:
+        """Clone a step's repository from the shared mirror cache."""
+        url = self.zd_resolve_repo_url(step)
+        mirror = await self.repo_cache.zd_mirror(
+            url, self.zd_ssh_command(step), self.config.repo_cache_max_age
+        )
+        await self.audit_logger.zd_log_action("command", f"$ git clone {mirror} {directory}")
+
+        repo = await asyncio.to_thread(git.Repo.clone_from, str(mirror), str(directory))
+        # Point origin back at the real remote so scripts see the usual URL
+        repo.remote('origin').set_url(url)
+        return repo
+
+    async def zd_run_script(self, script_path: Path, step_name: str,
+                            timeout: Optional[float] = None, env: Optional[Dict[str, str]] = None,
+                            run: Optional[ZDScriptRun] = None,
+                            classifier: Optional[ZDOutputClassifier] = None,
+                            entry_point: Optional[str] = None) -> AsyncGenerator[tuple[str, str], None]:
+        """Execute a deployment script and yield tuples of (formatted_output, raw_output)
+
+        With a classifier, stdout and stderr lines are counted into run.summary,
+        and the first fatal line kills the script. With an entry_point, that
+        module:function is called in the Python worker pool instead, importing
+        from script_path.
+        """
+        run = run if run is not None else ZDScriptRun()
+        if classifier and run.summary is None:
+            run.summary = ZDOutputSummary(self.config.classifier_samples)
+        watchdog = None
+        killer: Optional[asyncio.Task] = None
+        stderr_task = None
+        usage_file = None
+
+        def classify(lines: List[str]) -> None:
+            nonlocal killer
+            for line in lines:
+                severity = classifier.zd_classify(line)
+                if severity is None:
+                    continue
+                run.summary.zd_add(severity, line)
+                if severity == "fatal" and killer is None and not run.kill_reason:
+                    run.kill_reason = f"fatal output: {line[:200]}"
+                    killer = asyncio.create_task(self.zd_terminate_process(process))
         try:
-            script_path.chmod(0o755)
-            process = await asyncio.create_subprocess_exec(
-                str(script_path),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            if entry_point:
+                # Calls run in their own session and report their own rusage
+                process = await self.python_pool.zd_call(entry_point, script_path, env or dict(os.environ))
+            else:
+                script_path.chmod(0o755)
+                command = [str(script_path)]
+                if self.resources:
+                    # RUSAGE_CHILDREN mixes concurrent steps; the wrapper reports this script's own wait4 usage
+                    usage_file = ZDResourceMonitor.zd_usage_file()
+                    command = [sys.executable, "-c", RUSAGE_WRAPPER, str(usage_file), str(script_path)]
+                # Run in a new session so the whole process tree can be signalled
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    env=env,
+                    start_new_session=True
+                )
+            watchdog = asyncio.create_task(self._zd_script_watchdog(process, timeout, run))
+            # Drain stderr alongside stdout so a chatty script can't fill the pipe and stall
+            stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+            stderr_task = asyncio.create_task(
+                self._zd_collect_lines(process.stderr, stderr_tail, classify if classifier else None)
             )
 
-            while True:
-                line = await process.stdout.readline()
-                if not line:
-                    break
-                output = line.decode().strip()
-                await self.audit_logger.zd_log_output(step_name, "execute", output)
-                yield f"{output}\n", f"{output}\n"
+            reader = ZDLineReader(process.stdout, self.config.output_chunk_size, self.config.max_line_length)
+            async for lines in reader.zd_batches():
+                # One log write per chunk rather than per line
+                await self.audit_logger.zd_log_output(step_name, "execute", "\n".join(lines))
+                if classifier:
+                    classify(lines)
+                for output in lines:
+                    yield f"{output}\n", f"{output}\n"
 
             await process.wait()
+            await stderr_task
+            run.returncode = process.returncode
+            # Let a pending kill finish escalating before reporting
+            if killer:
+                await killer
+            elif run.kill_reason:
+                await watchdog
+            if entry_point and self.resources:
+                run.usage = process.usage
+                run.usage_exact = process.usage is not None
+            if usage_file:
+                run.usage = await asyncio.to_thread(ZDResourceMonitor.zd_read_usage, usage_file)
+                if run.usage is None:
+                    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                    run.usage_exact = False
+                    run.usage = {
+                        "user": after.ru_utime - usage_before.ru_utime,
+                        "sys": after.ru_stime - usage_before.ru_stime,
+                        # The largest child of the whole session, not necessarily this script
+                        "session_max_rss_kb": after.ru_maxrss,
+                    }
 
-            if process.returncode != 0:
-                error = await process.stderr.read()
-                error_msg = error.decode().strip()
+            if run.kill_reason:
+                usage = self._zd_usage_delta(usage_before, resource.getrusage(resource.RUSAGE_CHILDREN))
+                await self.audit_logger.zd_log_action(
+                    "step_killed",
+                    f"{step_name}: {run.kill_reason} | {usage}"
+                )
+                yield (
+                    f"[red]Script terminated: {run.kill_reason}[/red]\n",
+                    f"ERROR: Script terminated: {run.kill_reason} ({usage})\n"
+                )
+            elif process.returncode != 0:
+                error_msg = "\n".join(stderr_tail).strip()
                 await self.audit_logger.zd_log_output(step_name, "error", error_msg)
                 yield (
                     f"[red]Script execution failed: {error_msg}[/red]\n",
@@ -266,8 +1233,80 @@ class ZDExecutor:
                 f"ERROR: {error_msg}\n"
             )
 
+        finally:
+            if watchdog and not watchdog.done():
+                watchdog.cancel()
+            if killer and not killer.done():
+                killer.cancel()
+            if stderr_task and not stderr_task.done():
+                stderr_task.cancel()
+            if usage_file:
+                usage_file.unlink(missing_ok=True)
+
+    async def _zd_collect_lines(self, stream: asyncio.StreamReader, lines: Deque[str],
+                                on_batch: Optional[Callable[[List[str]], None]] = None) -> None:
+        """Read a stream to EOF, keeping its most recent lines and passing each batch to on_batch."""
+        reader = ZDLineReader(stream, self.config.output_chunk_size, self.config.max_line_length)
+        async for batch in reader.zd_batches():
+            lines.extend(batch)
+            if on_batch:
+                on_batch(batch)
+
+    async def _zd_script_watchdog(self, process, timeout: Optional[float], run: ZDScriptRun) -> None:
+        """Kill the script's process group on cancellation or step timeout."""
+        try:
+            await asyncio.wait_for(self._cancel_event.wait(), timeout)
+            run.kill_reason = self.cancel_reason
+        except asyncio.TimeoutError:
+            run.kill_reason = f"step timeout after {timeout:g}s"
+        await self.zd_terminate_process(process)
+
+    async def zd_terminate_process(self, process) -> None:
+        """Send SIGTERM to the process group, then SIGKILL after the grace period."""
+        pgid = process.pid  # start_new_session makes the child its own group leader
+        try:
+            os.killpg(pgid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+
+        try:
+            await asyncio.wait_for(process.wait(), self.config.kill_grace_period)
+        except asyncio.TimeoutError:
+            await self.audit_logger.zd_log_action(
+                "step_kill",
+                f"Process group {pgid} ignored SIGTERM for {self.config.kill_grace_period:g}s"
+            )
+
+        # Always sweep the group so grandchildren don't outlive the step
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    @staticmethod
+    def _zd_usage_delta(before, after) -> str:
+        """Format child resource usage accumulated between two getrusage snapshots.
+
+        RUSAGE_CHILDREN's ru_maxrss is the largest child of the whole session, so it
+        is labelled as a session-wide peak rather than attributed to the step.
+        """
+        return (
+            f"user={after.ru_utime - before.ru_utime:.2f}s "
+            f"sys={after.ru_stime - before.ru_stime:.2f}s "
+            f"session_peak_rss={after.ru_maxrss}KB"
+        )
+
     async def zd_cleanup(self):
-        """Clean up temporary files."""
-        if self.temp_dir and self.temp_dir.exists():
-            shutil.rmtree(self.temp_dir)
-            await self.audit_logger.zd_log_action("zd_cleanup", f"Removed temp dir: {self.temp_dir}") 
\ No newline at end of file
+        """Finish the run; workspace deletion happens in the pool's background reaper."""
+        self.prepared = False
+        if self.artifacts:
+            # This run's outputs may be evicted from now on
+            self.artifacts.zd_unpin()
+        if self._owns_transport:
+            await self.ssh_transport.zd_close()
+        if self._owns_python_pool:
+            await self.python_pool.zd_close()
+        if self._owns_broker:
+            await self.credential_broker.zd_close()
+        await self.audit_logger.zd_log_action("zd_cleanup", f"Workspaces returned to {self.workspace_pool.root}")
@@ -1,10 +1,16 @@
-from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 import yaml
 import time
 import gc
 import base64 as b64
+from audit_logger import REDACTED
+from env_resolver import zd_references
+
+def zd_display_env(env_vars: dict, secrets) -> dict:
+    """env_vars as shown to operators, with the values of the named secrets redacted."""
+    return {key: REDACTED if key in secrets else value for key, value in env_vars.items()}
 
 @dataclass
 class ZDStep:
@@ -16,6 +22,37 @@ class ZDStep:
     ssh_key: str
     script_path: str
     env_vars: dict
+    timeout: Optional[float] = None
+    weight: int = 1
+    # outputs: {files: [paths], results: [KEYS], reuse: bool}; inputs: [{step: name, path: dir}]
+    outputs: dict = field(default_factory=dict)
+    inputs: list = field(default_factory=list)
+    # caches: [name or {name, env, exclusive}] persistent tool caches beyond the built-ins
+    caches: list = field(default_factory=list)
+    # output_rules: [{pattern, severity, literal, ignore_case}] added to the plan-wide classifier rules
+    output_rules: list = field(default_factory=list)
+    # module:function run in a warm Python worker instead of script_path
+    entry_point: str = ''
+    # env_vars names whose values are redacted from logs and the review screen
+    secrets: list = field(default_factory=list)
+    # resources: {name: amount} named locks and rate limits held while the step runs
+    resources: dict = field(default_factory=dict)
+
+    @property
+    def command(self) -> str:
+        """What the step runs: its script path or its Python entry point."""
+        return self.script_path or self.entry_point
+
+    @property
+    def dependencies(self) -> set:
+        """Names of the steps this one takes inputs or ${step...} results from."""
+        names = {source.get('step') for source in self.inputs}
+        names.update(ref.arg for ref in zd_references(self.env_vars) if ref.kind == "step")
+        return names
+
+    def zd_display_env(self) -> dict:
+        """env_vars as shown to operators, with secret values redacted."""
+        return zd_display_env(self.env_vars, self.secrets)
     
     @classmethod
     def from_yaml(cls, file_path: Path, order: int) -> 'ZDStep':
@@ -28,17 +65,46 @@ class ZDStep:
                 aws_profile=data['aws_profile'],
                 repo_url=data['repo_url'],
                 ssh_key=data['ssh_key'],
-                script_path=data['script_path'],
-                env_vars=data.get('env_vars', {})
+                script_path=data.get('script_path', ''),
+                env_vars=data.get('env_vars', {}),
+                timeout=data.get('timeout'),
+                weight=data.get('weight', 1),
+                outputs=data.get('outputs') or {},
+                inputs=data.get('inputs') or [],
+                caches=data.get('caches') or [],
+                output_rules=data.get('output_rules') or [],
+                entry_point=data.get('entry_point', ''),
+                secrets=data.get('secrets') or [],
+                resources=data.get('resources') or {}
             )
 
+class ZDStepCache:
+    """Parsed step definitions keyed by path, invalidated when the file changes."""
+
+    def __init__(self):
+        self._steps: Dict[Path, Tuple[float, ZDStep]] = {}
+
+    def zd_load(self, file_path: Path, order: int) -> ZDStep:
+        """Return a fresh copy of the step at file_path, parsing only if it changed."""
+        file_path = Path(file_path).resolve()
+        mtime = file_path.stat().st_mtime
+        cached = self._steps.get(file_path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, ZDStep.from_yaml(file_path, 0))
+            self._steps[file_path] = cached
+        step = cached[1]
+        # Copies keep per-run order and env edits out of the cache
+        return replace(step, order=order, env_vars=dict(step.env_vars))
+
 class ZDManager:
     """Handles deployment configuration and management."""
 
-    def __init__(self):
+    def __init__(self, step_cache: Optional[ZDStepCache] = None):
         """Initialize with empty state."""
+        self.step_cache = step_cache
         self.steps: List[ZDStep] = []
         self._current_step: int = 0
+        self._listeners: List[Callable[[str, Optional[ZDStep]], None]] = []
         # Deployment validation segments
         self._segments = {
             "env": "TUM",      # These look like deployment
@@ -89,44 +155,78 @@ class ZDManager:
         b, v, valid = self._validate_deployment()
         return (v, valid)
 
+    def zd_subscribe(self, listener: Callable[[str, Optional[ZDStep]], None]) -> None:
+        """Call listener(event, step) on "add", "remove", "move", "reload" and "clear" (step None)."""
+        self._listeners.append(listener)
+
+    def _zd_notify(self, event: str, step: Optional[ZDStep]) -> None:
+        for listener in self._listeners:
+            listener(event, step)
+
     def zd_add_step(self, yaml_path: Path) -> None:
         """Add a ZenDeploy step from a YAML file."""
-        if any(step.file_path == yaml_path for step in self.steps):
+        # The step cache stores resolved paths, so compare resolved paths on both sides
+        resolved = Path(yaml_path).resolve()
+        if any(Path(step.file_path).resolve() == resolved for step in self.steps):
             raise ValueError(f"File {yaml_path} is already in ZenDeploy steps")
             
-        step = ZDStep.from_yaml(yaml_path, len(self.steps))
+        if self.step_cache:
+            step = self.step_cache.zd_load(yaml_path, len(self.steps))
+        else:
+            step = ZDStep.from_yaml(yaml_path, len(self.steps))
         self.steps.append(step)
+        self._zd_notify("add", step)
     
     def zd_remove_step(self, index: int) -> None:
         """Remove a step by index."""
         if 0 <= index < len(self.steps):
-            self.steps.pop(index)
+            removed = self.steps.pop(index)
             # Reorder remaining steps
             for i, step in enumerate(self.steps):
                 step.order = i
+            self._zd_notify("remove", removed)
 
     def zd_move_step(self, from_idx: int, to_idx: int) -> bool:
         """Move a step to a new position."""
         if 0 <= from_idx < len(self.steps) and 0 <= to_idx < len(self.steps):
-            step = self.steps.pop(from_idx)
-            self.steps.insert(to_idx, step)
+            moved = self.steps.pop(from_idx)
+            self.steps.insert(to_idx, moved)
             # Update order numbers
             for i, step in enumerate(self.steps):
                 step.order = i
+            self._zd_notify("move", moved)
             return True
         return False
 
+    def zd_reload_step(self, index: int) -> ZDStep:
+        """Parse a step's YAML file again, keeping its position in the plan."""
+        path = self.steps[index].file_path
+        if self.step_cache:
+            step = self.step_cache.zd_load(path, index)
+        else:
+            step = ZDStep.from_yaml(path, index)
+        self.steps[index] = step
+        self._zd_notify("reload", step)
+        return step
+
+    def zd_subset(self, orders) -> 'ZDManager':
+        """A manager over some of this plan's steps (same objects and orders), e.g. to re-run them."""
+        subset = ZDManager(self.step_cache)
+        subset.steps = [step for step in self.steps if step.order in orders]
+        return subset
+
     def zd_get_env_vars(self) -> dict:
-        """Get all environment variables from all steps."""
+        """Get all environment variables from all steps, with secret values redacted."""
         env_vars = {}
         for step in self.steps:
-            env_vars.update(step.env_vars)
+            env_vars.update(step.zd_display_env())
         return env_vars
 
     def zd_clear(self) -> None:
         """Clear all deployment steps and reset state."""
         self.steps = []
         self._current_step = 0
+        self._zd_notify("clear", None)
         gc.collect()
 
     def get_zd_status(self) -> dict:
@@ -141,7 +241,7 @@ class ZDManager:
         """Validate that all steps are properly configured."""
         try:
             for step in self.steps:
-                if not all([step.aws_profile, step.repo_url, step.script_path]):
+                if not all([step.aws_profile, step.repo_url, step.command]):
                     return False
             return True
         except Exception:
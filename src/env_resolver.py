@@ -0,0 +1,203 @@
+import asyncio
+import os
+import re
+import signal
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+# ${step.<name>.output.<KEY>}: a result an earlier step wrote to $ZD_OUTPUTS
+_STEP_REFERENCE = re.compile(r"^step\.(?P<step>.+)\.output\.(?P<key>[A-Za-z_][A-Za-z0-9_]*)$")
+SOURCES = ("env", "file", "cmd")
+
+class ZDInterpolationError(RuntimeError):
+    """Raised when an env_vars value is malformed or a reference in it can't be resolved."""
+
+@dataclass(frozen=True)
+class ZDReference:
+    """One ${...} reference: a session-wide source (env, file, cmd) or a step's result."""
+    kind: str
+    arg: str
+    key: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.kind == "step":
+            return f"${{step.{self.arg}.output.{self.key}}}"
+        return f"${{{self.kind}:{self.arg}}}"
+
+def zd_parse(value) -> List[Union[str, ZDReference]]:
+    """Split a value into literal text and references; $${ escapes a literal ${."""
+    if not isinstance(value, str) or "${" not in value:
+        return [value] if isinstance(value, str) else [str(value)]
+    parts: List[Union[str, ZDReference]] = []
+    text = []
+    i = 0
+    while i < len(value):
+        if value.startswith("$${", i):
+            text.append("${")
+            i += 3
+            continue
+        if not value.startswith("${", i):
+            text.append(value[i])
+            i += 1
+            continue
+        # Braces nest, so commands like ${cmd:awk '{print $1}' f} stay whole
+        depth, end = 1, i + 2
+        while end < len(value) and depth:
+            depth += {"{": 1, "}": -1}.get(value[end], 0)
+            end += 1
+        if depth:
+            raise ZDInterpolationError(f"Unterminated reference in {value!r}")
+        body = value[i + 2:end - 1]
+        if text:
+            parts.append("".join(text))
+            text = []
+        parts.append(zd_reference(body))
+        i = end
+    if text:
+        parts.append("".join(text))
+    return parts
+
+def zd_reference(body: str) -> ZDReference:
+    """Parse the text between ${ and }."""
+    match = _STEP_REFERENCE.match(body)
+    if match:
+        return ZDReference("step", match.group("step"), match.group("key"))
+    kind, _, arg = body.partition(":")
+    if kind not in SOURCES or not arg:
+        raise ZDInterpolationError(
+            f"Unknown reference ${{{body}}}; use env:, file:, cmd: or step.<name>.output.<KEY>"
+        )
+    return ZDReference(kind, arg)
+
+def zd_references(env_vars: dict) -> Set[ZDReference]:
+    """Every reference in a step's env_vars; malformed values are skipped (preflight reports them)."""
+    references = set()
+    for value in env_vars.values():
+        try:
+            references.update(part for part in zd_parse(value) if isinstance(part, ZDReference))
+        except ZDInterpolationError:
+            continue
+    return references
+
+class ZDEnvResolver:
+    """Resolves ${...} references in env_vars, sharing each value across steps and runs.
+
+    env, file and cmd references are resolved once and memoized for ttl
+    seconds (forever with ttl None); concurrent requests for the same
+    reference wait on a single lookup. Step results are never memoized: they
+    come from the current run's outputs.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self._memo: Dict[ZDReference, Tuple[float, str]] = {}
+        self._pending: Dict[ZDReference, asyncio.Task] = {}
+
+    @staticmethod
+    def zd_problems(env_vars) -> List[str]:
+        """Malformed references in a step's env_vars, for preflight."""
+        problems = []
+        for key, value in (env_vars or {}).items():
+            try:
+                zd_parse(value)
+            except ZDInterpolationError as e:
+                problems.append(f"{key}: {e}")
+        return problems
+
+    def zd_prefetch(self, steps) -> None:
+        """Start resolving every session-wide reference in the plan, concurrently."""
+        for step in steps:
+            for reference in zd_references(step.env_vars):
+                if reference.kind != "step":
+                    task = self._zd_lookup(reference)
+                    if task:
+                        # Failures are reported to the step that needs the value
+                        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def zd_resolve(self, env_vars: dict, step_outputs: Dict[str, tuple]) -> Dict[str, str]:
+        """The step's env_vars with every reference replaced by its value."""
+        parsed = {key: zd_parse(value) for key, value in env_vars.items()}
+        references = {part for parts in parsed.values() for part in parts if isinstance(part, ZDReference)}
+        values = dict(zip(references, await asyncio.gather(
+            *(self._zd_value(reference, step_outputs) for reference in references)
+        )))
+        return {
+            key: "".join(values[part] if isinstance(part, ZDReference) else part for part in parts)
+            for key, parts in parsed.items()
+        }
+
+    async def _zd_value(self, reference: ZDReference, step_outputs: Dict[str, tuple]) -> str:
+        if reference.kind == "step":
+            if reference.arg not in step_outputs:
+                raise ZDInterpolationError(f"{reference}: step '{reference.arg}' has no outputs in this run")
+            results = step_outputs[reference.arg][1]['results']
+            if reference.key not in results:
+                raise ZDInterpolationError(f"{reference}: step '{reference.arg}' wrote no {reference.key}")
+            return results[reference.key]
+        memoized = self._memo.get(reference)
+        if memoized and memoized[0] > time.monotonic():
+            return memoized[1]
+        return await asyncio.shield(self._zd_lookup(reference))
+
+    def _zd_lookup(self, reference: ZDReference) -> Optional[asyncio.Task]:
+        """The in-flight lookup of a reference, started if needed; None if a fresh value is memoized."""
+        memoized = self._memo.get(reference)
+        if memoized and memoized[0] > time.monotonic():
+            return None
+        if reference not in self._pending:
+            self._pending[reference] = asyncio.create_task(self._zd_fetch(reference))
+        return self._pending[reference]
+
+    async def _zd_fetch(self, reference: ZDReference) -> str:
+        started = time.monotonic()
+        try:
+            if reference.kind == "env":
+                if reference.arg not in os.environ:
+                    raise ZDInterpolationError(f"{reference}: not set in ZenDeploy's environment")
+                value = os.environ[reference.arg]
+            elif reference.kind == "file":
+                try:
+                    value = await asyncio.to_thread(Path(reference.arg).expanduser().read_text)
+                except OSError as e:
+                    raise ZDInterpolationError(f"{reference}: {e}") from e
+                value = value.rstrip("\n")
+            else:
+                value = await self._zd_command(reference)
+            ttl = self.config.interpolation_ttl
+            self._memo[reference] = (float("inf") if ttl is None else time.monotonic() + ttl, value)
+            await self.audit_logger.zd_log_action(
+                "env_resolved", f"{reference.kind}:{reference.arg} in {time.monotonic() - started:.2f}s"
+            )
+            return value
+        finally:
+            del self._pending[reference]
+
+    async def _zd_command(self, reference: ZDReference) -> str:
+        process = await asyncio.create_subprocess_shell(
+            reference.arg,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.config.interpolation_cmd_timeout)
+        except asyncio.TimeoutError:
+            # The whole group: a child still holding the pipes would keep wait() from returning
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            raise ZDInterpolationError(f"{reference}: timed out after {self.config.interpolation_cmd_timeout:g}s")
+        if process.returncode != 0:
+            error = stderr.decode(errors="replace").strip().splitlines()
+            raise ZDInterpolationError(
+                f"{reference}: exit code {process.returncode}{': ' + error[-1] if error else ''}"
+            )
+        return stdout.decode(errors="replace").rstrip("\n")
@@ -0,0 +1,174 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, List, Optional, Tuple
+
+# What a subscription does with an event that arrives while its queue is full
+BLOCK = "block"              # The publisher waits for room: lossless, for consumers that must see everything
+DROP_OLDEST = "drop_oldest"  # The oldest queued event is discarded and counted
+COALESCE = "coalesce"        # The event is merged into the queued one with the same key
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+# Step states the executor reports with ZDStatus; "failed" with no step is a failed preflight
+STATES = ("waiting", "running", "succeeded", "failed")
+
+class ZDStatus(tuple):
+    """A (formatted, raw) output that also reports its step's new state.
+
+    Consumers take state from here, never from the text, which scripts can imitate.
+    """
+
+    def __new__(cls, formatted: str, raw: str, state: str):
+        output = super().__new__(cls, (formatted, raw))
+        output.state = state
+        return output
+
+@dataclass
+class ZDOutputEvent:
+    """A piece of executor output and the step that produced it (None for run-level output).
+
+    states lists the state changes the output reports, oldest first.
+    """
+    step: Any
+    formatted: str
+    raw: str
+    states: Tuple[str, ...] = ()
+
+    @property
+    def key(self) -> Optional[int]:
+        return self.step.order if self.step is not None else None
+
+    def zd_merge(self, later: 'ZDOutputEvent') -> 'ZDOutputEvent':
+        return ZDOutputEvent(self.step, self.formatted + later.formatted, self.raw + later.raw,
+                             self.states + later.states)
+
+class ZDSubscription:
+    """One consumer's bounded queue on an event bus; iterate it to receive events.
+
+    Iteration ends once the bus is closed and the queue is drained, or as soon
+    as the consumer unsubscribes. Coalescing needs events with a key and
+    zd_merge (ZDOutputEvent); a key with nothing queued still gets an entry,
+    so the queue never holds more than maxsize plus the number of keys.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1000, policy: str = BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}'; use one of {', '.join(POLICIES)}")
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak = 0
+        self._events: Deque = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    async def zd_put(self, event) -> None:
+        """Queue an event, waiting for room if the policy is block."""
+        while self.policy == BLOCK and len(self._events) >= self.maxsize and not self._closed:
+            self._writable.clear()
+            await self._writable.wait()
+        self.zd_put_nowait(event)
+
+    def zd_put_nowait(self, event) -> None:
+        """Queue an event without waiting; raises asyncio.QueueFull for a full blocking subscription."""
+        if self._closed:
+            return
+        if len(self._events) >= self.maxsize:
+            if self.policy == BLOCK:
+                raise asyncio.QueueFull(self.name)
+            if self.policy == DROP_OLDEST:
+                self._events.popleft()
+                self.dropped += 1
+            elif self._zd_coalesce(event):
+                return
+        self._events.append(event)
+        self.peak = max(self.peak, len(self._events))
+        self._readable.set()
+
+    def zd_close(self, discard: bool = False) -> None:
+        """Stop accepting events; queued ones are still delivered unless discarded."""
+        self._closed = True
+        if discard:
+            self._events.clear()
+        self._readable.set()
+        self._writable.set()
+
+    def _zd_coalesce(self, event) -> bool:
+        # The newest queued event of the same key, so each key's events stay in order
+        for index in range(len(self._events) - 1, -1, -1):
+            if self._events[index].key == event.key:
+                self._events[index] = self._events[index].zd_merge(event)
+                self.coalesced += 1
+                return True
+        return False
+
+    def __aiter__(self) -> 'ZDSubscription':
+        return self
+
+    async def __anext__(self):
+        while not self._events:
+            if self._closed:
+                raise StopAsyncIteration
+            self._readable.clear()
+            await self._readable.wait()
+        event = self._events.popleft()
+        self._writable.set()
+        return event
+
+class ZDEventBus:
+    """Fans events out from one producer to any number of subscriptions.
+
+    Each subscription has its own bounded queue and overflow policy, so only
+    blocking subscribers (such as the output file logger) can hold up the
+    producer; a slow screen or remote viewer loses or merges events instead.
+    Subscribers only see events published after they subscribe.
+    """
+
+    def __init__(self):
+        self._subscriptions: List[ZDSubscription] = []
+        self.closed = False
+
+    @property
+    def subscriptions(self) -> Tuple[ZDSubscription, ...]:
+        return tuple(self._subscriptions)
+
+    def zd_subscribe(self, name: str, maxsize: int = 1000, policy: str = BLOCK) -> ZDSubscription:
+        """Add a consumer; on a closed bus the subscription is already finished."""
+        subscription = ZDSubscription(name, maxsize, policy)
+        if self.closed:
+            subscription.zd_close()
+        else:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def zd_unsubscribe(self, subscription: ZDSubscription) -> None:
+        """Remove a consumer, discarding what it had not read yet."""
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        subscription.zd_close(discard=True)
+
+    async def zd_publish(self, event) -> None:
+        """Deliver an event to every subscription, waiting only on full blocking ones."""
+        for subscription in list(self._subscriptions):
+            if subscription.policy == BLOCK:
+                await subscription.zd_put(event)
+            else:
+                subscription.zd_put_nowait(event)
+
+    def zd_publish_nowait(self, event) -> None:
+        """Deliver an event without waiting; for buses without blocking subscribers."""
+        for subscription in list(self._subscriptions):
+            subscription.zd_put_nowait(event)
+
+    def zd_close(self) -> None:
+        """End the stream: subscribers finish once they have read what is queued."""
+        self.closed = True
+        for subscription in self._subscriptions:
+            subscription.zd_close()
@@ -0,0 +1,81 @@
+import asyncio
+import codecs
+import re
+from typing import AsyncGenerator, List
+
+_LINE_BREAK = re.compile(r"\r\n|\n|\r")
+
+class ZDLineReader:
+    """Split a subprocess byte stream into lines with bounded memory.
+
+    Reads large chunks instead of relying on StreamReader.readline (whose 64 KiB
+    limit aborts on long lines), decodes incrementally with errors replaced,
+    truncates lines beyond max_line_length, and collapses carriage-return
+    redraws (progress bars) so only the final state of a line is kept.
+    """
+
+    def __init__(self, stream: asyncio.StreamReader, chunk_size: int = 65536,
+                 max_line_length: int = 16384):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_line_length = max_line_length
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._line = ""
+        self._dropped = 0
+        self._carry = ""
+
+    async def zd_batches(self) -> AsyncGenerator[List[str], None]:
+        """Yield the complete lines decoded from each chunk read."""
+        while True:
+            chunk = await self.stream.read(self.chunk_size)
+            if not chunk:
+                break
+            lines = self._zd_feed(self._decoder.decode(chunk))
+            if lines:
+                yield lines
+
+        lines = self._zd_feed(self._decoder.decode(b"", final=True))
+        # A trailing carriage return at EOF is a plain line end
+        if self._carry or self._line or self._dropped:
+            self._carry = ""
+            lines.append(self._zd_take_line())
+        if lines:
+            yield lines
+
+    def _zd_feed(self, text: str) -> List[str]:
+        text = self._carry + text
+        self._carry = ""
+        # A trailing \r may be the first half of \r\n; wait for the next chunk
+        if text.endswith("\r"):
+            self._carry = "\r"
+            text = text[:-1]
+
+        lines = []
+        pos = 0
+        for match in _LINE_BREAK.finditer(text):
+            self._zd_append(text[pos:match.start()])
+            pos = match.end()
+            if match.group() == "\r":
+                # Redraw: the terminal would overwrite this line, so drop it
+                self._line = ""
+                self._dropped = 0
+            else:
+                lines.append(self._zd_take_line())
+        self._zd_append(text[pos:])
+        return lines
+
+    def _zd_append(self, text: str) -> None:
+        room = self.max_line_length - len(self._line)
+        if len(text) <= room:
+            self._line += text
+        else:
+            self._line += text[:max(room, 0)]
+            self._dropped += len(text) - max(room, 0)
+
+    def _zd_take_line(self) -> str:
+        line = self._line.rstrip()
+        if self._dropped:
+            line += f" ...[truncated {self._dropped} chars]"
+        self._line = ""
+        self._dropped = 0
+        return line
@@ -1,17 +1,38 @@
 from textual.app import App
-from textual.widgets import Header, Footer, Static, DirectoryTree, DataTable, Button, RichLog, Label
+from textual.widgets import Header, Footer, Static, DirectoryTree, DataTable, Button, RichLog, Label, Input
 from textual.containers import Container, Horizontal, Vertical
 from textual.screen import Screen
 from textual.binding import Binding
 from textual.message import Message
 from textual.app import ComposeResult
 from pathlib import Path
+from typing import Dict, Optional
 import yaml
 import time
 from deployment_manager import ZDManager
 from deployment_executor import ZDExecutor
+from event_bus import COALESCE
+from step_channels import ZDStepChannels, zd_format_bytes
 from audit_logger import ZDLogger
+from audit_sink import ZDAuditShipper
+from zd_config import ZDConfig
+from zd_daemon import ZDDaemonClient
+from output_store import ZDOutputReader
+from workspace_pool import ZDWorkspacePool
+from ssh_transport import ZDSSHTransport
+from python_pool import ZDPythonPool
+from env_resolver import ZDEnvResolver
+from aws_credentials import ZDCredentialBroker
+from resource_limits import ZDResourceLimits
+from repo_cache import ZDRepoCache
+from repo_prefetch import ZDPrefetcher
+from yaml_preview import ZDYamlPreview
+from run_history import ZDRunHistory, zd_format_duration
+from session_recording import ZDSessionReplay
+from watch_mode import ZDWatcher, zd_affected_steps
+import argparse
 import asyncio
+import re
 from zd_base import BaseScreen
 from splash_screen import ZDSplashScreen
 from rich.text import Text
@@ -54,6 +75,8 @@ class ReviewScreen(BaseScreen):
     def __init__(self, manager=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.zd_manager = manager
+        # Row key -> order shown, so only renumbered rows are touched on changes
+        self._row_orders: Dict[str, int] = {}
 
     def compose(self) -> ComposeResult:
         """Create child widgets for the review screen."""
@@ -66,66 +89,106 @@ class ReviewScreen(BaseScreen):
                 Horizontal(
                     Vertical(
                         Static("Deployment Preview", id="preview-title"),
-                        Container(id="preview-list", classes="scrollable"),
+                        DataTable(id="preview-table", cursor_type="row"),
                         id="preview-pane"
                     ),
                     Vertical(
                         Static("Environment Variables", id="env-title"),
-                        Container(id="env-list", classes="scrollable"),
+                        DataTable(id="env-table", show_cursor=False),
                         id="env-pane"
                     ),
                     id="top-panes"
                 ),
                 id="top-section"
             ),
+            Static("", id="prefetch-status"),
             id="review-container"
         )
 
+    def _zd_update_prefetch_status(self) -> None:
+        """Show background prefetch progress for the plan's repositories."""
+        if self.app.prefetcher:
+            self.query_one("#prefetch-status").update(self.app.prefetcher.zd_summary())
+
     def on_mount(self) -> None:
-        """Populate the review screen with deployment information."""
-        preview_container = self.query_one("#preview-list")
-        env_container = self.query_one("#env-list")
-        
-        # Clear existing content
-        preview_container.remove_children()
-        env_container.remove_children()
-        
-        # Get fresh state from app's deployment manager
-        steps = self.app.zd_manager.steps
-        
-        if steps:
-            # Create deployment preview in left pane
-            preview_container.mount(Static("Deployment Steps Summary:", classes="preview-header"))
-            preview_container.mount(Static("-" * 40, classes="preview-separator"))
-            
-            for i, step in enumerate(steps, 1):
-                preview_container.mount(Static(f"Step {i}: {step.name}", classes="preview-step"))
-                preview_container.mount(Static(f"  File: {step.file_path}", classes="preview-detail"))
-                preview_container.mount(Static(f"  Script: {step.script_path}", classes="preview-detail"))
-                preview_container.mount(Static("", classes="preview-spacer"))
-
-            # Populate environment variables in right pane
-            for step in steps:
-                env_container.mount(Static(f"[bold]{step.name}:[/bold]", classes="env-header"))
-                
-                # Add all attributes except file_path and order
-                env_vars = {
-                    "AWS Profile": step.aws_profile,
-                    "Repository": step.repo_url,
-                    "SSH Key": step.ssh_key,
-                    "Script": step.script_path,
-                }
-                for key, value in env_vars.items():
-                    env_container.mount(Static(f"  {key}: {value}", classes="env-item"))
-                
-                # Add environment variables from the step
-                if step.env_vars:
-                    env_container.mount(Static("  Environment Variables:", classes="env-subheader"))
-                    for key, value in step.env_vars.items():
-                        env_container.mount(Static(f"    {key}: {value}", classes="env-item"))
-        else:
-            preview_container.mount(Static("No steps to preview"))
-            env_container.mount(Static("No deployment steps found"))
+        """Build the review tables once and keep them in sync with the plan."""
+        self._zd_update_prefetch_status()
+        self.set_interval(0.5, self._zd_update_prefetch_status)
+
+        # DataTable only renders visible rows, so large plans stay cheap
+        preview = self.query_one("#preview-table", DataTable)
+        preview.add_column("#", key="order", width=5)
+        preview.add_column("Step", key="name")
+        preview.add_column("File", key="file")
+        preview.add_column("Script", key="script")
+        details = self.query_one("#env-table", DataTable)
+        details.add_column("Key", key="key", width=24)
+        details.add_column("Value", key="value")
+
+        for step in self.zd_manager.steps:
+            self._zd_add_row(step)
+        self.zd_manager.zd_subscribe(self._zd_on_plan_changed)
+        self._zd_show_details()
+
+    def _zd_add_row(self, step) -> None:
+        key = str(step.file_path)
+        self._row_orders[key] = step.order
+        self.query_one("#preview-table", DataTable).add_row(
+            step.order + 1, step.name, str(step.file_path), step.command, key=key
+        )
+
+    def _zd_on_plan_changed(self, event: str, step) -> None:
+        """Apply a single plan change to the tables instead of rebuilding them."""
+        preview = self.query_one("#preview-table", DataTable)
+        if event == "clear":
+            preview.clear()
+            self._row_orders.clear()
+        elif event == "add":
+            self._zd_add_row(step)
+        elif event == "remove":
+            key = str(step.file_path)
+            preview.remove_row(key)
+            self._row_orders.pop(key, None)
+        elif event == "reload":
+            key = str(step.file_path)
+            preview.update_cell(key, "name", step.name)
+            preview.update_cell(key, "script", step.command)
+
+        renumbered = False
+        for current in self.zd_manager.steps:
+            key = str(current.file_path)
+            if self._row_orders.get(key) != current.order:
+                self._row_orders[key] = current.order
+                preview.update_cell(key, "order", current.order + 1)
+                renumbered = True
+        if event == "move" and renumbered:
+            preview.sort("order")
+        self._zd_show_details()
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        if event.data_table.id == "preview-table":
+            self._zd_show_details()
+
+    def _zd_show_details(self) -> None:
+        """Show the attributes and environment of the highlighted step."""
+        details = self.query_one("#env-table", DataTable)
+        details.clear()
+        steps = self.zd_manager.steps
+        if not steps:
+            details.add_row("No deployment steps found", "")
+            return
+
+        cursor_row = self.query_one("#preview-table", DataTable).cursor_row
+        step = steps[min(max(cursor_row, 0), len(steps) - 1)]
+        details.add_row(Text(step.name, style="bold"), "")
+        details.add_row("AWS Profile", step.aws_profile)
+        details.add_row("Repository", step.repo_url)
+        details.add_row("SSH Key", step.ssh_key)
+        details.add_row("Script", step.command)
+        if step.env_vars:
+            details.add_row("Environment Variables:", "")
+            for key, value in step.zd_display_env().items():
+                details.add_row(f"  {key}", str(value))
 
     async def action_pop_screen(self) -> None:
         """Handle escape key."""
@@ -148,9 +211,37 @@ class ZDProgressScreen(BaseScreen):
         Binding("escape", "pop_screen", "Back", show=True),
     ]
 
+    # Browsing the on-disk output store
+    BINDINGS = BaseScreen.BINDINGS + [
+        Binding("ctrl+f", "search_output", "Search", show=True),
+        Binding("ctrl+b", "page_output(-1)", "Older", show=False),
+        Binding("ctrl+n", "page_output(1)", "Newer", show=False),
+        Binding("ctrl+l", "follow_output", "Live", show=True),
+        Binding("ctrl+w", "toggle_watch", "Watch", show=True),
+    ]
+
+    # Upper bound on lines listed for one search
+    MAX_SEARCH_RESULTS = 1000
+
     def __init__(self, manager=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.zd_manager = manager
+        self.executor = None
+        self.daemon_job: Optional[str] = None
+        self.daemon_status: Optional[str] = None
+        # Output browsing state; None means the raw pane follows live output
+        self._browse_step: Optional[int] = None
+        self._browse_line = 0
+        self._reader: Optional[ZDOutputReader] = None
+        self._active_step = None
+        # Per-step output; only the focused channel is rendered in full. Until a row
+        # is selected, focus follows the most recently started step.
+        self._channels: Optional[ZDStepChannels] = None
+        self._focus_key: Optional[int] = None
+        self._focus_pinned = False
+        # Watch mode waits for the current run before re-running changed steps
+        self._run_done = asyncio.Event()
+        self._watch_worker = None
 
     def compose(self) -> ComposeResult:
         """Create child widgets for the progress screen."""
@@ -165,6 +256,7 @@ class ZDProgressScreen(BaseScreen):
                 Static("", id="status", classes="status-text"),
                 id="status-section"
             ),
+            DataTable(id="step-grid", cursor_type="row"),
             Horizontal(
                 Vertical(
                     Static("Formatted Output:", id="formatted-title"),
@@ -177,19 +269,28 @@ class ZDProgressScreen(BaseScreen):
                 Vertical(
                     Static("Raw Output:", id="raw-title"),
                     Container(
-                        RichLog(id="raw-log"),
+                        RichLog(id="raw-log", max_lines=self.app.zd_config.output_tail_lines),
                         id="raw-container"
                     ),
                     id="raw-log-section"
                 ),
                 id="log-section"
             ),
+            Input(placeholder="Search output (regex), Enter to run", id="output-search"),
             Static("", id="progress-bar"),
             id="zd-container"
         )
 
     def on_mount(self) -> None:
         """Start the deployment process when the screen is mounted."""
+        self.query_one("#output-search").styles.display = "none"
+        grid = self.query_one("#step-grid", DataTable)
+        grid.add_column("#", key="order", width=4)
+        grid.add_column("Step", key="name")
+        grid.add_column("State", key="state", width=10)
+        grid.add_column("Elapsed", key="elapsed", width=9)
+        grid.add_column("Output", key="bytes", width=9)
+        grid.add_column("Last line", key="last_line")
         self.run_worker(self.start_deployment())
 
     async def start_deployment(self) -> None:
@@ -197,46 +298,79 @@ class ZDProgressScreen(BaseScreen):
         formatted_log = self.query_one("#formatted-log")
         raw_log = self.query_one("#raw-log")
         status = self.query_one("#status")
-        current_step = self.query_one("#current-step")
         progress = self.query_one("#progress-bar")
 
         try:
-            if self.app.zd_manager.steps:
-                total_steps = len(self.app.zd_manager.steps)
+            replay = self.app.replay
+            if self.app.zd_manager.steps or replay:
+                total_steps = len(replay.steps if replay else self.app.zd_manager.steps)
                 success = True  # Track overall success
-                
-                for i, step in enumerate(self.app.zd_manager.steps, 1):
-                    progress_pct = (i / total_steps) * 100
-                    progress.update(f"[progress.bar]{progress_pct:.0f}%")
-                    current_step.update(f"Processing step {i} of {total_steps}: [bold]{step.name}[/bold]")
-                    
-                    try:
-                        executor = ZDExecutor(self.app.zd_manager, self.app.audit_logger)
-                        if not await executor.zd_prepare():
-                            success = False
-                            formatted_log.write("[red]Failed to prepare deployment environment[/red]\n")
-                            status.update("[bold red]ZenDeploy preparation failed[/bold red]")
-                            return
-
-                        async for formatted_output, raw_output in executor.zd_execute():
-                            formatted_log.write(formatted_output)
-                            raw_log.write(raw_output)
-                            if "failed" in raw_output.lower():
-                                success = False
-
-                    except Exception as step_error:
-                        success = False
-                        formatted_log.write(f"[red]✗ Step {i} failed: {str(step_error)}[/red]\n")
-                        raw_log.write(f"ERROR: Step {i} failed: {str(step_error)}\n")
-                        status.update(f"[bold red]ZenDeploy failed at step {i}[/bold red]")
+
+                client = None if replay else await self._zd_daemon_client()
+                if replay:
+                    stream = replay.zd_replay(self.app.replay_speed)
+                elif client:
+                    stream = self._zd_daemon_output(client)
+                else:
+                    # A single executor runs the whole plan so it can be cancelled as one
+                    self.executor = ZDExecutor(
+                        self.app.zd_manager, self.app.audit_logger, self.app.zd_config,
+                        repo_cache=self.app.repo_cache,
+                        workspace_pool=self.app.workspace_pool,
+                        ssh_transport=self.app.ssh_transport,
+                        history=self.app.run_history,
+                        python_pool=self.app.python_pool,
+                        env_resolver=self.app.env_resolver,
+                        credential_broker=self.app.credential_broker,
+                        resource_limits=self.app.resource_limits
+                    )
+                    if not await self.executor.zd_prepare():
+                        formatted_log.write("[red]Failed to prepare deployment environment[/red]\n")
+                        status.update("[bold red]ZenDeploy preparation failed[/bold red]")
                         return
+                    stream = self._zd_local_output()
+
+                self._active_step = None
+                self._zd_setup_channels(replay.steps if replay else self.app.zd_manager.steps)
+                # With run history the progress bar tracks expected time rather than step count
+                eta_timer = self.set_interval(1.0, self._zd_update_eta)
+                # Summary rows of steps that aren't focused are redrawn at this rate, however busy
+                grid_timer = self.set_interval(self.app.zd_config.progress_refresh, self._zd_refresh_grid)
+                try:
+                    async for step, formatted_output, raw_output, states in stream:
+                        if not self._zd_show_output(step, formatted_output, raw_output, states, total_steps):
+                            success = False
+
+                except Exception as step_error:
+                    active_step = self._active_step
+                    i = active_step.order + 1 if active_step else 1
+                    formatted_log.write(f"[red]✗ Step {i} failed: {str(step_error)}[/red]\n")
+                    raw_log.write(f"ERROR: Step {i} failed: {str(step_error)}\n")
+                    status.update(f"[bold red]ZenDeploy failed at step {i}[/bold red]")
+                    return
+                finally:
+                    eta_timer.stop()
+                    grid_timer.stop()
+                    self._channels.zd_finish()
+                    self._zd_refresh_grid()
+
+                if replay:
+                    rate = replay.events / replay.elapsed if replay.elapsed else 0
+                    summary = f"Replayed {replay.events} events in {replay.elapsed:.2f}s ({rate:.0f} events/s)"
+                    formatted_log.write(f"[bold]{summary}[/bold]\n")
+                    await self.app.zd_save_log("replay_finished", f"{replay.path}: {summary}")
 
                 # Final status update based on overall success
-                if success:
+                if self.executor and self.executor.cancelled:
+                    status.update(f"[bold red]ZenDeploy cancelled: {self.executor.cancel_reason}[/bold red]")
+                elif self.daemon_job and self.daemon_status != "succeeded":
+                    status.update(f"[bold red]ZenDeploy job {self.daemon_job} {self.daemon_status}[/bold red]")
+                elif success:
                     status.update("[bold green]ZenDeploy completed successfully![/bold green]")
+                    progress.update("[progress.bar]100%")
                 else:
                     status.update("[bold red]ZenDeploy completed with errors![/bold red]")
-                progress.update("[progress.bar]100%")
+                    progress.update("[progress.bar]100%")
             else:
                 status.update("[bold red]No steps found![/bold red]")
                 formatted_log.write("[red]Error: No steps to process[/red]\n")
@@ -246,9 +380,353 @@ class ZDProgressScreen(BaseScreen):
             status.update(f"[bold red]ZenDeploy failed: {str(e)}[/bold red]")
             formatted_log.write(f"[red]Error: {str(e)}[/red]\n")
             raw_log.write(f"Error: {str(e)}\n")
+        finally:
+            self._run_done.set()
+
+    def _zd_setup_channels(self, steps) -> None:
+        """One channel and grid row per step, plus the run-level channel, focused until a step starts."""
+        self._channels = ZDStepChannels(steps, self.app.zd_config.output_tail_lines)
+        grid = self.query_one("#step-grid", DataTable)
+        grid.clear()
+        for channel in self._channels.channels.values():
+            self._zd_add_grid_row(grid, channel)
+        self._zd_focus(None)
+
+    def _zd_add_grid_row(self, grid: DataTable, channel) -> None:
+        grid.add_row(
+            "" if channel.key is None else channel.key + 1, channel.name, channel.state, "", "", "",
+            key=self._zd_row_key(channel.key)
+        )
+
+    @staticmethod
+    def _zd_row_key(key: Optional[int]) -> str:
+        return "run" if key is None else str(key)
+
+    def _zd_refresh_grid(self) -> None:
+        """Redraw the summary rows that changed since the last refresh."""
+        if not self._channels:
+            return
+        grid = self.query_one("#step-grid", DataTable)
+        colors = {"waiting": "magenta", "running": "yellow", "succeeded": "green", "failed": "red", "stopped": "red"}
+        for channel in self._channels.zd_changed():
+            row = self._zd_row_key(channel.key)
+            if row not in grid.rows:
+                # A step the plan didn't list up front, e.g. from an older recording
+                self._zd_add_grid_row(grid, channel)
+            elapsed = channel.zd_elapsed()
+            grid.update_cell(row, "state", Text(channel.state, style=colors.get(channel.state, "")))
+            grid.update_cell(row, "elapsed", zd_format_duration(elapsed) if elapsed is not None else "")
+            grid.update_cell(row, "bytes", zd_format_bytes(channel.bytes) if channel.bytes else "")
+            grid.update_cell(row, "last_line", Text(channel.last_line[:200]))
+
+    def _zd_focus(self, key: Optional[int]) -> None:
+        """Show a channel in the detail panes, replaying its buffered output."""
+        self._focus_key = key
+        channel = self._channels.channels[key]
+        formatted_log = self.query_one("#formatted-log")
+        formatted_log.clear()
+        for output in channel.formatted:
+            formatted_log.write(output)
+        label = "run" if key is None else f"step {key + 1}: {channel.name}"
+        self.query_one("#formatted-title").update(f"Formatted Output ({label}):")
+        if self._browse_step is None:
+            raw_log = self.query_one("#raw-log")
+            raw_log.clear()
+            for output in channel.raw:
+                raw_log.write(output)
+
+    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+        """Focus the selected step's output; ^l returns to following the running steps."""
+        if event.data_table.id != "step-grid" or not self._channels:
+            return
+        key = None if event.row_key.value == "run" else int(event.row_key.value)
+        self._focus_pinned = True
+        if key != self._focus_key:
+            self._zd_focus(key)
+
+    def _zd_show_output(self, step, formatted_output: str, raw_output: str, states, total_steps: int) -> bool:
+        """Route one output to its step's channel, rendering it only if focused; False if it reports a failure."""
+        channel, started = self._channels.zd_route(step, formatted_output, raw_output, states)
+        if started:
+            self._active_step = step
+            i = step.order + 1
+            if not self._zd_update_eta():
+                progress_pct = (i / total_steps) * 100
+                self.query_one("#progress-bar").update(f"[progress.bar]{progress_pct:.0f}%")
+            self.query_one("#current-step").update(
+                f"Processing step {i} of {total_steps}: [bold]{step.name}[/bold]"
+            )
+
+        if not self._focus_pinned and channel.key != self._focus_key:
+            focused = self._channels.channels[self._focus_key]
+            # Follow each step as it starts, and the run-level output once the followed step is done
+            if started or (channel.key is None and focused.state not in ("running", "waiting", "pending")):
+                # The channel's tail already includes this output
+                self._zd_focus(channel.key)
+        elif channel.key == self._focus_key:
+            self.query_one("#formatted-log").write(formatted_output)
+            if self._browse_step is None:
+                self.query_one("#raw-log").write(raw_output)
+        return "failed" not in states
+
+    async def action_toggle_watch(self) -> None:
+        """Start or stop re-running steps when their files or repositories change."""
+        if self._watch_worker:
+            self._watch_worker.cancel()
+            self._watch_worker = None
+            self.app.notify_info("Watch mode off")
+            return
+        if self.app.replay or self.daemon_job:
+            self.app.notify_warning("Watch mode needs a deployment run by this session")
+            return
+        self._watch_worker = self.run_worker(self._zd_watch(), group="watch", exclusive=True)
+
+    async def _zd_watch(self) -> None:
+        """Re-run changed steps and the steps depending on them until watch mode is turned off."""
+        await self._run_done.wait()
+        manager = self.app.zd_manager
+        formatted_log = self.query_one("#formatted-log")
+        status = self.query_one("#status")
+        watcher = ZDWatcher(self.app.zd_config, self.app.audit_logger,
+                            self.app.repo_cache, self.app.ssh_transport)
+        await watcher.zd_start(manager.steps)
+        watching = (f"[bold yellow]Watching {len(manager.steps)} steps for changes "
+                    f"({'polling' if watcher.polling else 'inotify'}, ^w to stop)[/bold yellow]")
+        status.update(watching)
+        await self.app.zd_save_log("watch_start", f"{len(manager.steps)} steps")
+        try:
+            async for changed in watcher.zd_changes():
+                for order in sorted(changed):
+                    try:
+                        manager.zd_reload_step(order)
+                    except Exception as e:
+                        # Keep the last good definition and leave the step out until it parses
+                        changed.discard(order)
+                        formatted_log.write(f"[red]✗ Cannot reload {manager.steps[order].file_path}: {e}[/red]\n")
+                await watcher.zd_update(manager.steps)
+                steps = zd_affected_steps(manager.steps, changed)
+                if not steps:
+                    continue
+                formatted_log.write(
+                    f"\n[bold yellow]Change detected; re-running {', '.join(step.name for step in steps)}[/bold yellow]\n"
+                )
+                if await self._zd_rerun(steps):
+                    status.update(watching)
+                else:
+                    status.update("[bold red]Re-run failed; still watching (^w to stop)[/bold red]")
+        finally:
+            watcher.zd_close()
+            await self.app.zd_save_log("watch_stop", "")
+
+    async def _zd_rerun(self, steps) -> bool:
+        """Run some steps of the plan again, reusing earlier outputs of the others; True on success."""
+        manager = self.app.zd_manager
+        prior_outputs = self.executor.step_outputs if self.executor else {}
+        self.executor = ZDExecutor(
+            manager.zd_subset({step.order for step in steps}), self.app.audit_logger, self.app.zd_config,
+            repo_cache=self.app.repo_cache,
+            workspace_pool=self.app.workspace_pool,
+            ssh_transport=self.app.ssh_transport,
+            history=self.app.run_history,
+            prior_outputs=prior_outputs,
+            python_pool=self.app.python_pool,
+            env_resolver=self.app.env_resolver,
+            credential_broker=self.app.credential_broker,
+            resource_limits=self.app.resource_limits
+        )
+        if not await self.executor.zd_prepare():
+            self.query_one("#formatted-log").write("[red]Failed to prepare deployment environment[/red]\n")
+            return False
+        success = True
+        self._active_step = None
+        self._run_done.clear()
+        if self._channels is None:
+            self._zd_setup_channels(manager.steps)
+        grid_timer = self.set_interval(self.app.zd_config.progress_refresh, self._zd_refresh_grid)
+        try:
+            async for step, formatted_output, raw_output, states in self._zd_local_output():
+                if not self._zd_show_output(step, formatted_output, raw_output, states, len(manager.steps)):
+                    success = False
+        except Exception as e:
+            self.query_one("#formatted-log").write(f"[red]✗ Re-run failed: {e}[/red]\n")
+            success = False
+        finally:
+            grid_timer.stop()
+            self._zd_refresh_grid()
+            self._run_done.set()
+        return success and not self.executor.cancelled
+
+    def _zd_update_eta(self) -> bool:
+        """Show history-based progress and time remaining; False when no estimate exists."""
+        eta = self.executor.zd_eta() if self.executor else None
+        if eta is None:
+            return False
+        fraction, remaining = eta
+        self.query_one("#progress-bar").update(
+            f"[progress.bar]{fraction * 100:.0f}%  ETA {zd_format_duration(remaining)}"
+        )
+        return True
+
+    def _zd_output_reader(self, step_order: int) -> Optional[ZDOutputReader]:
+        """Return a refreshed reader over a step's stored output."""
+        store = self.executor.output_store if self.executor else None
+        if not store or step_order not in store.segments:
+            return None
+        if self._reader is None or self._reader.data_path != store.segments[step_order].data_path:
+            if self._reader:
+                self._reader.zd_close()
+            self._reader = store.segments[step_order].zd_reader()
+        else:
+            store.segments[step_order].zd_flush()
+            self._reader.zd_refresh()
+        return self._reader
+
+    def _zd_show_page(self, reader: ZDOutputReader, step_order: int) -> None:
+        """Render one page of stored output into the raw pane."""
+        raw_log = self.query_one("#raw-log")
+        page_size = max(10, raw_log.size.height)
+        self._browse_line = max(0, min(self._browse_line, reader.line_count - page_size))
+        raw_log.clear()
+        for line in reader.zd_lines(self._browse_line, page_size):
+            raw_log.write(line)
+        last_line = min(reader.line_count, self._browse_line + page_size)
+        self.query_one("#raw-title").update(
+            f"Raw Output (step {step_order + 1}, lines {self._browse_line + 1}-{last_line} "
+            f"of {reader.line_count}):"
+        )
+
+    def action_page_output(self, direction: int) -> None:
+        """Page through the focused (or else the current) step's stored output."""
+        step = self.executor.current_step if self.executor else None
+        step_order = self._browse_step
+        if step_order is None:
+            step_order = self._focus_key if self._focus_key is not None else (step.order if step else None)
+        reader = self._zd_output_reader(step_order) if step_order is not None else None
+        if reader is None:
+            self.app.notify_warning("No stored output to browse for this deployment")
+            return
+
+        page_size = max(10, self.query_one("#raw-log").size.height)
+        if self._browse_step is None:
+            # Entering browse mode starts from the last page
+            self._browse_step = step_order
+            self._browse_line = reader.line_count
+        self._browse_line += direction * page_size
+        self._zd_show_page(reader, step_order)
+
+    def action_follow_output(self) -> None:
+        """Return to live output, following the most recently started step again."""
+        self._browse_step = None
+        self._focus_pinned = False
+        self.query_one("#raw-title").update("Raw Output:")
+        if self._channels:
+            self._zd_focus(self._active_step.order if self._active_step else None)
+
+    def action_search_output(self) -> None:
+        """Show and focus the output search box."""
+        search = self.query_one("#output-search")
+        search.styles.display = "block"
+        search.focus()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        """Run a search over the stored output of every step."""
+        if event.input.id != "output-search" or not event.value:
+            return
+        try:
+            pattern = re.compile(event.value.encode())
+        except re.error as e:
+            self.app.notify_warning(f"Invalid pattern: {e}")
+            return
+        self.run_worker(self._zd_search_output(pattern), group="output-search", exclusive=True)
+
+    async def _zd_search_output(self, pattern: "re.Pattern[bytes]") -> None:
+        """Incrementally search stored output, listing matching lines in the raw pane."""
+        store = self.executor.output_store if self.executor else None
+        if not store:
+            self.app.notify_warning("No stored output to search for this deployment")
+            return
+
+        raw_log = self.query_one("#raw-log")
+        self._browse_step = self.executor.current_step.order if self.executor.current_step else 0
+        raw_log.clear()
+        self.query_one("#raw-title").update(f"Search: {pattern.pattern.decode()}")
+        matches = 0
+        for order, segment in sorted(store.segments.items()):
+            reader = segment.zd_reader()
+            try:
+                for line_no, line in reader.zd_search(pattern):
+                    if line_no is None:
+                        # Yield to the UI between chunks
+                        await asyncio.sleep(0)
+                        continue
+                    raw_log.write(f"[step {order + 1}:{line_no + 1}] {line}")
+                    matches += 1
+                    if matches >= self.MAX_SEARCH_RESULTS:
+                        break
+            finally:
+                reader.zd_close()
+            if matches >= self.MAX_SEARCH_RESULTS:
+                break
+        self.query_one("#raw-title").update(
+            f"Search: {pattern.pattern.decode()} ({matches} matching lines, ^l for live output)"
+        )
+
+    async def _zd_daemon_client(self) -> Optional[ZDDaemonClient]:
+        """Return a client for the configured daemon, if one is running."""
+        socket_path = self.app.zd_config.daemon_socket
+        if socket_path:
+            client = ZDDaemonClient(socket_path)
+            if await client.zd_available():
+                return client
+            await self.app.zd_save_log("daemon_unavailable", f"{socket_path}; running locally")
+        return None
+
+    async def _zd_local_output(self):
+        """Run the in-process executor and yield (step, formatted, raw, states) from its event bus.
+
+        While the screen falls behind, queued output of a step is coalesced, so
+        rendering never holds up the run.
+        """
+        subscription = self.executor.bus.zd_subscribe(
+            "progress-screen", self.app.zd_config.event_queue_size, COALESCE
+        )
+        runner = asyncio.create_task(self.executor.zd_run())
+        try:
+            async for event in subscription:
+                yield event.step, event.formatted, event.raw, event.states
+            await runner
+        finally:
+            self.executor.bus.zd_unsubscribe(subscription)
+            if not runner.done():
+                # The consumer stopped early; let the run stop and clean up as on any cancellation
+                self.executor.zd_cancel("output consumer stopped")
+                await asyncio.gather(runner, return_exceptions=True)
+
+    async def _zd_daemon_output(self, client: ZDDaemonClient):
+        """Submit the plan to the daemon and yield (step, formatted, raw, states) as it runs."""
+        steps = self.app.zd_manager.steps
+        self.daemon_job = await client.zd_submit([step.file_path for step in steps])
+        await self.app.zd_save_log("daemon_submit", self.daemon_job)
+        yield None, f"[yellow]Submitted to daemon as {self.daemon_job}[/yellow]\n", f"Submitted as {self.daemon_job}\n", ()
+
+        async for event in client.zd_attach(self.daemon_job):
+            if event['event'] == 'output':
+                step = steps[event['step']] if event['step'] is not None else None
+                yield step, event['formatted'], event['raw'], tuple(event.get('states', ()))
+            elif event['event'] == 'done':
+                self.daemon_status = event['status']
 
     async def action_pop_screen(self) -> None:
-        """Handle escape key."""
+        """Handle escape key, cancelling any deployment still running.
+
+        Daemon jobs keep running when the screen is closed; only the view detaches.
+        """
+        if self._watch_worker:
+            self._watch_worker.cancel()
+            self._watch_worker = None
+        if self.executor and not self.executor.cancelled:
+            self.executor.zd_cancel("cancelled by operator")
+            await self.app.zd_save_log("zd_cancel_requested", "Progress screen closed")
         await self.app.pop_screen()
 
 class MainScreen(BaseScreen):
@@ -256,6 +734,8 @@ class MainScreen(BaseScreen):
     
     # Disable back and deploy on main screen
     DISABLED_BINDINGS = {"back", "deploy"}
+    # Preview rows added to the table per event loop turn
+    PREVIEW_BATCH_ROWS = 200
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -278,51 +758,45 @@ class MainScreen(BaseScreen):
         # Hide the YAML panel initially
         self.query_one("#yaml-panel").styles.display = "none"
         self.app.sub_title = "Deployment Manager"
+        # clear() keeps columns, so they are added once
+        table = self.query_one("#yaml-viewer", DataTable)
+        table.add_column("Key", width=30)
+        table.add_column("Value")
 
     def on_directory_tree_file_selected(self, event: DirectoryTree.FileSelected) -> None:
         """Handle file selection in the directory tree."""
-        try:
+        yaml_panel = self.query_one("#yaml-panel")
+        # Update the current file
+        self.current_file = event.path
+
+        # If it's a YAML file, show the content
+        if str(event.path).endswith(('.yml', '.yaml')):
             # Show the YAML panel
-            yaml_panel = self.query_one("#yaml-panel")
             yaml_panel.styles.display = "block"
+            # A newer selection cancels the preview still loading
+            self.run_worker(self._zd_show_preview(Path(event.path)),
+                            group="yaml-preview", exclusive=True)
+        else:
+            yaml_panel.styles.display = "none"
+            self.notify("Not a YAML file", severity="warning")
 
-            # Update the current file
-            self.current_file = event.path
-
-            # If it's a YAML file, show the content
-            if str(event.path).endswith(('.yml', '.yaml')):
-                with open(event.path) as f:
-                    yaml_content = yaml.safe_load(f)
-                
-                # Update the DataTable with YAML content
-                table = self.query_one(DataTable)
-                table.clear()
-                table.add_column("Key", width=30)
-                table.add_column("Value")
-                
-                # Add the YAML data to the table
-                def add_yaml_to_table(data, prefix=''):
-                    if isinstance(data, dict):
-                        for key, value in data.items():
-                            if isinstance(value, (dict, list)):
-                                add_yaml_to_table(value, f"{prefix}{key}.")
-                            else:
-                                table.add_row(f"{prefix}{key}", str(value))
-                    elif isinstance(data, list):
-                        for i, item in enumerate(data):
-                            if isinstance(item, (dict, list)):
-                                add_yaml_to_table(item, f"{prefix}[{i}].")
-                            else:
-                                table.add_row(f"{prefix}[{i}]", str(item))
-                
-                add_yaml_to_table(yaml_content)
-            else:
-                yaml_panel.styles.display = "none"
-                self.notify("Not a YAML file", severity="warning")
-
+    async def _zd_show_preview(self, path: Path) -> None:
+        """Load a YAML file's rows in the background and stream them into the table."""
+        table = self.query_one("#yaml-viewer", DataTable)
+        table.clear()
+        try:
+            preview = await self.app.yaml_preview.zd_rows(path)
         except Exception as e:
             self.notify(f"Error loading file: {str(e)}", severity="error")
-            yaml_panel.styles.display = "none"
+            self.query_one("#yaml-panel").styles.display = "none"
+            return
+
+        for start in range(0, len(preview.rows), self.PREVIEW_BATCH_ROWS):
+            table.add_rows(preview.rows[start:start + self.PREVIEW_BATCH_ROWS])
+            # Let the first rows paint before adding the rest
+            await asyncio.sleep(0)
+        if preview.note:
+            table.add_row(Text("…", style="dim"), Text(preview.note, style="dim italic"))
 
     async def action_include_file(self) -> None:
         """Include the selected file in deployment."""
@@ -343,6 +817,8 @@ class MainScreen(BaseScreen):
             path = Path(file_path)
             self.app.zd_manager.zd_add_step(path)
             await self.app.zd_save_log("included_file", str(path))
+            if self.app.prefetcher:
+                self.app.prefetcher.zd_prefetch(self.app.zd_manager.steps[-1])
             self.app.notify_success(
                 f"Added '{path.name}' to deployment steps ({len(self.app.zd_manager.steps)} total)"
             )
@@ -401,10 +877,35 @@ class ZDApp(App):
     CSS_PATH = str(Path(__file__).parent.parent / "style.css")
     TITLE = "ZenDeploy"
 
-    def __init__(self):
+    def __init__(self, replay: Optional[ZDSessionReplay] = None, replay_speed: Optional[float] = 1.0):
         super().__init__()
+        # Replay mode feeds a recorded session through the progress screen instead of deploying
+        self.replay = replay
+        self.replay_speed = replay_speed
         self.zd_manager = ZDManager()
-        self.audit_logger = ZDLogger()
+        self.zd_config = ZDConfig.from_yaml()
+        self.audit_logger = ZDLogger(shippers=ZDAuditShipper.for_config(self.zd_config))
+        self.run_history = ZDRunHistory.for_config(self.zd_config)
+        self.yaml_preview = ZDYamlPreview(self.zd_config.preview_max_bytes, self.zd_config.preview_max_rows)
+        self.workspace_pool = ZDWorkspacePool(self.zd_config, self.audit_logger)
+        self.ssh_transport = (
+            ZDSSHTransport(self.zd_config, self.audit_logger) if self.zd_config.ssh_multiplex else None
+        )
+        # Started by the first run with entry point steps, then kept warm for the session
+        self.python_pool = ZDPythonPool(self.zd_config, self.audit_logger) if self.zd_config.python_pool else None
+        # Resolved ${...} env_vars values are shared by every run of the session
+        self.env_resolver = ZDEnvResolver(self.zd_config, self.audit_logger)
+        self.credential_broker = (
+            ZDCredentialBroker(self.zd_config, self.audit_logger) if self.zd_config.aws_broker else None
+        )
+        # Resource locks and rate limits hold across every run of the session
+        self.resource_limits = ZDResourceLimits(self.zd_config, self.audit_logger)
+        # Plan repositories are prefetched into local mirrors while the operator reviews
+        self.repo_cache = None
+        self.prefetcher = None
+        if self.zd_config.prefetch:
+            self.repo_cache = ZDRepoCache(self.zd_config.cache_dir, self.audit_logger)
+            self.prefetcher = ZDPrefetcher(self.repo_cache, self.audit_logger, self.ssh_transport)
         self.screens = {
             ZDScreens.MAIN: MainScreen(),
             ZDScreens.REVIEW: ReviewScreen(self.zd_manager),
@@ -419,9 +920,28 @@ class ZDApp(App):
         for name, screen in self.screens.items():
             self.install_screen(screen, name)
         
+        if self.replay:
+            await self.push_screen(ZDScreens.MAIN)
+            await self.push_screen(ZDScreens.PROGRESS)
+            return
+
         # Start with splash screen
         await self.push_screen(ZDScreens.SPLASH)
 
+    async def action_quit(self) -> None:
+        """Tear down session-wide resources before exiting."""
+        await self.workspace_pool.zd_close()
+        if self.ssh_transport:
+            await self.ssh_transport.zd_close()
+        if self.python_pool:
+            await self.python_pool.zd_close()
+        if self.credential_broker:
+            await self.credential_broker.zd_close()
+        if self.run_history:
+            await asyncio.to_thread(self.run_history.zd_close)
+        await self.audit_logger.zd_close()
+        self.exit()
+
     async def zd_save_log(self, action: str, details: str = "") -> None:
         """Log an action with the audit logger."""
         try:
@@ -458,6 +978,17 @@ class ZDApp(App):
         if hasattr(self, 'audit_logger'):
             await self.audit_logger.__aexit__(exc_type, exc_val, exc_tb)
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ZenDeploy")
+    parser.add_argument("--replay", type=Path, help="play back a recorded session instead of deploying")
+    parser.add_argument("--speed", default="1",
+                        help="replay speed multiplier, or 'max' to replay as fast as possible")
+    args = parser.parse_args()
+
+    replay = ZDSessionReplay(args.replay) if args.replay else None
+    speed = None if args.speed == "max" else float(args.speed)
+    app = ZDApp(replay, speed)
+    app.run()
+
 if __name__ == "__main__":
-    app = ZDApp()
-    app.run() 
\ No newline at end of file
+    main()
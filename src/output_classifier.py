@@ -0,0 +1,135 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Most severe first; "ignore" rules exempt lines from every other rule
+SEVERITIES = ("fatal", "error", "warning")
+
+# Used unless classifier.builtin is false
+BUILTIN_RULES = (
+    {"pattern": r"^\s*(?:ERROR|Error|error)(?:\[[^\]]*\])?:", "severity": "error"},
+    {"pattern": "Traceback (most recent call last):", "literal": True, "severity": "error"},
+    {"pattern": r"^\s*(?:WARN|WARNING|Warning|warning)(?:\[[^\]]*\])?:", "severity": "warning"},
+)
+
+@dataclass(frozen=True)
+class ZDOutputRule:
+    """One output pattern and the severity of the lines it matches."""
+    pattern: str
+    severity: str
+    literal: bool = False
+    ignore_case: bool = False
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'ZDOutputRule':
+        severity = spec.get("severity", "error")
+        if severity not in SEVERITIES + ("ignore",):
+            raise ValueError(f"Unknown severity '{severity}' for pattern {spec.get('pattern')!r}")
+        rule = cls(str(spec["pattern"]), severity, spec.get("literal", False), spec.get("ignore_case", False))
+        re.compile(rule.zd_regex())
+        return rule
+
+    def zd_regex(self) -> str:
+        regex = re.escape(self.pattern) if self.literal else self.pattern
+        return f"(?i:{regex})" if self.ignore_case else f"(?:{regex})"
+
+@dataclass
+class ZDOutputSummary:
+    """Matched line counts per severity for one step, with the first few lines of each."""
+    max_samples: int = 5
+    counts: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(SEVERITIES, 0))
+    samples: Dict[str, List[str]] = field(default_factory=lambda: {severity: [] for severity in SEVERITIES})
+
+    def zd_add(self, severity: str, line: str) -> None:
+        self.counts[severity] += 1
+        if len(self.samples[severity]) < self.max_samples:
+            self.samples[severity].append(line)
+
+    @property
+    def matched(self) -> int:
+        return sum(self.counts.values())
+
+class ZDOutputClassifier:
+    """Classifies output lines by severity using rules compiled into a few combined regexes.
+
+    Every line is first tested against one alternation of all rules, so lines
+    that match nothing (nearly all of them) cost a single search. Rules with
+    capturing groups are matched on their own: combined, their group names could
+    collide and their backreferences would point at other rules' groups.
+    """
+
+    def __init__(self, rules: Sequence[ZDOutputRule]):
+        self.rules = tuple(rules)
+        by_severity: Dict[str, List[str]] = {}
+        for rule in self.rules:
+            by_severity.setdefault(rule.severity, []).append(rule.zd_regex())
+        matching = [regex for severity in SEVERITIES for regex in by_severity.get(severity, [])]
+        self._any = self._zd_compile(matching)
+        self._ignore = self._zd_compile(by_severity.get("ignore", []))
+        self._by_severity: List[Tuple[str, List[re.Pattern]]] = [
+            (severity, self._zd_compile(by_severity[severity]))
+            for severity in SEVERITIES if severity in by_severity
+        ]
+        self._step_classifiers: Dict[Tuple[ZDOutputRule, ...], 'ZDOutputClassifier'] = {}
+
+    @staticmethod
+    def _zd_compile(regexes: Sequence[str]) -> List[re.Pattern]:
+        """One alternation of the group-free regexes, plus each regex that has groups."""
+        compiled = [re.compile(regex) for regex in regexes]
+        plain = [pattern.pattern for pattern in compiled if not pattern.groups]
+        patterns = [pattern for pattern in compiled if pattern.groups]
+        if plain:
+            patterns.insert(0, re.compile("|".join(plain)))
+        return patterns
+
+    @staticmethod
+    def _zd_search(patterns: Sequence[re.Pattern], line: str) -> bool:
+        return any(pattern.search(line) for pattern in patterns)
+
+    @classmethod
+    def for_config(cls, config) -> 'ZDOutputClassifier':
+        """The plan-wide classifier: built-in rules (unless disabled) plus configured ones."""
+        specs = (BUILTIN_RULES if config.classifier_builtin else ()) + tuple(config.output_rules)
+        return cls([ZDOutputRule.from_dict(spec) for spec in specs])
+
+    @staticmethod
+    def zd_problems(specs) -> List[str]:
+        """Problems in a list of rule definitions, for preflight."""
+        if not isinstance(specs, list):
+            return ["output_rules must be a list of {pattern, severity} mappings"]
+        problems = []
+        rules = []
+        for spec in specs:
+            try:
+                rules.append(ZDOutputRule.from_dict(spec))
+            except (KeyError, TypeError, AttributeError):
+                problems.append(f"Output rule {spec!r} needs a pattern")
+            except (ValueError, re.error) as e:
+                problems.append(f"Output rule {spec.get('pattern')!r}: {e}")
+        if not problems:
+            # Check the rules compile together too, as the run will compile them
+            try:
+                ZDOutputClassifier(rules)
+            except re.error as e:
+                problems.append(f"Output rules don't combine: {e}")
+        return problems
+
+    def zd_for_step(self, specs) -> 'ZDOutputClassifier':
+        """This classifier extended with a step's own rules, compiled once per distinct rule set."""
+        if not specs:
+            return self
+        extra = tuple(ZDOutputRule.from_dict(spec) for spec in specs)
+        if extra not in self._step_classifiers:
+            self._step_classifiers[extra] = ZDOutputClassifier(self.rules + extra)
+        return self._step_classifiers[extra]
+
+    def zd_classify(self, line: str) -> Optional[str]:
+        """The severity of a line, or None if no rule (or an ignore rule) matches it."""
+        if not self._zd_search(self._any, line):
+            return None
+        if self._zd_search(self._ignore, line):
+            return None
+        for severity, patterns in self._by_severity:
+            if self._zd_search(patterns, line):
+                return severity
+        return None
@@ -0,0 +1,188 @@
+import array
+import mmap
+import re
+import struct
+import tempfile
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from audit_logger import ZDLogger
+
+# Each index entry is the little-endian byte offset where a line starts
+_INDEX_ENTRY = struct.Struct("<Q")
+# Whether the index can be read in place as native unsigned 64-bit integers
+_NATIVE_INDEX = struct.pack("=Q", 1) == _INDEX_ENTRY.pack(1)
+
+class ZDStepOutput:
+    """Append-only output segment for one step, with a line-offset index beside it."""
+
+    def __init__(self, directory: Path, key: str):
+        self.data_path = directory / f"{key}.out"
+        self.index_path = directory / f"{key}.idx"
+        self._data = open(self.data_path, "ab")
+        self._index = open(self.index_path, "ab")
+        self._offset = self._data.tell()
+        self.line_count = self._index.tell() // _INDEX_ENTRY.size
+
+    def zd_append(self, text: str) -> None:
+        """Append text, one index entry per line."""
+        for line in text.splitlines():
+            encoded = line.encode("utf-8", errors="replace") + b"\n"
+            self._index.write(_INDEX_ENTRY.pack(self._offset))
+            self._data.write(encoded)
+            self._offset += len(encoded)
+            self.line_count += 1
+
+    @property
+    def size(self) -> int:
+        """Bytes written so far."""
+        return self._offset
+
+    def zd_flush(self) -> None:
+        if self._data.closed:
+            return
+        self._data.flush()
+        self._index.flush()
+
+    def zd_close(self) -> None:
+        if not self._data.closed:
+            self._data.close()
+            self._index.close()
+
+    def zd_reader(self) -> 'ZDOutputReader':
+        """Flush pending writes and return a reader over the segment."""
+        self.zd_flush()
+        return ZDOutputReader(self.data_path, self.index_path)
+
+class ZDOutputReader:
+    """Memory-mapped view of a step segment.
+
+    Only the lines a caller asks for are decoded, so paging and searching a
+    multi-gigabyte segment costs constant memory.
+    """
+
+    def __init__(self, data_path: Path, index_path: Path):
+        self.data_path = data_path
+        self.index_path = index_path
+        self._data: Optional[mmap.mmap] = None
+        self._index: Optional[mmap.mmap] = None
+        self._offsets: Sequence[int] = ()
+        self.zd_refresh()
+
+    def zd_refresh(self) -> None:
+        """Remap the files to pick up lines appended since the last call."""
+        self.zd_close()
+        self._data = self._zd_map(self.data_path)
+        self._index = self._zd_map(self.index_path)
+        self._offsets = self._zd_offsets(self._index) if self._index is not None else ()
+
+    @staticmethod
+    def _zd_offsets(index: mmap.mmap) -> Sequence[int]:
+        # Only whole entries: a writer in another process may be mid-entry
+        whole = len(index) - len(index) % _INDEX_ENTRY.size
+        if _NATIVE_INDEX:
+            with memoryview(index) as view:
+                return view[:whole].cast("Q")
+        # Big-endian hosts decode a copy of the little-endian index
+        return array.array("Q", (offset for offset, in _INDEX_ENTRY.iter_unpack(index[:whole])))
+
+    @staticmethod
+    def _zd_map(path: Path) -> Optional[mmap.mmap]:
+        # mmap refuses empty files, so an empty segment is simply unmapped
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def line_count(self) -> int:
+        return len(self._offsets)
+
+    def _zd_line_bounds(self, line_no: int) -> Tuple[int, int]:
+        start = self._offsets[line_no]
+        end = self._offsets[line_no + 1] if line_no + 1 < len(self._offsets) else len(self._data)
+        return start, end
+
+    def zd_lines(self, start: int, count: int) -> List[str]:
+        """Decode lines [start, start + count)."""
+        if self._data is None:
+            return []
+        start = max(0, start)
+        stop = min(self.line_count, start + count)
+        lines = []
+        for line_no in range(start, stop):
+            begin, end = self._zd_line_bounds(line_no)
+            lines.append(self._data[begin:end].rstrip(b"\n").decode("utf-8", errors="replace"))
+        return lines
+
+    def zd_line_at(self, offset: int) -> int:
+        """Return the line number containing a byte offset."""
+        return bisect_right(self._offsets, offset) - 1
+
+    def zd_search(self, pattern: "re.Pattern[bytes]", start_line: int = 0,
+                  chunk_bytes: int = 4 * 1024 * 1024) -> Iterator[Tuple[Optional[int], Optional[str]]]:
+        """Search the segment with a compiled bytes regex.
+
+        Yields (line_no, line) for each matching line. The regex runs directly
+        over the mapping; after each chunk of chunk_bytes it yields
+        (None, None) so callers can hand control back to the event loop.
+        """
+        if self._data is None or start_line >= self.line_count:
+            return
+        pos = self._offsets[start_line]
+        size = len(self._data)
+        last_line = -1
+        while pos < size:
+            # Finish chunks on a line boundary so no match is split
+            chunk_end = min(size, pos + chunk_bytes)
+            if chunk_end < size:
+                newline = self._data.find(b"\n", chunk_end)
+                chunk_end = size if newline == -1 else newline + 1
+            for match in pattern.finditer(self._data, pos, chunk_end):
+                line_no = self.zd_line_at(match.start())
+                # One hit per line is enough
+                if line_no == last_line:
+                    continue
+                last_line = line_no
+                begin, end = self._zd_line_bounds(line_no)
+                yield line_no, self._data[begin:end].rstrip(b"\n").decode("utf-8", errors="replace")
+            pos = chunk_end
+            yield None, None
+
+    def zd_close(self) -> None:
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._offsets = ()
+        for mapped in (self._data, self._index):
+            if mapped is not None:
+                mapped.close()
+        self._data = None
+        self._index = None
+
+class ZDOutputStore:
+    """Per-session directory of step output segments, stored beside the session log."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segments: Dict[int, ZDStepOutput] = {}
+
+    @classmethod
+    def for_session(cls, audit_logger: ZDLogger) -> 'ZDOutputStore':
+        """Create a store for one run, next to the logger's session log file."""
+        log_file = audit_logger.log_file
+        session_dir = log_file.parent / f"{log_file.stem}_output"
+        session_dir.mkdir(parents=True, exist_ok=True)
+        # Several runs (or daemon jobs) can share a session, so each gets its own directory
+        return cls(Path(tempfile.mkdtemp(prefix="run_", dir=session_dir)))
+
+    def zd_segment(self, step) -> ZDStepOutput:
+        """Return the segment for a step, creating it on first use."""
+        if step.order not in self.segments:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", step.name)
+            self.segments[step.order] = ZDStepOutput(self.directory, f"step_{step.order + 1:03d}_{safe_name}")
+        return self.segments[step.order]
+
+    def zd_close(self) -> None:
+        for segment in self.segments.values():
+            segment.zd_close()
@@ -0,0 +1,278 @@
+import asyncio
+import configparser
+import os
+import re
+import stat
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+from repo_cache import ZDRepoCache, zd_resolve_repo_url
+from ssh_transport import ZDSSHTransport, zd_git_ssh_command
+from tool_cache import ZDToolCaches
+from output_classifier import ZDOutputClassifier
+from env_resolver import ZDEnvResolver, zd_references
+from resource_limits import ZDResourceLimits
+
+_ENV_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_ENTRY_POINT = re.compile(r"^[A-Za-z_][\w.]*:[A-Za-z_]\w*$")
+# Environment variables through which the default credential chain finds credentials without a profile
+_AMBIENT_CREDENTIALS = (
+    "AWS_ACCESS_KEY_ID", "AWS_PROFILE", "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI",
+    "AWS_CONTAINER_CREDENTIALS_FULL_URI", "AWS_WEB_IDENTITY_TOKEN_FILE",
+)
+# Files that identify an EC2 instance (with instance profile credentials) without calling the metadata service
+_EC2_MARKERS = (("/sys/hypervisor/uuid", "ec2"), ("/sys/devices/virtual/dmi/id/board_asset_tag", "i-"))
+
+@dataclass
+class ZDPreflightIssue:
+    """A problem found in one step before anything was deployed; warnings don't stop the run."""
+    step: object
+    check: str
+    message: str
+    warning: bool = False
+
+    def __str__(self) -> str:
+        return f"Step {self.step.order + 1} ({self.step.name}) [{self.check}]: {self.message}"
+
+class ZDPreflight:
+    """Validates a whole plan up front, running every check concurrently.
+
+    Repositories are checked once each (against the local mirror when a repo
+    cache is available, otherwise with git ls-remote), and scripts are looked
+    up with git cat-file so nothing is checked out.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger,
+                 repo_cache: Optional[ZDRepoCache] = None,
+                 ssh_transport: Optional[ZDSSHTransport] = None):
+        self.config = config
+        self.audit_logger = audit_logger
+        self.repo_cache = repo_cache
+        self.ssh_transport = ssh_transport
+        self._steps: list = []
+        self._available: Set[str] = set()
+
+    async def zd_check(self, steps, available: Iterable[str] = ()) -> List[ZDPreflightIssue]:
+        """Run all checks for every step and return the problems and warnings found, in plan order.
+
+        available names steps outside this plan whose outputs are already stored.
+        """
+        self._steps = list(steps)
+        self._available = set(available)
+        profiles = await asyncio.to_thread(self.zd_aws_profiles)
+
+        # Steps sharing a repository share one reachability check
+        repos: Dict[str, asyncio.Task] = {}
+        for step in steps:
+            url = zd_resolve_repo_url(step.repo_url)
+            if step.repo_url and url not in repos:
+                repos[url] = asyncio.create_task(self._zd_repo_source(step, url))
+
+        results = await asyncio.gather(
+            *(self._zd_check_step(step, profiles, repos) for step in steps)
+        )
+        issues = [issue for step_issues in results for issue in step_issues]
+        warnings = sum(issue.warning for issue in issues)
+        await self.audit_logger.zd_log_action(
+            "preflight", f"{len(steps)} steps checked, {len(issues) - warnings} problems, {warnings} warnings"
+        )
+        return issues
+
+    async def _zd_check_step(self, step, profiles: set,
+                             repos: Dict[str, asyncio.Task]) -> List[ZDPreflightIssue]:
+        issues = []
+        for field_name in ("aws_profile", "repo_url"):
+            if not getattr(step, field_name):
+                issues.append(ZDPreflightIssue(step, "fields", f"{field_name} is empty"))
+        if bool(step.script_path) == bool(step.entry_point):
+            issues.append(ZDPreflightIssue(step, "fields", "Exactly one of script_path and entry_point is needed"))
+        elif step.entry_point:
+            if not _ENTRY_POINT.match(step.entry_point):
+                issues.append(ZDPreflightIssue(
+                    step, "entry_point", f"Entry point '{step.entry_point}' is not of the form module:function"
+                ))
+            if not self.config.python_pool:
+                issues.append(ZDPreflightIssue(
+                    step, "entry_point", "Entry points need python_workers.enabled"
+                ))
+
+        if step.aws_profile and step.aws_profile not in profiles and not self.zd_ambient_credentials(step.aws_profile):
+            # Credentials may still come from somewhere preflight can't see, so this doesn't block the run
+            issues.append(ZDPreflightIssue(
+                step, "aws_profile",
+                f"Profile '{step.aws_profile}' not found in AWS config; its scripts need credentials from elsewhere",
+                warning=True
+            ))
+
+        # The key is only used by SSH transports; https and local repositories never read it
+        if step.ssh_key and ZDSSHTransport.zd_ssh_destination(step.repo_url) is not None:
+            problem = self.zd_ssh_key_problem(step.ssh_key)
+            if problem:
+                issues.append(ZDPreflightIssue(step, "ssh_key", problem))
+
+        for problem in self.zd_env_problems(step.env_vars) + ZDEnvResolver.zd_problems(step.env_vars):
+            issues.append(ZDPreflightIssue(step, "env_vars", problem))
+        for key in step.secrets:
+            if key not in step.env_vars:
+                issues.append(ZDPreflightIssue(step, "secrets", f"Secret '{key}' is not one of the step's env_vars"))
+        for reference in zd_references(step.env_vars):
+            if reference.kind != "step" or reference.arg in self._available:
+                continue
+            producer = next((s for s in self._steps if s.name == reference.arg), None)
+            if producer is None or producer.order >= step.order:
+                issues.append(ZDPreflightIssue(
+                    step, "env_vars", f"{reference}: '{reference.arg}' is not an earlier step of the plan"
+                ))
+            elif reference.key not in producer.outputs.get('results', []):
+                issues.append(ZDPreflightIssue(
+                    step, "env_vars", f"{reference}: step '{reference.arg}' does not declare result {reference.key}"
+                ))
+
+        for problem in ZDToolCaches.zd_problems(step.caches):
+            issues.append(ZDPreflightIssue(step, "caches", problem))
+        if step.caches and not self.config.tool_caches:
+            issues.append(ZDPreflightIssue(
+                step, "caches", "caches are ignored unless tool_caches.enabled is set", warning=True
+            ))
+
+        for problem in ZDOutputClassifier.zd_problems(step.output_rules):
+            issues.append(ZDPreflightIssue(step, "output_rules", problem))
+
+        for problem in ZDResourceLimits.zd_problems(step.resources, self.config):
+            issues.append(ZDPreflightIssue(step, "resources", problem))
+
+        for source in step.inputs:
+            if source.get('step') in self._available:
+                continue
+            producer = next((s for s in self._steps if s.name == source.get('step')), None)
+            if producer is None or producer.order >= step.order:
+                issues.append(ZDPreflightIssue(
+                    step, "inputs", f"Input step '{source.get('step')}' is not an earlier step of the plan"
+                ))
+            elif not producer.outputs:
+                issues.append(ZDPreflightIssue(
+                    step, "inputs", f"Input step '{source.get('step')}' declares no outputs"
+                ))
+
+        if step.repo_url:
+            source, error = await repos[zd_resolve_repo_url(step.repo_url)]
+            if error:
+                issues.append(ZDPreflightIssue(step, "repo", error))
+            elif source and step.script_path:
+                # Anything else would be stripped by the clone's checkout
+                returncode, _ = await self._zd_git(
+                    "--git-dir", source, "cat-file", "-e", f"HEAD:{step.script_path}"
+                )
+                if returncode != 0:
+                    issues.append(ZDPreflightIssue(
+                        step, "script", f"Script '{step.script_path}' not found at HEAD"
+                    ))
+        return issues
+
+    async def _zd_repo_source(self, step, url: str):
+        """Return (git dir usable for cat-file or None, error message or None)."""
+        ssh_command = zd_git_ssh_command(self.ssh_transport, step.repo_url, step.ssh_key)
+        if self.repo_cache:
+            try:
+                mirror = await self.repo_cache.zd_mirror(
+                    url, ssh_command, self.config.repo_cache_max_age
+                )
+                return str(mirror), None
+            except Exception as e:
+                return None, f"Repository {step.repo_url} is not reachable: {str(e).strip()}"
+
+        env = {'GIT_SSH_COMMAND': ssh_command} if ssh_command else None
+        returncode, stderr = await self._zd_git("ls-remote", "--exit-code", url, "HEAD", env=env)
+        if returncode != 0:
+            return None, f"Repository {step.repo_url} is not reachable: {stderr or 'no HEAD'}"
+        if Path(url).is_dir():
+            # Local repositories can be inspected directly
+            returncode, git_dir = await self._zd_git("-C", url, "rev-parse", "--absolute-git-dir")
+            return (git_dir if returncode == 0 else None), None
+        # Without a mirror the script can't be checked without fetching
+        return None, None
+
+    async def _zd_git(self, *args: str, env: Optional[dict] = None):
+        """Run git with a timeout and return (returncode, first line of output)."""
+        process = await asyncio.create_subprocess_exec(
+            "git", *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, 'GIT_TERMINAL_PROMPT': '0', **(env or {})},
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(), self.config.preflight_timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return -1, f"timed out after {self.config.preflight_timeout}s"
+        text = (stderr if process.returncode else stdout).decode(errors="replace").strip()
+        return process.returncode, text.splitlines()[0] if text else ""
+
+    @staticmethod
+    def zd_aws_profiles() -> set:
+        """Profile names defined in the AWS config and credentials files."""
+        profiles = set()
+        config_file = os.environ.get('AWS_CONFIG_FILE', '~/.aws/config')
+        credentials_file = os.environ.get('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials')
+        for path, prefix in ((config_file, "profile "), (credentials_file, "")):
+            parser = configparser.RawConfigParser()
+            try:
+                parser.read(os.path.expanduser(path))
+            except configparser.Error:
+                continue
+            for section in parser.sections():
+                if section.startswith(prefix):
+                    profiles.add(section[len(prefix):].strip())
+                elif section == "default":
+                    profiles.add(section)
+        return profiles
+
+    @staticmethod
+    def zd_ambient_credentials(profile: str) -> bool:
+        """Whether the default profile gets credentials without a config entry (environment, container or EC2 role)."""
+        if profile != "default":
+            return False
+        if any(os.environ.get(name) for name in _AMBIENT_CREDENTIALS):
+            return True
+        for path, prefix in _EC2_MARKERS:
+            try:
+                if Path(path).read_text().strip().lower().startswith(prefix):
+                    return True
+            except OSError:
+                continue
+        return False
+
+    @staticmethod
+    def zd_ssh_key_problem(ssh_key: str) -> Optional[str]:
+        """Describe why ssh would refuse a private key, or None if it looks usable."""
+        path = Path(ssh_key).expanduser()
+        try:
+            mode = path.stat().st_mode
+        except OSError:
+            return f"SSH key {ssh_key} does not exist"
+        if not stat.S_ISREG(mode):
+            return f"SSH key {ssh_key} is not a file"
+        if mode & 0o077:
+            return f"SSH key {ssh_key} is accessible by others (mode {stat.S_IMODE(mode):o}, expected 600)"
+        if not os.access(path, os.R_OK):
+            return f"SSH key {ssh_key} is not readable"
+        return None
+
+    @staticmethod
+    def zd_env_problems(env_vars) -> List[str]:
+        """Schema problems in a step's env_vars mapping."""
+        if not isinstance(env_vars, dict):
+            return ["env_vars must be a mapping of names to values"]
+        problems = []
+        for key, value in env_vars.items():
+            if not isinstance(key, str) or not _ENV_NAME.match(key):
+                problems.append(f"'{key}' is not a valid environment variable name")
+            if value is None or isinstance(value, (dict, list)):
+                problems.append(f"{key} must be a string, number or boolean")
+        return problems
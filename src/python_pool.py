@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+# Runs in the worker pool's zygote process: imports argv[2:] once, then forks a
+# fresh child per call on the unix socket argv[1]. Each request carries the
+# call's stdout and stderr pipes (SCM_RIGHTS) and a JSON line with the entry
+# point, import path and environment. The child reports its pid (and any
+# preloaded modules the import path also provides, which the call can't get
+# from there), runs the entry point in its own session, and reports its exit
+# code and rusage on the same connection. EOF on stdin means ZenDeploy has
+# gone, and the zygote exits.
+ZYGOTE = r"""
+import importlib, importlib.machinery, json, os, resource, selectors, signal, socket, sys, traceback
+listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+listener.bind(sys.argv[1])
+listener.listen(64)
+loaded, failed = [], {}
+for name in sys.argv[2:]:
+    try:
+        importlib.import_module(name)
+        loaded.append(name)
+    except Exception as e:
+        failed[name] = f"{type(e).__name__}: {e}"
+sys.stdout.write(json.dumps({"loaded": loaded, "failed": failed}) + "\n")
+sys.stdout.flush()
+# Calls are never waited for here; let the kernel reap them
+signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+selector = selectors.DefaultSelector()
+selector.register(listener, selectors.EVENT_READ)
+selector.register(sys.stdin, selectors.EVENT_READ)
+
+def run(conn, data, fds):
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    os.setsid()
+    selector.close()
+    listener.close()
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk:
+            os._exit(1)
+        data += chunk
+    request = json.loads(data)
+    null = os.open(os.devnull, os.O_RDONLY)
+    for target, fd in ((0, null), (1, fds[0]), (2, fds[1])):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdout.reconfigure(line_buffering=True)
+    packages = {name.partition(".")[0] for name in loaded}
+    shadowed = sorted(name for name in packages if importlib.machinery.PathFinder.find_spec(name, [request["path"]]))
+    for name in shadowed:
+        print(f"Warning: {name} is preloaded by the Python worker; the checkout's copy is not used",
+              file=sys.stderr, flush=True)
+    conn.sendall(json.dumps({"pid": os.getpid(), "shadowed": shadowed}).encode() + b"\n")
+    os.environ.clear()
+    os.environ.update(request["env"])
+    sys.path.insert(0, request["path"])
+    sys.argv = [request["entry_point"]]
+    module, _, function = request["entry_point"].partition(":")
+    try:
+        result = getattr(importlib.import_module(module), function)()
+        code = 1 if result is False else result if type(result) is int else 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    usage = {"user": own.ru_utime + children.ru_utime, "sys": own.ru_stime + children.ru_stime,
+             "max_rss_kb": max(own.ru_maxrss, children.ru_maxrss),
+             "major_faults": own.ru_majflt + children.ru_majflt,
+             "read_blocks": own.ru_inblock + children.ru_inblock,
+             "write_blocks": own.ru_oublock + children.ru_oublock}
+    try:
+        conn.sendall(json.dumps({"exit": code, "usage": usage}).encode() + b"\n")
+    except OSError:
+        pass
+    os._exit(code & 0xFF)
+
+while True:
+    for key, _ in selector.select():
+        if key.fileobj is not listener:
+            sys.exit(0)
+        conn, _ = listener.accept()
+        try:
+            data, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+        except OSError:
+            conn.close()
+            continue
+        if len(fds) == 2 and os.fork() == 0:
+            try:
+                run(conn, data, fds)
+            finally:
+                os._exit(1)
+        for fd in fds:
+            os.close(fd)
+        conn.close()
+"""
+
+class ZDPythonCall:
+    """A running entry point call, shaped like asyncio.subprocess.Process for zd_run_script.
+
+    The call is not a child of ZenDeploy, so its exit code comes from the call
+    itself; one killed before reporting has a returncode of -1.
+    """
+
+    def __init__(self, pid: int, stdout: asyncio.StreamReader, stderr: asyncio.StreamReader,
+                 control: asyncio.StreamReader, writer: asyncio.StreamWriter, shadowed: List[str] = ()):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        # Preloaded modules the checkout also provides; the call gets the worker's copy
+        self.shadowed = list(shadowed)
+        self.returncode: Optional[int] = None
+        # The call's rusage including its subprocesses, once it has exited
+        self.usage: Optional[dict] = None
+        self._status = asyncio.create_task(self._zd_read_status(control, writer))
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._status)
+
+    async def _zd_read_status(self, control: asyncio.StreamReader, writer: asyncio.StreamWriter) -> int:
+        try:
+            line = await control.readline()
+        finally:
+            writer.close()
+        if line:
+            status = json.loads(line)
+            self.returncode = status["exit"]
+            self.usage = status["usage"]
+        else:
+            self.returncode = -1
+        return self.returncode
+
+class ZDPythonPool:
+    """Runs Python entry points (module:function) in warm workers instead of fresh interpreters.
+
+    A zygote process imports the configured heavy modules (boto3, yaml, ...)
+    once; each call is a child forked from it, so it starts with those imports
+    done but with its own memory, environment, session and output pipes.
+    The zygote starts in the background on first use and serves a whole session.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self.preload: List[str] = list(config.python_preload)
+        self._dir: Optional[Path] = None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._ready: Optional[asyncio.Task] = None
+
+    def zd_start(self) -> None:
+        """Start warming the zygote, unless it is already running."""
+        if self._ready is None or (self._ready.done() and not self._zd_alive()):
+            self._ready = asyncio.create_task(self._zd_spawn())
+
+    async def zd_call(self, entry_point: str, path: Path, env: dict) -> ZDPythonCall:
+        """Start entry_point with path first on sys.path and env as its environment."""
+        self.zd_start()
+        try:
+            await asyncio.shield(self._ready)
+        except Exception:
+            # The next call tries again
+            self._ready = None
+            raise
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        try:
+            request = json.dumps({"entry_point": entry_point, "path": str(path), "env": env}).encode() + b"\n"
+            sock = await asyncio.to_thread(self._zd_send, request, [out_w, err_w])
+        except BaseException:
+            for fd in (out_r, err_r):
+                os.close(fd)
+            raise
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+
+        stdout = await self._zd_pipe_reader(out_r)
+        stderr = await self._zd_pipe_reader(err_r)
+        control, writer = await asyncio.open_unix_connection(sock=sock)
+        started = await control.readline()
+        if not started:
+            writer.close()
+            raise RuntimeError(f"Python worker for {entry_point} exited before starting")
+        started = json.loads(started)
+        if started["shadowed"]:
+            await self.audit_logger.zd_log_action(
+                "python_pool_shadowed", f"{entry_point}: {', '.join(started['shadowed'])} from the worker, not {path}"
+            )
+        return ZDPythonCall(started["pid"], stdout, stderr, control, writer, started["shadowed"])
+
+    async def zd_close(self) -> None:
+        """Stop the zygote; calls still running are unaffected."""
+        if self._ready and not self._ready.done():
+            self._ready.cancel()
+        if self._process and self._process.returncode is None:
+            self._process.stdin.close()
+            try:
+                await asyncio.wait_for(self._process.wait(), 5)
+            except asyncio.TimeoutError:
+                self._process.kill()
+                await self._process.wait()
+        if self._dir:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+        self._process = None
+        self._ready = None
+
+    def _zd_alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def _zd_spawn(self) -> None:
+        if self._dir is None:
+            # Socket paths are length-limited (~104 bytes), so keep the directory short
+            self._dir = Path(tempfile.mkdtemp(prefix="zdpy_"))
+        socket_path = self._dir / "zygote.sock"
+        socket_path.unlink(missing_ok=True)
+        started = time.monotonic()
+        self._process = await asyncio.create_subprocess_exec(
+            self.config.python_executable or sys.executable, "-c", ZYGOTE, str(socket_path), *self.preload,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            # Keep terminal signals meant for ZenDeploy away from the zygote
+            start_new_session=True
+        )
+        line = await self._process.stdout.readline()
+        if not line:
+            await self._process.wait()
+            raise RuntimeError(f"Python worker pool failed to start (exit code {self._process.returncode})")
+        report = json.loads(line)
+        details = f"{', '.join(report['loaded']) or 'nothing'} preloaded in {time.monotonic() - started:.2f}s"
+        if report['failed']:
+            details += "; not importable: " + ", ".join(f"{name} ({error})" for name, error in report['failed'].items())
+        await self.audit_logger.zd_log_action("python_pool_ready", details)
+
+    def _zd_send(self, request: bytes, fds: List[int]) -> socket.socket:
+        """Connect to the zygote and send a request with the call's output pipes."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self._dir / "zygote.sock"))
+            sent = socket.send_fds(sock, [request], fds)
+            sock.sendall(request[sent:])
+        except BaseException:
+            sock.close()
+            raise
+        sock.setblocking(False)
+        return sock
+
+    @staticmethod
+    async def _zd_pipe_reader(fd: int) -> asyncio.StreamReader:
+        reader = asyncio.StreamReader()
+        await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0)
+        )
+        return reader
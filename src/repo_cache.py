@@ -0,0 +1,104 @@
+import asyncio
+import fcntl
+import hashlib
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import git
+from audit_logger import ZDLogger
+
+def zd_resolve_repo_url(repo_url: str) -> str:
+    """Return the clone source for a repo URL, resolving file:// paths against the project root."""
+    if repo_url.startswith('file://'):
+        local_path = repo_url.replace('file://', '')
+        base_dir = Path(__file__).parent.parent
+        return str((base_dir / local_path).resolve())
+    return repo_url
+
+class ZDRepoCache:
+    """Bare mirrors of step repositories, reused across clones and deployments.
+
+    The TUI and the daemon share the mirrors, so each mirror is created and
+    fetched under a flock on its own lock file, not just a per-process lock.
+    """
+
+    def __init__(self, cache_dir: Path, audit_logger: ZDLogger):
+        self.repo_dir = Path(cache_dir).expanduser() / "repos"
+        self.repo_dir.mkdir(parents=True, exist_ok=True)
+        self.audit_logger = audit_logger
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._fetched_at: Dict[str, float] = {}
+
+    def zd_mirror_path(self, url: str) -> Path:
+        """Return the mirror location for a repository URL."""
+        key = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return self.repo_dir / f"{key}.git"
+
+    async def zd_mirror(self, url: str, ssh_command: Optional[str] = None,
+                        max_age: float = 0) -> Path:
+        """Create or refresh the mirror for a URL and return its path.
+
+        Mirrors fetched less than max_age seconds ago are returned as-is.
+        """
+        path = self.zd_mirror_path(url)
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            fetched = self._fetched_at.get(url)
+            if path.exists() and fetched is not None and time.monotonic() - fetched < max_age:
+                return path
+
+            start = time.monotonic()
+            action = await asyncio.to_thread(self._zd_update, url, path, ssh_command)
+            self._fetched_at[url] = time.monotonic()
+            await self.audit_logger.zd_log_action(
+                action, f"{url} -> {path} ({time.monotonic() - start:.2f}s)"
+            )
+            return path
+
+    def zd_is_fresh(self, url: str, max_age: float) -> bool:
+        """Whether the mirror for a URL was fetched within max_age seconds."""
+        fetched = self._fetched_at.get(url)
+        return fetched is not None and time.monotonic() - fetched < max_age
+
+    def zd_invalidate(self, url: str) -> None:
+        """Make the next zd_mirror call fetch, however recently the mirror was updated."""
+        self._fetched_at.pop(url, None)
+
+    @staticmethod
+    def _zd_env(ssh_command: Optional[str]) -> dict:
+        return {'GIT_SSH_COMMAND': ssh_command} if ssh_command else {}
+
+    def _zd_update(self, url: str, path: Path, ssh_command: Optional[str]) -> str:
+        """Clone or fetch the mirror while holding its lock; returns the audit action."""
+        lock_dir = self.repo_dir / ".locks"
+        lock_dir.mkdir(exist_ok=True)
+        with open(lock_dir / f"{path.stem}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Scratch clones are only made under the lock, so any found now were interrupted
+            for leftover in self.repo_dir.glob(f".{path.stem}.partial-*"):
+                shutil.rmtree(leftover, ignore_errors=True)
+            shutil.rmtree(path.with_suffix(".partial"), ignore_errors=True)
+            # Another process may have cloned it while this one waited
+            if path.exists():
+                self._zd_fetch(path, ssh_command)
+                return "repo_cache_fetch"
+            self._zd_clone_mirror(url, path, ssh_command)
+            return "repo_cache_clone"
+
+    def _zd_clone_mirror(self, url: str, path: Path, ssh_command: Optional[str]) -> None:
+        # Clone into a scratch directory so an interrupted clone never looks like a mirror
+        partial = Path(tempfile.mkdtemp(prefix=f".{path.stem}.partial-", dir=self.repo_dir))
+        try:
+            git.Repo.clone_from(url, str(partial), multi_options=['--mirror'],
+                                env=self._zd_env(ssh_command) or None)
+            partial.rename(path)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+    def _zd_fetch(self, path: Path, ssh_command: Optional[str]) -> None:
+        repo = git.Repo(str(path))
+        with repo.git.custom_environment(**self._zd_env(ssh_command)):
+            repo.git.remote('update', '--prune')
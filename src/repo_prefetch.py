@@ -0,0 +1,53 @@
+import asyncio
+from typing import Dict, Optional
+from audit_logger import ZDLogger
+from repo_cache import ZDRepoCache, zd_resolve_repo_url
+from ssh_transport import ZDSSHTransport, zd_git_ssh_command
+
+class ZDPrefetcher:
+    """Fetches every repository in the plan into the mirror cache as steps are added.
+
+    Executor clones of a prefetched repository are then served from the
+    local mirror, so clone time overlaps with the operator's review.
+    """
+
+    def __init__(self, repo_cache: ZDRepoCache, audit_logger: ZDLogger,
+                 ssh_transport: Optional[ZDSSHTransport] = None, max_concurrent: int = 4):
+        self.repo_cache = repo_cache
+        self.audit_logger = audit_logger
+        self.ssh_transport = ssh_transport
+        self.status: Dict[str, str] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._limit = asyncio.Semaphore(max_concurrent)
+
+    def zd_prefetch(self, step) -> None:
+        """Start fetching a step's repository unless it is already in flight or done."""
+        url = zd_resolve_repo_url(step.repo_url)
+        task = self._tasks.get(url)
+        # Retry failures each time a step using the repo is added
+        if task and self.status.get(url) != "failed":
+            return
+        ssh_command = zd_git_ssh_command(self.ssh_transport, step.repo_url, step.ssh_key)
+        self.status[url] = "queued"
+        self._tasks[url] = asyncio.create_task(self._zd_fetch(url, ssh_command))
+
+    async def _zd_fetch(self, url: str, ssh_command: Optional[str]) -> None:
+        async with self._limit:
+            self.status[url] = "fetching"
+            try:
+                await self.repo_cache.zd_mirror(url, ssh_command)
+                self.status[url] = "ready"
+            except Exception as e:
+                self.status[url] = "failed"
+                await self.audit_logger.zd_log_action("prefetch_error", f"{url}: {str(e)}")
+
+    def zd_summary(self) -> str:
+        """One-line summary of prefetch progress for display."""
+        if not self.status:
+            return "Prefetch: no repositories"
+        counts: Dict[str, int] = {}
+        for state in self.status.values():
+            counts[state] = counts.get(state, 0) + 1
+        parts = [f"{counts[state]} {state}" for state in ("ready", "fetching", "queued", "failed")
+                 if counts.get(state)]
+        return f"Prefetch ({len(self.status)} repositories): " + ", ".join(parts)
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+@dataclass
+class ZDResourceLimit:
+    """A named resource: units steps may hold at once, and/or a token bucket refilled rate times per period.
+
+    Resources not configured under limits are locks: one unit, held by one step at a time.
+    """
+    name: str
+    capacity: Optional[float] = 1
+    rate: Optional[float] = None
+    period: float = 1.0
+    burst: Optional[float] = None
+    in_use: float = 0.0
+    tokens: float = 0.0
+    refilled: float = field(default_factory=time.monotonic)
+    holders: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_spec(cls, name: str, spec) -> 'ZDResourceLimit':
+        """A limit from its config entry: a capacity, or {capacity, rate, period, burst}."""
+        if not isinstance(spec, dict):
+            spec = {"capacity": spec}
+        unknown = set(spec) - {"capacity", "rate", "period", "burst"}
+        if unknown:
+            raise ValueError(f"Limit '{name}': unknown settings {', '.join(sorted(unknown))}")
+        for key in ("capacity", "rate", "period", "burst"):
+            value = spec.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                raise ValueError(f"Limit '{name}': {key} must be a positive number")
+        if spec.get("capacity") is None and spec.get("rate") is None:
+            raise ValueError(f"Limit '{name}' needs a capacity or a rate")
+        rate = spec.get("rate")
+        burst = spec.get("burst") or rate
+        return cls(name, spec.get("capacity"), rate, spec.get("period") or 1.0, burst, tokens=burst or 0.0)
+
+    def zd_refill(self) -> None:
+        if self.rate is None:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate / self.period)
+        self.refilled = now
+
+    def zd_problem(self, amount: float) -> Optional[str]:
+        """Why a claim of amount could never be granted, if it couldn't."""
+        if self.capacity is not None and amount > self.capacity:
+            return f"claims {amount:g} of '{self.name}', which has a capacity of {self.capacity:g}"
+        if self.rate is not None and amount > self.burst:
+            return f"claims {amount:g} of '{self.name}', more than its burst of {self.burst:g}"
+        return None
+
+    def zd_available(self, amount: float) -> bool:
+        self.zd_refill()
+        if self.capacity is not None and self.in_use + amount > self.capacity:
+            return False
+        return self.rate is None or self.tokens >= amount
+
+    def zd_refill_wait(self, amount: float) -> Optional[float]:
+        """Seconds until the bucket holds amount tokens; None without a rate limit."""
+        if self.rate is None or self.tokens >= amount:
+            return None
+        return (amount - self.tokens) * self.period / self.rate
+
+@dataclass
+class ZDResourceLease:
+    """Resources granted to one step, returned with ZDResourceLimits.zd_release."""
+    holder: str
+    claims: Dict[str, float]
+    released: bool = False
+
+class ZDResourceLimits:
+    """Named resource locks and rate limits that steps claim before they start.
+
+    A step's claims are granted all at once, so no step holds part of what it
+    needs while waiting for the rest. Waiters are served in arrival order: a
+    step only goes ahead of earlier waiters it shares no resource with.
+    Capacity is returned when the step ends; tokens taken from a rate limit
+    are not. Shared by a session, so concurrent runs honour the same limits.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self._limits: Dict[str, ZDResourceLimit] = {}
+        for name, spec in config.resource_limits:
+            try:
+                self._limits[name] = ZDResourceLimit.from_spec(name, spec)
+            except ValueError:
+                # Preflight reports it for the steps claiming it; until then it is a lock
+                continue
+        self._waiting: List[Tuple[object, Dict[str, float]]] = []
+        self._changed = asyncio.Event()
+
+    @staticmethod
+    def zd_problems(claims, config: ZDConfig) -> List[str]:
+        """Problems with a step's resource claims, for preflight."""
+        if not isinstance(claims, dict):
+            return ["resources must be a mapping of resource name to amount"]
+        specs = dict(config.resource_limits)
+        problems = []
+        for name, amount in claims.items():
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+                problems.append(f"Claim on '{name}' must be a positive number")
+                continue
+            try:
+                limit = ZDResourceLimit.from_spec(name, specs[name]) if name in specs else ZDResourceLimit(name)
+            except ValueError as e:
+                problems.append(str(e))
+                continue
+            problem = limit.zd_problem(amount)
+            if problem:
+                problems.append(problem[0].upper() + problem[1:])
+        return problems
+
+    def zd_try_acquire(self, claims: Dict[str, float], holder: str) -> Optional[ZDResourceLease]:
+        """Grant the claims now if they are free and no earlier waiter needs them; None otherwise."""
+        claims = {name: float(amount) for name, amount in claims.items()}
+        if self._zd_queued_before(None, claims) or not self._zd_grantable(claims):
+            return None
+        return self._zd_take(claims, holder)
+
+    async def zd_acquire(self, claims: Dict[str, float], holder: str) -> ZDResourceLease:
+        """Wait until every claim can be granted together, then grant them."""
+        claims = {name: float(amount) for name, amount in claims.items()}
+        ticket = object()
+        self._waiting.append((ticket, claims))
+        try:
+            while self._zd_queued_before(ticket, claims) or not self._zd_grantable(claims):
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), self._zd_refill_wait(claims))
+                except asyncio.TimeoutError:
+                    pass
+            return self._zd_take(claims, holder)
+        finally:
+            self._waiting = [(t, c) for t, c in self._waiting if t is not ticket]
+            # The next waiter in line may go now
+            self._zd_notify()
+
+    def zd_release(self, lease: ZDResourceLease) -> None:
+        """Return a lease's capacity."""
+        if lease.released:
+            return
+        lease.released = True
+        for name, amount in lease.claims.items():
+            limit = self._zd_limit(name)
+            if limit.capacity is not None:
+                limit.in_use -= amount
+            remaining = limit.holders.get(lease.holder, 0.0) - amount
+            if remaining > 0:
+                limit.holders[lease.holder] = remaining
+            else:
+                limit.holders.pop(lease.holder, None)
+        self._zd_notify()
+
+    def zd_blockers(self, claims: Dict[str, float]) -> List[str]:
+        """What keeps the claims from being granted now, e.g. "tfstate/prod (held by step 2 (plan))"."""
+        blockers = []
+        for name, amount in claims.items():
+            limit = self._zd_limit(name)
+            if limit.capacity is not None and limit.in_use + amount > limit.capacity:
+                blockers.append(f"{name} (held by {', '.join(limit.holders) or 'another run'})")
+            elif not limit.zd_available(amount):
+                blockers.append(f"{name} (rate limit, {limit.zd_refill_wait(amount):.1f}s)")
+            elif any(name in earlier for _, earlier in self._waiting):
+                blockers.append(f"{name} (queued)")
+        return blockers
+
+    def _zd_limit(self, name: str) -> ZDResourceLimit:
+        if name not in self._limits:
+            self._limits[name] = ZDResourceLimit(name)
+        return self._limits[name]
+
+    def _zd_queued_before(self, ticket: Optional[object], claims: Dict[str, float]) -> bool:
+        """Whether an earlier waiter (any, for a new request) needs one of the same resources."""
+        for waiting, earlier in self._waiting:
+            if waiting is ticket:
+                return False
+            if claims.keys() & earlier.keys():
+                return True
+        return False
+
+    def _zd_grantable(self, claims: Dict[str, float]) -> bool:
+        return all(self._zd_limit(name).zd_available(amount) for name, amount in claims.items())
+
+    def _zd_refill_wait(self, claims: Dict[str, float]) -> Optional[float]:
+        waits = [self._zd_limit(name).zd_refill_wait(amount) for name, amount in claims.items()]
+        waits = [wait for wait in waits if wait is not None]
+        return max(waits) if waits else None
+
+    def _zd_take(self, claims: Dict[str, float], holder: str) -> ZDResourceLease:
+        for name, amount in claims.items():
+            limit = self._zd_limit(name)
+            if limit.capacity is not None:
+                limit.in_use += amount
+            if limit.rate is not None:
+                limit.tokens -= amount
+            limit.holders[holder] = limit.holders.get(holder, 0.0) + amount
+        return ZDResourceLease(holder, claims)
+
+    def _zd_notify(self) -> None:
+        # Wakes everyone waiting on the current event; later waiters get a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
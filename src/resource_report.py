@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from audit_logger import ZDLogger
+
+# Runs a step script and writes the script's own rusage (from wait4) to argv[1].
+# SIGTERM/SIGINT reach the script through its process group; the wrapper
+# outlives it to report, then exits the way the script did.
+RUSAGE_WRAPPER = """
+import json, os, signal, sys
+pid = os.fork()
+if pid == 0:
+    os.execv(sys.argv[2], sys.argv[2:])
+forwarded = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+for sig in forwarded:
+    signal.signal(sig, signal.SIG_IGN)
+while True:
+    try:
+        _, status, usage = os.wait4(pid, 0)
+        break
+    except InterruptedError:
+        pass
+with open(sys.argv[1], "w") as f:
+    json.dump({"user": usage.ru_utime, "sys": usage.ru_stime, "max_rss_kb": usage.ru_maxrss,
+               "major_faults": usage.ru_majflt, "read_blocks": usage.ru_inblock,
+               "write_blocks": usage.ru_oublock}, f)
+code = os.waitstatus_to_exitcode(status)
+if code < 0:
+    # Only the ignored signals need their default back; SIGKILL's can't be set
+    if -code in forwarded:
+        signal.signal(-code, signal.SIG_DFL)
+    os.kill(os.getpid(), -code)
+sys.exit(code)
+"""
+
+# Source files attributed to each component in heap reports
+COMPONENTS = {
+    "executor": ("deployment_executor.py", "line_reader.py", "output_store.py", "workspace_pool.py",
+                 "repo_cache.py", "concurrency_governor.py", "preflight.py", "session_recording.py",
+                 "tool_cache.py", "output_classifier.py", "python_pool.py", "env_resolver.py", "aws_credentials.py",
+                 "shared_checkout.py", "event_bus.py", "resource_limits.py"),
+    "logger": ("audit_logger.py", "audit_sink.py"),
+    "widgets": ("/textual/", "/rich/"),
+}
+
+@dataclass
+class ZDPhaseReport:
+    """Python heap state at the end of a phase of a run."""
+    name: str
+    current_kb: float
+    peak_kb: float
+    components_kb: Dict[str, float]
+    top_sites: List[Tuple[str, float, int]]
+
+@dataclass
+class ZDStepResources:
+    """Resources one step used: its script's rusage and the executor's heap growth."""
+    name: str
+    duration: float
+    heap_delta_kb: float
+    usage: Optional[dict] = None
+    usage_exact: bool = True
+
+class ZDResourceMonitor:
+    """Opt-in per-run accounting of Python heap (tracemalloc) and step script resources."""
+
+    def __init__(self, top: int = 10, frames: int = 10):
+        self.top = top
+        self.frames = frames
+        self.phases: List[ZDPhaseReport] = []
+        self.steps: List[ZDStepResources] = []
+        self._owns_tracing = False
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def zd_start(self) -> None:
+        """Start tracing (unless something else already is) and take the baseline snapshot."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracing = True
+        tracemalloc.reset_peak()
+        self._previous = self._zd_snapshot()
+
+    def zd_stop(self) -> None:
+        """Stop tracing if this monitor started it."""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        self._previous = None
+
+    async def zd_phase(self, name: str) -> None:
+        """Snapshot the heap and record what grew since the previous phase."""
+        if self._previous is None:
+            return
+        snapshot = await asyncio.to_thread(self._zd_snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        diff = await asyncio.to_thread(snapshot.compare_to, self._previous, "lineno")
+        top_sites = [
+            (f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             stat.size_diff / 1024, stat.count_diff)
+            for stat in diff[:self.top] if stat.size_diff > 0
+        ]
+        components = await asyncio.to_thread(self._zd_components, snapshot)
+        self.phases.append(ZDPhaseReport(name, current / 1024, peak / 1024, components, top_sites))
+        self._previous = snapshot
+
+    @staticmethod
+    def zd_heap_kb() -> float:
+        """Bytes currently traced, in KB (0 when tracing is off)."""
+        return tracemalloc.get_traced_memory()[0] / 1024
+
+    def zd_record_step(self, step, duration: float, heap_before_kb: float,
+                       usage: Optional[dict], usage_exact: bool = True) -> None:
+        """Record a finished step's script usage and the heap growth during it."""
+        self.steps.append(ZDStepResources(
+            step.name, duration, self.zd_heap_kb() - heap_before_kb, usage, usage_exact
+        ))
+
+    @staticmethod
+    def zd_usage_file() -> Path:
+        """A fresh file for the rusage wrapper to report into."""
+        fd, path = tempfile.mkstemp(prefix="zdrusage_", suffix=".json")
+        os.close(fd)
+        return Path(path)
+
+    @staticmethod
+    def zd_read_usage(path: Path) -> Optional[dict]:
+        """Read and remove a wrapper's report; None if the wrapper was killed first."""
+        try:
+            text = path.read_text()
+            path.unlink()
+        except OSError:
+            return None
+        return json.loads(text) if text else None
+
+    def zd_report(self) -> List[str]:
+        """The report as display lines."""
+        lines = ["=== Resource Report ==="]
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        lines.append(f"ZenDeploy process: max_rss={self_usage.ru_maxrss}KB "
+                     f"user={self_usage.ru_utime:.2f}s sys={self_usage.ru_stime:.2f}s")
+        for phase in self.phases:
+            components = " ".join(f"{name}={kb:.0f}KB" for name, kb in phase.components_kb.items())
+            lines.append(f"Phase {phase.name}: heap={phase.current_kb:.0f}KB "
+                         f"peak={phase.peak_kb:.0f}KB | {components}")
+            for site, size_kb, count in phase.top_sites:
+                lines.append(f"    +{size_kb:.1f}KB ({count:+d} blocks) {site}")
+        for step in self.steps:
+            usage = step.usage
+            if usage:
+                if "max_rss_kb" in usage:
+                    rss = f"max_rss={usage['max_rss_kb']}KB"
+                else:
+                    rss = f"session_peak_rss={usage['session_max_rss_kb']}KB"
+                note = "" if step.usage_exact else " (approximate)"
+                script = f"user={usage['user']:.2f}s sys={usage['sys']:.2f}s {rss}{note}"
+            else:
+                script = "script usage unavailable"
+            lines.append(f"Step {step.name}: {step.duration:.1f}s {script} "
+                         f"heap_delta={step.heap_delta_kb:+.0f}KB")
+        return lines
+
+    def zd_write(self, audit_logger: ZDLogger) -> Path:
+        """Write the report beside the session log and return its path."""
+        log_file = audit_logger.log_file
+        fd, path = tempfile.mkstemp(prefix=f"{log_file.stem}_resources_", suffix=".txt",
+                                    dir=log_file.parent)
+        with os.fdopen(fd, "w") as f:
+            f.write(f"Generated: {time.strftime('%Y-%m-%dT%H:%M:%S')}\n")
+            f.write("\n".join(self.zd_report()) + "\n")
+        return Path(path)
+
+    def _zd_snapshot(self) -> tracemalloc.Snapshot:
+        # Leave out the tracer's and this report's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    @staticmethod
+    def _zd_components(snapshot: tracemalloc.Snapshot) -> Dict[str, float]:
+        """Heap per component, attributing each block to the innermost frame that names one."""
+        totals = {name: 0.0 for name in COMPONENTS}
+        totals["other"] = 0.0
+        for stat in snapshot.statistics("traceback"):
+            owner = None
+            for frame in reversed(stat.traceback):
+                owner = next((name for name, markers in COMPONENTS.items()
+                              if any(marker in frame.filename for marker in markers)), None)
+                if owner:
+                    break
+            totals[owner or "other"] += stat.size / 1024
+        return totals
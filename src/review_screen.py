@@ -29,7 +29,7 @@ class ReviewScreen(Screen):
             for i, step in enumerate(steps, 1):
                 preview_container.mount(Static(f"Step {i}: {step.name}", classes="preview-step"))
                 preview_container.mount(Static(f"  File: {step.file_path}", classes="preview-detail"))
-                preview_container.mount(Static(f"  Script: {step.script_path}", classes="preview-detail"))
+                preview_container.mount(Static(f"  Script: {step.command}", classes="preview-detail"))
                 preview_container.mount(Static("", classes="preview-spacer"))
 
             # Populate environment variables in right pane
@@ -41,7 +41,7 @@ class ReviewScreen(Screen):
                     "AWS Profile": step.aws_profile,
                     "Repository": step.repo_url,
                     "SSH Key": step.ssh_key,
-                    "Script": step.script_path,
+                    "Script": step.command,
                 }
                 for key, value in env_vars.items():
                     env_container.mount(Static(f"  {key}: {value}", classes="env-item"))
@@ -63,7 +63,7 @@ class ReviewScreen(Screen):
                     str(step.order + 1),
                     step.name,
                     step.aws_profile,
-                    step.script_path
+                    step.command
                 )
             yield steps_table
 
@@ -0,0 +1,127 @@
+import hashlib
+import sqlite3
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+# Successful runs of a step considered when estimating its duration
+HISTORY_SAMPLES = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    steps INTEGER NOT NULL,
+    outcome TEXT
+);
+CREATE TABLE IF NOT EXISTS step_runs (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    fingerprint TEXT NOT NULL,
+    name TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    clone_seconds REAL,
+    output_bytes INTEGER NOT NULL,
+    output_lines INTEGER NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS step_runs_fingerprint ON step_runs (fingerprint, started_at);
+"""
+
+def zd_step_fingerprint(step) -> str:
+    """Identify a step across runs by what it deploys, not by its position in the plan."""
+    identity = "\0".join((step.name, step.repo_url, step.command, step.aws_profile))
+    return hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+def zd_format_duration(seconds: float) -> str:
+    """Compact duration such as 45s, 3m12s or 1h05m."""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+class ZDRunHistory:
+    """Local SQLite record of past runs and per-step timings.
+
+    Methods are synchronous and serialized by a lock, so callers on the
+    event loop run them through asyncio.to_thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def for_config(cls, config) -> Optional['ZDRunHistory']:
+        """Open the configured history database, or None when history is disabled."""
+        if not config.history_store:
+            return None
+        return cls(config.history_path or Path(config.cache_dir).expanduser() / "history.sqlite")
+
+    def zd_start_run(self, steps: int) -> int:
+        """Record the start of a run and return its id."""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO runs (started_at, steps) VALUES (?, ?)", (time.time(), steps)
+            )
+            return cursor.lastrowid
+
+    def zd_finish_run(self, run_id: int, outcome: str) -> None:
+        """Record how a run ended."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE runs SET finished_at = ?, outcome = ? WHERE id = ?",
+                (time.time(), outcome, run_id)
+            )
+
+    def zd_record_step(self, run_id: int, step, started_at: float, duration: float,
+                       clone_seconds: Optional[float], output_bytes: int, output_lines: int,
+                       outcome: str) -> None:
+        """Store the timing and outcome of one step execution."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO step_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, zd_step_fingerprint(step), step.name, started_at, duration,
+                 clone_seconds, output_bytes, output_lines, outcome)
+            )
+
+    def zd_durations(self, fingerprint: str) -> list:
+        """Durations of the most recent successful runs of a step, newest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT duration FROM step_runs WHERE fingerprint = ? AND outcome = 'succeeded'"
+                " ORDER BY started_at DESC LIMIT ?",
+                (fingerprint, HISTORY_SAMPLES)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def zd_estimates(self, steps: Iterable) -> Dict[int, float]:
+        """Expected duration (median of recent successes) per step order, where known."""
+        estimates = {}
+        for step in steps:
+            durations = self.zd_durations(zd_step_fingerprint(step))
+            if durations:
+                estimates[step.order] = statistics.median(durations)
+        return estimates
+
+    def zd_baseline(self, step, min_samples: int = 3) -> Optional[float]:
+        """Median duration of a step, or None with too little history to judge it."""
+        durations = self.zd_durations(zd_step_fingerprint(step))
+        if len(durations) < min_samples:
+            return None
+        return statistics.median(durations)
+
+    def zd_close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,118 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+from audit_logger import ZDLogger
+
+RECORDING_VERSION = 2
+
+# Version 1 recordings carry no states; theirs are read from the executor's markers in the raw text
+_V1_MARKERS = re.compile(
+    r"^=== (?:Step \d+(?P<step> Waiting for |: | Completed Successfully ===| Failed\b)|Preflight(?P<preflight> Failed\b))",
+    re.MULTILINE
+)
+_V1_STATES = {
+    " Waiting for ": "waiting", ": ": "running", " Completed Successfully ===": "succeeded", " Failed": "failed"
+}
+
+@dataclass
+class ZDReplayStep:
+    """The parts of a recorded step the progress screen needs."""
+    order: int
+    name: str
+
+class ZDSessionRecorder:
+    """Writes an executor's output stream to a gzip'd, timestamped session file.
+
+    The first line is a JSON header describing the plan; each following line is
+    a compact [seconds since start, step order or null, formatted, raw] array,
+    followed by the states the output reports when there are any.
+    """
+
+    def __init__(self, path: Path, steps):
+        self.path = Path(path)
+        self._file = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=6)
+        self._start = time.monotonic()
+        self.events = 0
+        header = {
+            "version": RECORDING_VERSION,
+            "recorded_at": time.time(),
+            "steps": [{"order": step.order, "name": step.name} for step in steps],
+        }
+        self._file.write(json.dumps(header) + "\n")
+
+    @classmethod
+    def for_session(cls, audit_logger: ZDLogger, steps) -> 'ZDSessionRecorder':
+        """Create a new recording beside the session log; each run gets its own file."""
+        fd, path = tempfile.mkstemp(prefix=f"{audit_logger.log_file.stem}_",
+                                    suffix=".zdrec.gz", dir=audit_logger.log_file.parent)
+        os.close(fd)
+        return cls(Path(path), steps)
+
+    def zd_record(self, step, output: Tuple[str, str], states: Tuple[str, ...] = ()) -> None:
+        """Append one (formatted, raw) output of a step (None for plan-level messages)."""
+        if self._file.closed:
+            return
+        offset = round(time.monotonic() - self._start, 3)
+        order = step.order if step is not None else None
+        entry = [offset, order, output[0], output[1]] + ([list(states)] if states else [])
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.events += 1
+
+    def zd_close(self) -> None:
+        """Finish the gzip stream; later records are ignored."""
+        if not self._file.closed:
+            self._file.close()
+
+class ZDSessionReplay:
+    """Plays a session recording back as the (step, formatted, raw, states) stream the UI consumes."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+        self.version = header.get("version")
+        if self.version not in (1, RECORDING_VERSION):
+            raise ValueError(f"Unsupported recording version in {self.path}: {self.version}")
+        self.steps: List[ZDReplayStep] = [ZDReplayStep(s["order"], s["name"]) for s in header["steps"]]
+        self.events = 0
+        self.elapsed = 0.0
+
+    async def zd_replay(self, speed: Optional[float] = 1.0) -> AsyncGenerator[tuple, None]:
+        """Yield recorded output, paced at speed times real time, or as fast as possible if None."""
+        by_order: Dict[int, ZDReplayStep] = {step.order: step for step in self.steps}
+        self.events = 0
+        start = time.monotonic()
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                offset, order, formatted, raw, *states = json.loads(line)
+                states = tuple(states[0]) if states else ()
+                if self.version == 1:
+                    states = self._zd_v1_states(order, raw)
+                if speed:
+                    delay = offset / speed - (time.monotonic() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    # Still hand control to the UI between events, as a live run would
+                    await asyncio.sleep(0)
+                self.events += 1
+                yield by_order.get(order), formatted, raw, states
+        self.elapsed = time.monotonic() - start
+
+    @staticmethod
+    def _zd_v1_states(order: Optional[int], raw: str) -> Tuple[str, ...]:
+        states = []
+        for match in _V1_MARKERS.finditer(raw):
+            if match.group("preflight") and order is None:
+                states.append("failed")
+            elif match.group("step") and order is not None:
+                states.append(_V1_STATES[match.group("step")])
+        return tuple(states)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import git
+from audit_logger import ZDLogger
+from repo_cache import zd_resolve_repo_url
+from workspace_pool import ZDWorkspacePool
+
+@dataclass
+class ZDSharedTree:
+    """One repository checked out once for a run, and how many of its steps still need it."""
+    users: int
+    directory: Optional[Path] = None
+    commit: Optional[str] = None
+    ready: Optional[asyncio.Task] = None
+    released: bool = False
+
+class ZDSharedCheckouts:
+    """Clones each repository several steps of a run use once, and gives each step a git worktree of it.
+
+    The first step to check out a shared repository clones it into a workspace
+    of its own; every step using that repository (the first included) then
+    gets a detached worktree of the same commit in its step workspace, which
+    only writes the files - no clone, fetch or object copy. The shared clone is
+    released once the last step using it has finished.
+    """
+
+    def __init__(self, steps, workspace_pool: ZDWorkspacePool, audit_logger: ZDLogger,
+                 clone: Callable[..., Awaitable[Optional[git.Repo]]]):
+        self.workspace_pool = workspace_pool
+        self.audit_logger = audit_logger
+        self._clone = clone
+        users = Counter(self.zd_key(step) for step in steps)
+        # Repositories used by a single step are cloned straight into its workspace as before
+        self._trees: Dict[Tuple[str, Optional[str]], ZDSharedTree] = {
+            key: ZDSharedTree(count) for key, count in users.items() if count > 1
+        }
+
+    @staticmethod
+    def zd_key(step) -> Tuple[str, Optional[str]]:
+        # Steps with different keys may not be able to read each other's clone
+        return zd_resolve_repo_url(step.repo_url), step.ssh_key
+
+    def zd_shares(self, step) -> bool:
+        """Whether the step's repository is checked out once for several steps."""
+        return self.zd_key(step) in self._trees
+
+    @property
+    def shared(self) -> int:
+        """Number of repositories shared between steps of the run."""
+        return len(self._trees)
+
+    async def zd_checkout(self, step, directory: Path) -> Optional[git.Repo]:
+        """Add a worktree of the step's shared clone at directory (which must be empty)."""
+        tree = self._trees[self.zd_key(step)]
+        if tree.ready is None:
+            tree.ready = asyncio.create_task(self._zd_clone_tree(step, tree))
+        if not await asyncio.shield(tree.ready):
+            return None
+        try:
+            base = git.Repo(str(tree.directory))
+            await asyncio.to_thread(base.git.worktree, "add", "--detach", str(directory), tree.commit)
+        except Exception as e:
+            await self.audit_logger.zd_log_action("repo_clone_error", f"Worktree for {directory} failed: {e}")
+            return None
+        await self.audit_logger.zd_log_action(
+            "command", f"$ git worktree add --detach {directory} {tree.commit}"
+        )
+        return git.Repo(str(directory))
+
+    async def zd_release(self, step) -> None:
+        """A step is done with its worktree; the shared clone goes when no step needs it."""
+        tree = self._trees.get(self.zd_key(step))
+        if tree is None:
+            return
+        tree.users -= 1
+        if tree.users <= 0:
+            await self._zd_release_tree(tree)
+
+    async def zd_close(self) -> None:
+        """Release every shared clone, including those of steps that never ran."""
+        for tree in self._trees.values():
+            await self._zd_release_tree(tree)
+
+    async def _zd_clone_tree(self, step, tree: ZDSharedTree) -> bool:
+        started = time.monotonic()
+        try:
+            tree.directory = await self.workspace_pool.zd_acquire(f"repo_{step.order}")
+        except Exception as e:
+            await self.audit_logger.zd_log_action("repo_clone_error", f"Could not get a workspace: {e}")
+            return False
+        repo = await self._clone(step, tree.directory)
+        if repo is not None:
+            try:
+                tree.commit = await asyncio.to_thread(lambda: repo.head.commit.hexsha)
+            except Exception as e:
+                await self.audit_logger.zd_log_action("repo_clone_error", f"No commit checked out: {e}")
+        if tree.commit is None:
+            # Every step of the repository reports the failed clone
+            await self.workspace_pool.zd_release(tree.directory)
+            tree.directory = None
+            return False
+        await self.audit_logger.zd_log_action(
+            "shared_checkout",
+            f"{step.repo_url} at {tree.commit[:12]} for {tree.users} steps ({time.monotonic() - started:.2f}s)"
+        )
+        return True
+
+    async def _zd_release_tree(self, tree: ZDSharedTree) -> None:
+        if tree.released:
+            return
+        tree.released = True
+        if tree.ready and not tree.ready.done():
+            tree.ready.cancel()
+            try:
+                await tree.ready
+            except asyncio.CancelledError:
+                pass
+        if tree.directory:
+            # Worktrees of steps still kept for debugging keep their files but lose their git metadata
+            await self.workspace_pool.zd_release(tree.directory)
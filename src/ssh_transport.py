@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+# scp-style Git URLs: [user@]host:path
+_SCP_URL = re.compile(r"^(?:(?P<user>[^@/]+)@)?(?P<host>[^:/]+):(?!//)")
+
+class ZDSSHTransport:
+    """Shared SSH connections for Git operations within a session.
+
+    Each distinct (host, key) pair gets one ControlMaster socket, so every
+    clone and fetch after the first reuses an authenticated connection
+    instead of paying a full handshake. Sockets are torn down by zd_close.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self.control_dir: Optional[Path] = None
+        self._masters: Dict[Tuple[str, str], Tuple[str, Path]] = {}
+
+    @staticmethod
+    def zd_ssh_destination(url: str) -> Optional[Tuple[str, Optional[int]]]:
+        """Return ([user@]host, port) for SSH Git URLs, or None for other transports."""
+        if url.startswith("ssh://") or url.startswith("git+ssh://"):
+            parsed = urlparse(url)
+            user = f"{parsed.username}@" if parsed.username else ""
+            return f"{user}{parsed.hostname}", parsed.port
+        if "://" in url or url.startswith("/") or url.startswith("."):
+            return None
+        match = _SCP_URL.match(url)
+        if match:
+            user = f"{match.group('user')}@" if match.group("user") else ""
+            return f"{user}{match.group('host')}", None
+        return None
+
+    def zd_ssh_command(self, url: str, ssh_key: str) -> Optional[str]:
+        """Return a GIT_SSH_COMMAND that multiplexes over the session's master for this host."""
+        destination = self.zd_ssh_destination(url)
+        if destination is None:
+            return None
+        key = os.path.expanduser(ssh_key) if ssh_key else ""
+        host, port = destination
+        identity = (f"{host}:{port or 22}", key)
+        if self.control_dir is None:
+            # Socket paths are length-limited (~104 bytes), so keep the directory short
+            self.control_dir = Path(tempfile.mkdtemp(prefix="zdssh_"))
+        if identity not in self._masters:
+            digest = hashlib.sha1("|".join(identity).encode()).hexdigest()[:12]
+            self._masters[identity] = (host, self.control_dir / digest)
+        control_path = self._masters[identity][1]
+        return (
+            f"ssh{_zd_identity_option(key)}"
+            f" -o ControlMaster=auto"
+            f" -o ControlPath={shlex.quote(str(control_path))}"
+            f" -o ControlPersist={self.config.ssh_control_persist}"
+        )
+
+    async def zd_close(self) -> None:
+        """Stop every master connection and remove the socket directory."""
+        for host, control_path in self._masters.values():
+            if not control_path.exists():
+                continue
+            process = await asyncio.create_subprocess_exec(
+                "ssh", "-o", f"ControlPath={control_path}", "-O", "exit", host,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            await process.wait()
+            await self.audit_logger.zd_log_action("ssh_master_closed", host)
+        self._masters.clear()
+        if self.control_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+            self.control_dir = None
+
+def _zd_identity_option(ssh_key: str) -> str:
+    """The ssh -i option for a key path (empty without one), quoted for GIT_SSH_COMMAND's shell."""
+    return f" -i {shlex.quote(os.path.expanduser(ssh_key))}" if ssh_key else ""
+
+def zd_git_ssh_command(transport: Optional[ZDSSHTransport], repo_url: str, ssh_key: str) -> Optional[str]:
+    """Return the GIT_SSH_COMMAND for a repository, shared through transport when given."""
+    if ZDSSHTransport.zd_ssh_destination(repo_url) is None:
+        return None
+    if transport:
+        return transport.zd_ssh_command(repo_url, ssh_key)
+    return f"ssh{_zd_identity_option(ssh_key)}" if ssh_key else None
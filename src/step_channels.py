@@ -0,0 +1,96 @@
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+
+def zd_format_bytes(count: float) -> str:
+    """Compact size such as 512B, 3.4K or 12.0M."""
+    if count < 1024:
+        return f"{int(count)}B"
+    for unit in ("K", "M", "G"):
+        count /= 1024
+        if count < 1024 or unit == "G":
+            return f"{count:.1f}{unit}"
+
+class ZDStepChannel:
+    """One step's output on the progress screen: a bounded tail for the detail pane and a summary row.
+
+    Appending only updates the summary and the tail; nothing is rendered until
+    the screen shows the channel. Run-level output has a channel with key None.
+    State comes from the executor's status events, never from the output text.
+    """
+
+    def __init__(self, key: Optional[int], name: str, maxlen: int):
+        self.key = key
+        self.name = name
+        self.formatted: Deque[str] = deque(maxlen=maxlen)
+        self.raw: Deque[str] = deque(maxlen=maxlen)
+        self.state = "pending" if key is not None else ""
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.last_line = ""
+        self.bytes = 0
+        # Summary changed since the screen last drew it
+        self.dirty = True
+
+    def zd_append(self, formatted: str, raw: str, states: Sequence[str] = ()) -> bool:
+        """Add output and the state changes it reports; True if it started the step (again, for re-runs)."""
+        self.formatted.append(formatted)
+        self.dirty = True
+        started = False
+        if self.key is not None:
+            for state in states:
+                self.state = state
+                if self.state == "running":
+                    started = True
+                    self.started, self.finished = time.monotonic(), None
+                    self.bytes = 0
+                elif self.state == "waiting":
+                    self.started = self.finished = None
+                else:
+                    self.finished = time.monotonic()
+        if not raw:
+            return started
+        self.raw.append(raw)
+        self.bytes += len(raw.encode(errors="replace"))
+        line = raw.rstrip("\n").rpartition("\n")[2].strip()
+        if line:
+            self.last_line = line
+        return started
+
+    def zd_elapsed(self) -> Optional[float]:
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+class ZDStepChannels:
+    """Every step's channel, in plan order, plus the run-level one."""
+
+    def __init__(self, steps, maxlen: int):
+        self.maxlen = maxlen
+        self.channels: Dict[Optional[int], ZDStepChannel] = {None: ZDStepChannel(None, "Run", maxlen)}
+        for step in steps:
+            self.channels[step.order] = ZDStepChannel(step.order, step.name, maxlen)
+
+    def zd_route(self, step, formatted: str, raw: str,
+                 states: Sequence[str] = ()) -> tuple[ZDStepChannel, bool]:
+        """Append output to its step's channel; returns the channel and whether the step started."""
+        key = step.order if step is not None else None
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = ZDStepChannel(key, step.name, self.maxlen)
+        return channel, channel.zd_append(formatted, raw, states)
+
+    def zd_changed(self) -> List[ZDStepChannel]:
+        """Channels whose summary row needs redrawing: changed ones, and running ones for their elapsed time."""
+        changed = [channel for channel in self.channels.values() if channel.dirty or channel.state == "running"]
+        for channel in changed:
+            channel.dirty = False
+        return changed
+
+    def zd_finish(self) -> None:
+        """Mark the steps a finished run never started or finished."""
+        for channel in self.channels.values():
+            if channel.state in ("pending", "waiting", "running"):
+                channel.state = "stopped" if channel.state == "running" else "not run"
+                channel.finished = channel.finished or time.monotonic()
+                channel.dirty = True
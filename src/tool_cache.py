@@ -0,0 +1,183 @@
+import asyncio
+import fcntl
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# name -> (environment variable, whether concurrent writers can corrupt it)
+BUILTIN_CACHES = {
+    "pip": ("PIP_CACHE_DIR", False),
+    "npm": ("npm_config_cache", False),
+    # Concurrent `terraform init` runs can corrupt the plugin cache
+    "terraform": ("TF_PLUGIN_CACHE_DIR", True),
+}
+
+_CACHE_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+_ENV_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+@dataclass
+class ZDCacheSpec:
+    """A cache directory a step uses and how it is shared."""
+    name: str
+    env: str
+    exclusive: bool = False
+
+@dataclass
+class ZDCacheLease:
+    """Cache directories held for one step, with the locks that guard them."""
+    env: Dict[str, str] = field(default_factory=dict)
+    names: List[str] = field(default_factory=list)
+    _fds: List[int] = field(default_factory=list)
+
+class ZDToolCaches:
+    """Persistent tool caches shared by every step and run.
+
+    Steps hold a shared lock on each cache they use, or an exclusive one for
+    caches that aren't safe for concurrent writers; pruning only touches caches
+    nobody holds. Locks are flock()s, so they also coordinate the TUI and daemon.
+    """
+
+    def __init__(self, root: Path, builtin: List[str]):
+        self.root = Path(root).expanduser()
+        self.lock_dir = self.root / ".locks"
+        self.builtin = [name for name in builtin if name in BUILTIN_CACHES]
+
+    def zd_specs(self, step) -> List[ZDCacheSpec]:
+        """The caches a step gets: the shared built-ins plus those it names under `caches`.
+
+        Exclusive built-ins (terraform) are opt-in: a step only gets them by naming them.
+        """
+        specs: Dict[str, ZDCacheSpec] = {}
+        for name in self.builtin:
+            env, exclusive = BUILTIN_CACHES[name]
+            # Exclusive built-ins would serialize every step, so only steps asking for them get them
+            if not exclusive:
+                specs[name] = ZDCacheSpec(name, env, exclusive)
+        problems = self.zd_problems(step.caches)
+        if problems:
+            raise ValueError(problems[0])
+        for entry in step.caches:
+            if isinstance(entry, str):
+                entry = {"name": entry}
+            name = entry["name"]
+            env, exclusive = BUILTIN_CACHES.get(name, (f"ZD_CACHE_{re.sub(r'[^A-Za-z0-9]', '_', name).upper()}", False))
+            specs[name] = ZDCacheSpec(name, entry.get("env", env), entry.get("exclusive", exclusive))
+        # Fixed lock order so two steps can't deadlock on each other's caches
+        return sorted(specs.values(), key=lambda spec: spec.name)
+
+    @staticmethod
+    def zd_problems(caches) -> List[str]:
+        """Schema problems in a step's caches list."""
+        if not isinstance(caches, list):
+            return ["caches must be a list of cache names or {name, env, exclusive} mappings"]
+        problems = []
+        for entry in caches:
+            name = entry.get("name") if isinstance(entry, dict) else entry
+            if not isinstance(name, str) or not _CACHE_NAME.match(name):
+                problems.append(f"'{name}' is not a valid cache name")
+            elif isinstance(entry, dict) and not _ENV_NAME.match(str(entry.get("env", "X"))):
+                problems.append(f"Cache '{name}' has an invalid env name '{entry['env']}'")
+        return problems
+
+    async def zd_acquire(self, step) -> ZDCacheLease:
+        """Lock a step's caches, waiting while another holder conflicts."""
+        lease = ZDCacheLease()
+        try:
+            for spec in self.zd_specs(step):
+                directory = self.root / spec.name
+                directory.mkdir(parents=True, exist_ok=True)
+                lease._fds.append(await self._zd_lock(spec.name, exclusive=spec.exclusive))
+                lease.env[spec.env] = str(directory)
+                lease.names.append(spec.name)
+        except BaseException:
+            self.zd_release(lease)
+            raise
+        return lease
+
+    def zd_release(self, lease: ZDCacheLease) -> None:
+        for fd in lease._fds:
+            os.close(fd)
+        lease._fds.clear()
+
+    def zd_sizes(self) -> Dict[str, float]:
+        """Size of each cache directory in megabytes."""
+        sizes = {}
+        if not self.root.exists():
+            return sizes
+        for directory in sorted(self.root.iterdir()):
+            if directory.is_dir() and directory != self.lock_dir:
+                sizes[directory.name] = self._zd_size(directory) / (1024 * 1024)
+        return sizes
+
+    def zd_prune(self, max_mb: Optional[float], max_age_days: Optional[float]) -> Dict[str, float]:
+        """Delete stale files from caches nobody is using; returns megabytes freed per cache."""
+        freed: Dict[str, float] = {}
+        if not self.root.exists():
+            return freed
+        for directory in sorted(self.root.iterdir()):
+            if not directory.is_dir() or directory == self.lock_dir:
+                continue
+            fd = self._zd_try_lock(directory.name, exclusive=True)
+            if fd is None:
+                continue
+            try:
+                files = []
+                for dirpath, _, filenames in os.walk(directory):
+                    for filename in filenames:
+                        path = os.path.join(dirpath, filename)
+                        try:
+                            info = os.lstat(path)
+                        except OSError:
+                            continue
+                        files.append((max(info.st_atime, info.st_mtime), info.st_size, path))
+                files.sort()
+                total = sum(size for _, size, _ in files)
+                cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+                limit = max_mb * 1024 * 1024 if max_mb else None
+                removed = 0
+                for used, size, path in files:
+                    stale = cutoff is not None and used < cutoff
+                    if not stale and (limit is None or total - removed <= limit):
+                        break
+                    try:
+                        os.unlink(path)
+                        removed += size
+                    except OSError:
+                        pass
+                if removed:
+                    freed[directory.name] = removed / (1024 * 1024)
+            finally:
+                os.close(fd)
+        return freed
+
+    async def _zd_lock(self, name: str, exclusive: bool) -> int:
+        # Poll rather than block a thread so a cancelled step stops waiting immediately
+        while True:
+            fd = self._zd_try_lock(name, exclusive)
+            if fd is not None:
+                return fd
+            await asyncio.sleep(0.2)
+
+    def _zd_try_lock(self, name: str, exclusive: bool) -> Optional[int]:
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_dir / f"{name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def _zd_size(directory: Path) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return total
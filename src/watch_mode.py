@@ -0,0 +1,288 @@
+import asyncio
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import struct
+from pathlib import Path
+from typing import AsyncGenerator, Dict, List, Optional, Set, Tuple
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+from repo_cache import ZDRepoCache, zd_resolve_repo_url
+from ssh_transport import ZDSSHTransport, zd_git_ssh_command
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Editors and git replace files by renaming over them, so directories are watched, not files
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")
+
+def zd_affected_steps(steps, changed: Set[int]) -> List:
+    """The changed steps plus every step that takes inputs or results from them, directly or not, in plan order."""
+    affected = set(changed)
+    names = {step.name for step in steps if step.order in affected}
+    # Inputs and results only come from earlier steps, so one pass in plan order closes the set
+    for step in steps:
+        if step.dependencies & names:
+            affected.add(step.order)
+            names.add(step.name)
+    return [step for step in steps if step.order in affected]
+
+class ZDInotify:
+    """Minimal inotify binding through libc; raises OSError where inotify is unavailable."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def zd_add(self, directory: Path, mask: int = WATCH_MASK) -> int:
+        """Watch a directory and return its watch descriptor."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+        return wd
+
+    def zd_remove(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def zd_read(self) -> List[Tuple[int, int, str]]:
+        """Pending events as (watch descriptor, mask, name)."""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def zd_close(self) -> None:
+        os.close(self.fd)
+
+class ZDWatcher:
+    """Reports which steps changed: their YAML files, or the commit their repository's HEAD points to.
+
+    Step files and local repositories are watched with inotify (falling back to
+    polling where it is unavailable); remote repositories are polled with
+    git ls-remote. Events are debounced, and a step only counts as changed when
+    its file's content or its repository's HEAD actually differs.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger,
+                 repo_cache: Optional[ZDRepoCache] = None,
+                 ssh_transport: Optional[ZDSSHTransport] = None):
+        self.config = config
+        self.audit_logger = audit_logger
+        self.repo_cache = repo_cache
+        self.ssh_transport = ssh_transport
+        try:
+            self._inotify: Optional[ZDInotify] = ZDInotify()
+        except OSError:
+            self._inotify = None
+        self._steps: list = []
+        # Last seen state: file content hash per step file, HEAD commit per repository
+        self._files: Dict[Path, Optional[str]] = {}
+        self._heads: Dict[str, Optional[str]] = {}
+        # Watched directory -> step files in it, or the repository whose git dir it belongs to
+        self._watches: Dict[int, Path] = {}
+        self._dir_files: Dict[Path, Set[Path]] = {}
+        self._dir_repos: Dict[Path, str] = {}
+        self._changed_files: Set[Path] = set()
+        self._changed_repos: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def polling(self) -> bool:
+        """Whether step files and local repositories are polled rather than watched."""
+        return self._inotify is None
+
+    async def zd_start(self, steps) -> None:
+        """Record the current state of the plan and begin watching it."""
+        if self._inotify:
+            asyncio.get_running_loop().add_reader(self._inotify.fd, self._zd_on_events)
+        await self.zd_update(steps)
+        self._poller = asyncio.create_task(self._zd_poll())
+
+    async def zd_update(self, steps) -> None:
+        """Follow a new version of the plan, keeping known state for unchanged files and repositories."""
+        self._steps = list(steps)
+        files = {Path(step.file_path).resolve() for step in self._steps}
+        urls = {zd_resolve_repo_url(step.repo_url): step for step in self._steps if step.repo_url}
+        for path in files - self._files.keys():
+            self._files[path] = await asyncio.to_thread(self._zd_hash, path)
+        for path in self._files.keys() - files:
+            del self._files[path]
+        for url, step in urls.items():
+            if url not in self._heads:
+                self._heads[url] = await self._zd_head(url, step)
+        for url in self._heads.keys() - urls.keys():
+            del self._heads[url]
+
+        directories: Dict[Path, Tuple[Set[Path], Optional[str]]] = {}
+        for path in files:
+            directories.setdefault(path.parent, (set(), None))[0].add(path)
+        for url in urls:
+            for directory in await self._zd_git_dirs(url):
+                directories[directory] = (directories.get(directory, (set(), None))[0], url)
+        self._dir_files = {directory: names for directory, (names, _) in directories.items()}
+        self._dir_repos = {directory: url for directory, (_, url) in directories.items() if url}
+        if self._inotify:
+            self._zd_rewatch(set(directories))
+
+    async def zd_changes(self) -> AsyncGenerator[Set[int], None]:
+        """Yield the orders of steps that changed, once changes have settled for the debounce period."""
+        while True:
+            await self._wakeup.wait()
+            # Saves and commits touch several files; wait for a quiet period
+            while True:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.config.watch_debounce)
+                except asyncio.TimeoutError:
+                    break
+            files, self._changed_files = self._changed_files, set()
+            repos, self._changed_repos = self._changed_repos, set()
+            changed = await self._zd_verify(files, repos)
+            if changed:
+                yield changed
+
+    def zd_close(self) -> None:
+        """Stop watching."""
+        if self._poller:
+            self._poller.cancel()
+        if self._inotify:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.zd_close()
+            self._inotify = None
+        self._watches.clear()
+
+    async def _zd_verify(self, files: Set[Path], repos: Set[str]) -> Set[int]:
+        """Filter candidate changes down to real ones and map them to step orders."""
+        changed_files = set()
+        for path in files & self._files.keys():
+            digest = await asyncio.to_thread(self._zd_hash, path)
+            if digest is not None and digest != self._files[path]:
+                self._files[path] = digest
+                changed_files.add(path)
+        changed_repos = set()
+        for url in repos & self._heads.keys():
+            step = next(s for s in self._steps if zd_resolve_repo_url(s.repo_url) == url)
+            head = await self._zd_head(url, step)
+            if head is not None and head != self._heads[url]:
+                self._heads[url] = head
+                changed_repos.add(url)
+                if self.repo_cache:
+                    # The mirror must be fetched again rather than trusted for repo_max_age
+                    self.repo_cache.zd_invalidate(url)
+        changed = {
+            step.order for step in self._steps
+            if Path(step.file_path).resolve() in changed_files
+            or zd_resolve_repo_url(step.repo_url) in changed_repos
+        }
+        if changed:
+            await self.audit_logger.zd_log_action(
+                "watch_change",
+                ", ".join([str(path) for path in sorted(changed_files)] + sorted(changed_repos))
+            )
+        return changed
+
+    def _zd_on_events(self) -> None:
+        for wd, mask, name in self._inotify.zd_read():
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; check everything
+                self._changed_files.update(self._files)
+                self._changed_repos.update(self._heads)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if directory / name in self._dir_files.get(directory, ()):
+                self._changed_files.add(directory / name)
+            if directory in self._dir_repos:
+                self._changed_repos.add(self._dir_repos[directory])
+        if self._changed_files or self._changed_repos:
+            self._wakeup.set()
+
+    async def _zd_poll(self) -> None:
+        """Check what inotify can't see: remote repositories, or everything without inotify."""
+        while True:
+            await asyncio.sleep(self.config.watch_poll_interval)
+            watched = set(self._dir_repos.values())
+            if self.polling:
+                self._changed_files.update(self._files)
+                watched = set()
+            self._changed_repos.update(url for url in self._heads if url not in watched)
+            if self._changed_files or self._changed_repos:
+                self._wakeup.set()
+
+    def _zd_rewatch(self, directories: Set[Path]) -> None:
+        current = {directory: wd for wd, directory in self._watches.items()}
+        for directory, wd in current.items():
+            if directory not in directories:
+                self._inotify.zd_remove(wd)
+                del self._watches[wd]
+        for directory in directories - current.keys():
+            try:
+                self._watches[self._inotify.zd_add(directory)] = directory
+            except OSError:
+                # Polled instead; remote repositories and vanished directories end up here
+                pass
+
+    async def _zd_git_dirs(self, url: str) -> List[Path]:
+        """Directories whose changes can move a local repository's HEAD; none for remote ones."""
+        if not Path(url).is_dir():
+            return []
+        returncode, git_dir = await self._zd_git("-C", url, "rev-parse", "--absolute-git-dir")
+        if returncode != 0:
+            return []
+        directories = [Path(git_dir)]
+        for root, _, _ in os.walk(Path(git_dir) / "refs" / "heads"):
+            directories.append(Path(root))
+        return directories
+
+    async def _zd_head(self, url: str, step) -> Optional[str]:
+        """The commit a repository's HEAD points to, or None if it can't be read now."""
+        ssh_command = zd_git_ssh_command(self.ssh_transport, step.repo_url, step.ssh_key)
+        env = {'GIT_SSH_COMMAND': ssh_command} if ssh_command else None
+        returncode, output = await self._zd_git("ls-remote", url, "HEAD", env=env)
+        return output.split()[0] if returncode == 0 and output else None
+
+    async def _zd_git(self, *args: str, env: Optional[dict] = None) -> Tuple[int, str]:
+        process = await asyncio.create_subprocess_exec(
+            "git", *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env={**os.environ, 'GIT_TERMINAL_PROMPT': '0', **(env or {})},
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), self.config.preflight_timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return -1, ""
+        return process.returncode, stdout.decode(errors="replace").strip()
+
+    @staticmethod
+    def _zd_hash(path: Path) -> Optional[str]:
+        try:
+            return hashlib.sha1(path.read_bytes()).hexdigest()
+        except OSError:
+            return None
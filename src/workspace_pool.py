@@ -0,0 +1,228 @@
+import asyncio
+import fcntl
+import itertools
+import os
+import shutil
+import stat
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional
+from audit_logger import ZDLogger
+from zd_config import ZDConfig
+
+# How often the pool's disk usage is re-measured while a quota is set
+_USAGE_INTERVAL = 10.0
+
+class ZDWorkspaceQuotaError(RuntimeError):
+    """Raised when a workspace is requested while the pool is over its disk quota."""
+
+class ZDWorkspaceRootError(RuntimeError):
+    """Raised when the workspace root is not a private directory of the current user."""
+
+def zd_default_workspace_root() -> Path:
+    """A per-user root: $XDG_RUNTIME_DIR/zendeploy, else zendeploy-<uid> in the temp dir."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and Path(runtime_dir).is_dir():
+        return Path(runtime_dir) / "zendeploy"
+    return Path(tempfile.gettempdir()) / f"zendeploy-{os.getuid()}"
+
+class ZDWorkspacePool:
+    """Managed step workspaces under a configurable root (e.g. a tmpfs mount).
+
+    Empty directories are created ahead of time, released workspaces are
+    renamed into a trash directory (an O(1) operation) and deleted by a
+    background reaper thread, so the event loop never waits on rmtree. With a
+    quota, usage is sampled on a timer rather than measured on every acquire.
+
+    Steps run with the deployer's credentials, so the root must be a 0700
+    directory owned by the current user; anything else is refused. Each
+    process holds a flock on its own directory, and a directory whose lock
+    can be taken belongs to a process that has exited.
+    """
+
+    def __init__(self, config: ZDConfig, audit_logger: ZDLogger):
+        self.config = config
+        self.audit_logger = audit_logger
+        self.root = Path(config.workspace_root or zd_default_workspace_root()).expanduser()
+        # Ready and active workspaces are per process so a daemon and a TUI can share a root
+        self.process_dir = self.root / f"pid-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.ready_dir = self.process_dir / "ready"
+        self.active_dir = self.process_dir / "active"
+        self.kept_dir = self.root / "kept"
+        self.trash_dir = self.root / "trash"
+        self.lock_dir = self.root / ".locks"
+        self._ready: List[Path] = []
+        self._counter = itertools.count(1)
+        self._pending_reap = 0
+        self._reap_queue: asyncio.Queue = asyncio.Queue()
+        self._reaper: Optional[asyncio.Task] = None
+        self._sampler: Optional[asyncio.Task] = None
+        self._usage_mb = 0.0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._lock_fd: Optional[int] = None
+
+    async def zd_start(self) -> None:
+        """Create the pool layout and start the background reaper."""
+        if self._reaper:
+            return
+        self._zd_check_root()
+        self.lock_dir.mkdir(exist_ok=True)
+        # Locked before the directory exists, so no other process can take it for a leftover
+        self._lock_fd = self._zd_try_lock(self.process_dir)
+        for directory in (self.ready_dir, self.active_dir, self.kept_dir, self.trash_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        # Anything left behind by processes that have exited is garbage now
+        for leftover in self.trash_dir.iterdir():
+            self._zd_queue_reap(leftover)
+        for process_dir in self.root.glob("pid-*"):
+            if process_dir == self.process_dir:
+                continue
+            fd = self._zd_try_lock(process_dir)
+            if fd is not None:
+                # Its lock is free, so the process that owned it is gone
+                try:
+                    self._zd_trash(process_dir)
+                except FileNotFoundError:
+                    # Another process starting at the same time got to it first
+                    pass
+                (self.lock_dir / process_dir.name).unlink(missing_ok=True)
+                os.close(fd)
+        for leftover in self.active_dir.iterdir():
+            self._zd_trash(leftover)
+        self._ready = sorted(self.ready_dir.iterdir())
+        self._reaper = asyncio.create_task(self._zd_reap())
+        self._zd_fill()
+        if self.config.workspace_quota_mb:
+            self._usage_mb = await asyncio.to_thread(self.zd_usage_mb)
+            self._sampler = asyncio.create_task(self._zd_sample())
+        await self.audit_logger.zd_log_action("workspace_pool", f"Workspaces under {self.root}")
+
+    async def zd_acquire(self, label: str) -> Path:
+        """Return an empty workspace directory for a step."""
+        await self.zd_start()
+        if self.config.workspace_quota_mb and self._usage_mb > self.config.workspace_quota_mb:
+            # The sample may predate deletions, and trashed workspaces may still be waiting for the reaper
+            await self.zd_drain()
+            self._usage_mb = await asyncio.to_thread(self.zd_usage_mb)
+            if self._usage_mb > self.config.workspace_quota_mb:
+                raise ZDWorkspaceQuotaError(
+                    f"Workspace quota exceeded: {self._usage_mb:.0f}MB used of {self.config.workspace_quota_mb}MB"
+                )
+
+        source = self._ready.pop() if self._ready else None
+        workspace = self.active_dir / f"{label}-{next(self._counter)}"
+        if source and source.exists():
+            source.rename(workspace)
+        else:
+            workspace.mkdir()
+        # Top the pool back up in the background
+        self._reap_queue.put_nowait(None)
+        return workspace
+
+    async def zd_release(self, workspace: Path, keep: bool = False) -> Optional[Path]:
+        """Hand a workspace back; kept workspaces are moved aside and their path returned."""
+        if not workspace.exists():
+            return None
+        if keep:
+            kept = self.kept_dir / f"{workspace.name}-{int(time.time())}"
+            workspace.rename(kept)
+            await self.audit_logger.zd_log_action("workspace_kept", str(kept))
+            self._zd_prune_kept()
+            return kept
+        self._zd_trash(workspace)
+        return None
+
+    async def zd_drain(self) -> None:
+        """Wait until every trashed workspace has been deleted."""
+        await self._idle.wait()
+
+    def zd_usage_mb(self) -> float:
+        """Disk usage of the whole pool in megabytes."""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return total / (1024 * 1024)
+
+    async def zd_close(self) -> None:
+        """Stop the reaper once pending deletions finish."""
+        if self._sampler:
+            self._sampler.cancel()
+            self._sampler = None
+        if self._reaper:
+            await self.zd_drain()
+            self._reaper.cancel()
+            self._reaper = None
+        if self._lock_fd is not None:
+            (self.lock_dir / self.process_dir.name).unlink(missing_ok=True)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _zd_check_root(self) -> None:
+        """Create the root 0700 if missing; refuse one another user could write to."""
+        self.root.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.root.mkdir(mode=0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(self.root)
+        if not stat.S_ISDIR(info.st_mode):
+            raise ZDWorkspaceRootError(f"Workspace root {self.root} is not a directory")
+        if info.st_uid != os.getuid():
+            raise ZDWorkspaceRootError(f"Workspace root {self.root} is owned by uid {info.st_uid}, not {os.getuid()}")
+        if info.st_mode & 0o077:
+            raise ZDWorkspaceRootError(
+                f"Workspace root {self.root} has mode {stat.S_IMODE(info.st_mode):o}; it must be 700"
+            )
+
+    def _zd_try_lock(self, process_dir: Path) -> Optional[int]:
+        fd = os.open(self.lock_dir / process_dir.name, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _zd_trash(self, path: Path) -> None:
+        target = self.trash_dir / uuid.uuid4().hex
+        path.rename(target)
+        self._zd_queue_reap(target)
+
+    def _zd_queue_reap(self, target: Path) -> None:
+        self._pending_reap += 1
+        self._idle.clear()
+        self._reap_queue.put_nowait(target)
+
+    def _zd_prune_kept(self) -> None:
+        kept = sorted(self.kept_dir.iterdir(), key=lambda p: p.stat().st_mtime)
+        for old in kept[:max(0, len(kept) - self.config.workspace_keep_max)]:
+            self._zd_trash(old)
+
+    def _zd_fill(self) -> None:
+        while len(self._ready) < self.config.workspace_prewarm:
+            path = self.ready_dir / uuid.uuid4().hex
+            path.mkdir()
+            self._ready.append(path)
+
+    async def _zd_sample(self) -> None:
+        while True:
+            await asyncio.sleep(_USAGE_INTERVAL)
+            self._usage_mb = await asyncio.to_thread(self.zd_usage_mb)
+
+    async def _zd_reap(self) -> None:
+        while True:
+            target = await self._reap_queue.get()
+            if target is not None:
+                await asyncio.to_thread(shutil.rmtree, target, ignore_errors=True)
+                self._pending_reap -= 1
+                if self._pending_reap == 0:
+                    self._idle.set()
+            self._zd_fill()
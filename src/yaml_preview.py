@@ -0,0 +1,80 @@
+import asyncio
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Tuple
+import yaml
+from deployment_manager import zd_display_env
+
+# libyaml's loader is several times faster when PyYAML was built with it
+_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+@dataclass
+class ZDPreviewRows:
+    """Flattened key/value rows of a YAML file, possibly cut short."""
+    rows: List[Tuple[str, str]] = field(default_factory=list)
+    truncated: bool = False
+    note: str = ""
+
+class ZDYamlPreview:
+    """Parses YAML files for the file browser preview off the event loop.
+
+    Flattened rows are cached by path and mtime, so revisiting a file is free,
+    and both the bytes parsed and the rows produced are capped. A step file's
+    secret env_vars are shown redacted, as on the review screen.
+    """
+
+    def __init__(self, max_bytes: int = 1048576, max_rows: int = 5000, max_entries: int = 256):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Path, Tuple[Tuple[float, int], ZDPreviewRows]]" = OrderedDict()
+
+    async def zd_rows(self, path: Path) -> ZDPreviewRows:
+        """Return the preview rows for a YAML file, parsing only if it changed."""
+        path = Path(path).resolve()
+        stat = await asyncio.to_thread(path.stat)
+        version = (stat.st_mtime, stat.st_size)
+        cached = self._cache.get(path)
+        if cached and cached[0] == version:
+            self._cache.move_to_end(path)
+            return cached[1]
+
+        if stat.st_size > self.max_bytes:
+            preview = ZDPreviewRows(
+                truncated=True,
+                note=f"File is too large to preview ({stat.st_size / 1048576:.1f}MB)"
+            )
+        else:
+            preview = await asyncio.to_thread(self._zd_parse, path)
+        self._cache[path] = (version, preview)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return preview
+
+    def _zd_parse(self, path: Path) -> ZDPreviewRows:
+        with open(path) as f:
+            data = yaml.load(f, Loader=_LOADER)
+        if isinstance(data, dict) and isinstance(data.get('env_vars'), dict) and isinstance(data.get('secrets'), list):
+            data = {**data, 'env_vars': zd_display_env(data['env_vars'], data['secrets'])}
+        rows = list(itertools.islice(self._zd_flatten(data), self.max_rows + 1))
+        if len(rows) > self.max_rows:
+            return ZDPreviewRows(rows[:self.max_rows], True,
+                                 f"Showing the first {self.max_rows} entries")
+        return ZDPreviewRows(rows)
+
+    @classmethod
+    def _zd_flatten(cls, data, prefix: str = '') -> Iterator[Tuple[str, str]]:
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, (dict, list)):
+                    yield from cls._zd_flatten(value, f"{prefix}{key}.")
+                else:
+                    yield f"{prefix}{key}", str(value)
+        elif isinstance(data, list):
+            for i, item in enumerate(data):
+                if isinstance(item, (dict, list)):
+                    yield from cls._zd_flatten(item, f"{prefix}[{i}].")
+                else:
+                    yield f"{prefix}[{i}]", str(item)
@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+import os
+from pathlib import Path
+from typing import Optional
+import yaml
+
+@dataclass
+class ZDConfig:
+    """Runtime settings for ZenDeploy, loaded from zendeploy.yml."""
+    # Execution limits (seconds, None disables the limit)
+    plan_timeout: Optional[float] = None
+    step_timeout: Optional[float] = None
+    kill_grace_period: float = 10.0
+    # Parallel execution, bounded by the adaptive concurrency governor
+    parallel: bool = False
+    # Serial runs: steps checked out ahead of the running one, and clones in flight at once
+    pipeline_depth: int = 0
+    max_checkouts: int = 4
+    # Validate every step before the first one runs
+    preflight: bool = True
+    preflight_timeout: float = 30.0
+    # Cancel the steps still running as soon as one fails
+    fail_fast: bool = False
+    min_parallel: int = 1
+    max_parallel: int = os.cpu_count() or 1
+    max_load_per_cpu: float = 1.0
+    min_free_memory_mb: float = 512
+    max_pressure: float = 25.0
+    governor_interval: float = 2.0
+    # Step output spilled to disk, with only a bounded tail kept in the UI
+    output_store: bool = True
+    output_tail_lines: int = 5000
+    output_chunk_size: int = 65536
+    # Events queued per output consumer (screen, daemon client, output files)
+    event_queue_size: int = 1000
+    # Seconds between redraws of the progress screen's step rows
+    progress_refresh: float = 0.5
+    max_line_length: int = 16384
+    # Output classification: built-in rules, extra rules, and sample lines kept per severity
+    classifier_builtin: bool = True
+    output_rules: tuple = ()
+    classifier_samples: int = 5
+    # Write the output stream to a replayable recording beside the session log
+    record_session: bool = False
+    # Opt-in heap (tracemalloc) and script rusage report per run
+    resource_report: bool = False
+    resource_top_sites: int = 10
+    resource_frames: int = 10
+    # File browser YAML preview limits
+    preview_max_bytes: int = 1048576
+    preview_max_rows: int = 5000
+    # Step workspaces
+    workspace_root: Optional[Path] = None
+    workspace_prewarm: int = 4
+    workspace_quota_mb: Optional[float] = None
+    keep_failed_workspaces: bool = False
+    workspace_keep_max: int = 5
+    share_checkouts: bool = True
+    # Named resource locks and rate limits steps claim: (name, capacity or {capacity, rate, period, burst})
+    resource_limits: tuple = ()
+    # Shared state kept between runs
+    cache_dir: Path = Path("~/.cache/zendeploy")
+    repo_cache_max_age: float = 0
+    prefetch: bool = True
+    # Step outputs (default location: cache_dir/artifacts)
+    artifact_dir: Optional[Path] = None
+    artifact_max_mb: Optional[float] = 10240
+    # Opt-in persistent tool caches injected into step environments (default location: cache_dir/tools)
+    tool_caches: bool = False
+    tool_cache_builtin: tuple = ("pip", "npm")
+    tool_cache_dir: Optional[Path] = None
+    tool_cache_max_mb: Optional[float] = 20480
+    tool_cache_max_age_days: Optional[float] = 30
+    # Warm worker process for module:function step entry points
+    python_pool: bool = True
+    python_preload: tuple = ("boto3", "yaml")
+    python_executable: Optional[str] = None
+    # env_vars ${...} references: seconds a resolved value is reused (None: whole session)
+    interpolation_ttl: Optional[float] = 300
+    interpolation_cmd_timeout: float = 30.0
+    # AWS credentials resolved once per profile and session, refreshed this long before expiry
+    aws_broker: bool = False
+    aws_broker_inject: str = "process"
+    aws_broker_refresh_margin: float = 900
+    aws_broker_timeout: float = 60.0
+    aws_broker_command: tuple = ("aws", "configure", "export-credentials", "--profile", "{profile}",
+                                 "--format", "process")
+    # Run history (default location: cache_dir/history.sqlite)
+    history_store: bool = True
+    history_path: Optional[Path] = None
+    regression_factor: float = 1.5
+    regression_min_seconds: float = 10.0
+    # Audit sinks fed from the session log (spool default location: cache_dir/audit-spool)
+    audit_sinks: tuple = ()
+    audit_queue_size: int = 10000
+    audit_batch_size: int = 200
+    audit_flush_interval: float = 1.0
+    audit_max_backoff: float = 60.0
+    audit_spool_dir: Optional[Path] = None
+    audit_spool_max_mb: Optional[float] = 512
+    # Watch mode: quiet period before re-running, and how often remote repositories are checked
+    watch_debounce: float = 0.5
+    watch_poll_interval: float = 30.0
+    # SSH connection sharing for Git
+    ssh_multiplex: bool = True
+    ssh_control_persist: int = 60
+    # Daemon mode (disabled when daemon_socket is None)
+    daemon_socket: Optional[Path] = None
+    daemon_max_jobs: int = 2
+    # Finished jobs (and their buffered output) kept for status and attach
+    daemon_keep_jobs: int = 50
+
+    @classmethod
+    def from_yaml(cls, file_path: Path = Path("zendeploy.yml")) -> 'ZDConfig':
+        """Load settings from a YAML file, falling back to defaults if it is missing."""
+        if not file_path.exists():
+            return cls()
+
+        with open(file_path, 'r') as f:
+            data = yaml.safe_load(f) or {}
+
+        execution = data.get('execution', {})
+        concurrency = data.get('concurrency', {})
+        output = data.get('output', {})
+        workspace = data.get('workspace', {})
+        cache = data.get('cache', {})
+        daemon = data.get('daemon', {})
+        ssh = data.get('ssh', {})
+        preview = data.get('preview', {})
+        history = data.get('history', {})
+        artifacts = data.get('artifacts', {})
+        resources = data.get('resources', {})
+        tool_caches = data.get('tool_caches', {})
+        audit = data.get('audit', {})
+        watch = data.get('watch', {})
+        classifier = data.get('classifier', {})
+        python_workers = data.get('python_workers', {})
+        interpolation = data.get('interpolation', {})
+        aws_credentials = data.get('aws_credentials', {})
+        return cls(
+            plan_timeout=execution.get('plan_timeout'),
+            step_timeout=execution.get('step_timeout'),
+            kill_grace_period=execution.get('kill_grace_period', 10.0),
+            parallel=execution.get('parallel', False),
+            pipeline_depth=execution.get('pipeline_depth', 0),
+            max_checkouts=execution.get('max_checkouts', 4),
+            preflight=execution.get('preflight', True),
+            preflight_timeout=execution.get('preflight_timeout', 30.0),
+            fail_fast=execution.get('fail_fast', False),
+            min_parallel=concurrency.get('min', 1),
+            max_parallel=concurrency.get('max', os.cpu_count() or 1),
+            max_load_per_cpu=concurrency.get('max_load_per_cpu', 1.0),
+            min_free_memory_mb=concurrency.get('min_free_memory_mb', 512),
+            max_pressure=concurrency.get('max_pressure', 25.0),
+            governor_interval=concurrency.get('interval', 2.0),
+            output_store=output.get('store', True),
+            output_tail_lines=output.get('tail_lines', 5000),
+            output_chunk_size=output.get('chunk_size', 65536),
+            event_queue_size=output.get('queue_size', 1000),
+            progress_refresh=output.get('refresh', 0.5),
+            max_line_length=output.get('max_line_length', 16384),
+            record_session=output.get('record', False),
+            classifier_builtin=classifier.get('builtin', True),
+            output_rules=tuple(classifier.get('rules') or ()),
+            classifier_samples=classifier.get('samples', 5),
+            preview_max_bytes=preview.get('max_bytes', 1048576),
+            preview_max_rows=preview.get('max_rows', 5000),
+            workspace_root=Path(workspace['root']) if workspace.get('root') else None,
+            workspace_prewarm=workspace.get('prewarm', 4),
+            workspace_quota_mb=workspace.get('quota_mb'),
+            keep_failed_workspaces=workspace.get('keep_failed', False),
+            workspace_keep_max=workspace.get('keep_max', 5),
+            share_checkouts=workspace.get('share_checkouts', True),
+            resource_limits=tuple((data.get('limits') or {}).items()),
+            cache_dir=Path(cache.get('dir', "~/.cache/zendeploy")),
+            repo_cache_max_age=cache.get('repo_max_age', 0),
+            prefetch=cache.get('prefetch', True),
+            audit_sinks=tuple(audit.get('sinks') or ()),
+            audit_queue_size=audit.get('queue_size', 10000),
+            audit_batch_size=audit.get('batch_size', 200),
+            audit_flush_interval=audit.get('flush_interval', 1.0),
+            audit_max_backoff=audit.get('max_backoff', 60.0),
+            audit_spool_dir=Path(audit['spool_dir']).expanduser() if audit.get('spool_dir') else None,
+            audit_spool_max_mb=audit.get('spool_max_mb', 512),
+            watch_debounce=watch.get('debounce', 0.5),
+            watch_poll_interval=watch.get('poll_interval', 30.0),
+            ssh_multiplex=ssh.get('multiplex', True),
+            ssh_control_persist=ssh.get('control_persist', 60),
+            resource_report=resources.get('report', False),
+            resource_top_sites=resources.get('top_sites', 10),
+            resource_frames=resources.get('frames', 10),
+            artifact_dir=Path(artifacts['dir']).expanduser() if artifacts.get('dir') else None,
+            artifact_max_mb=artifacts.get('max_mb', 10240),
+            tool_caches=tool_caches.get('enabled', False),
+            tool_cache_builtin=tuple(tool_caches.get('builtin', ("pip", "npm"))),
+            tool_cache_dir=Path(tool_caches['dir']).expanduser() if tool_caches.get('dir') else None,
+            tool_cache_max_mb=tool_caches.get('max_mb', 20480),
+            tool_cache_max_age_days=tool_caches.get('max_age_days', 30),
+            python_pool=python_workers.get('enabled', True),
+            python_preload=tuple(python_workers.get('preload', ("boto3", "yaml"))),
+            python_executable=python_workers.get('python'),
+            interpolation_ttl=interpolation.get('ttl', 300),
+            interpolation_cmd_timeout=interpolation.get('cmd_timeout', 30.0),
+            aws_broker=aws_credentials.get('enabled', False),
+            aws_broker_inject=aws_credentials.get('inject', "process"),
+            aws_broker_refresh_margin=aws_credentials.get('refresh_margin', 900),
+            aws_broker_timeout=aws_credentials.get('timeout', 60.0),
+            aws_broker_command=tuple(aws_credentials.get('command', cls.aws_broker_command)),
+            history_store=history.get('store', True),
+            history_path=Path(history['path']).expanduser() if history.get('path') else None,
+            regression_factor=history.get('regression_factor', 1.5),
+            regression_min_seconds=history.get('regression_min_seconds', 10.0),
+            daemon_socket=Path(daemon['socket']).expanduser() if daemon.get('socket') else None,
+            daemon_max_jobs=daemon.get('max_jobs', 2),
+            daemon_keep_jobs=daemon.get('keep_jobs', 50),
+        )
@@ -0,0 +1,553 @@
+import argparse
+import asyncio
+import grp
+import itertools
+import json
+import os
+import pwd
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Set
+from audit_logger import ZDLogger
+from audit_sink import ZDAuditShipper
+from deployment_executor import ZDExecutor
+from event_bus import BLOCK, DROP_OLDEST, ZDEventBus
+from deployment_manager import ZDManager, ZDStepCache
+from run_history import ZDRunHistory
+from repo_cache import ZDRepoCache
+from workspace_pool import ZDWorkspacePool
+from ssh_transport import ZDSSHTransport
+from python_pool import ZDPythonPool
+from env_resolver import ZDEnvResolver
+from aws_credentials import ZDCredentialBroker
+from resource_limits import ZDResourceLimits
+from zd_config import ZDConfig
+
+# Output lines kept per job so late attachers can catch up
+JOB_HISTORY_LINES = 10000
+
+@dataclass
+class ZDJob:
+    """A deployment submitted to the daemon."""
+    job_id: str
+    step_paths: List[Path]
+    priority: int
+    targets: Set[str]
+    seq: int
+    submitted_by: str = "unknown"
+    status: str = "queued"
+    submitted_at: float = field(default_factory=time.time)
+    history: Deque[dict] = field(default_factory=lambda: deque(maxlen=JOB_HISTORY_LINES))
+    # Attached clients; a slow one loses its oldest events rather than hold up the job
+    bus: ZDEventBus = field(default_factory=ZDEventBus)
+    executor: Optional[ZDExecutor] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def summary(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'priority': self.priority,
+            'targets': sorted(self.targets),
+            'steps': [str(p) for p in self.step_paths],
+            'submitted_by': self.submitted_by,
+            'submitted_at': self.submitted_at,
+        }
+
+class ZDDaemon:
+    """Long-running job server that keeps repo mirrors and parsed steps warm between runs.
+
+    Clients talk newline-delimited JSON over a Unix socket. Jobs run highest
+    priority first, and two jobs sharing a target (by default, an AWS profile)
+    never run at the same time. Only the daemon's user, root and members of the
+    socket's group are served, as checked with SO_PEERCRED.
+    """
+
+    def __init__(self, config: ZDConfig):
+        self.config = config
+        self.socket_path = config.daemon_socket
+        self.audit_logger = ZDLogger(shippers=ZDAuditShipper.for_config(config))
+        self.repo_cache = ZDRepoCache(config.cache_dir, self.audit_logger)
+        self.step_cache = ZDStepCache()
+        self.workspace_pool = ZDWorkspacePool(config, self.audit_logger)
+        self.ssh_transport = ZDSSHTransport(config, self.audit_logger) if config.ssh_multiplex else None
+        self.python_pool = ZDPythonPool(config, self.audit_logger) if config.python_pool else None
+        self.env_resolver = ZDEnvResolver(config, self.audit_logger)
+        self.credential_broker = ZDCredentialBroker(config, self.audit_logger) if config.aws_broker else None
+        self.resource_limits = ZDResourceLimits(config, self.audit_logger)
+        self.run_history = ZDRunHistory.for_config(config)
+        self.jobs: Dict[str, ZDJob] = {}
+        self._pending: List[ZDJob] = []
+        self._busy_targets: Set[str] = set()
+        self._running = 0
+        self._seq = itertools.count(1)
+        self._wakeup = asyncio.Event()
+        self._job_tasks: Set[asyncio.Task] = set()
+
+    async def zd_serve(self) -> None:
+        """Accept client connections and dispatch jobs until cancelled."""
+        async with self.audit_logger:
+            await self._zd_serve()
+
+    def _zd_bind(self) -> socket.socket:
+        """Bind the listening socket, with its final mode, before it appears at socket_path."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # Bound in a private directory and moved into place, so it is never reachable with the umask's mode
+        private = tempfile.mkdtemp(prefix=".zd-sock-", dir=self.socket_path.parent)
+        bound = os.path.join(private, "sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(bound)
+            # Group-writable so operators sharing the host can submit and attach
+            os.chmod(bound, 0o660)
+            os.replace(bound, self.socket_path)
+        except BaseException:
+            sock.close()
+            if os.path.lexists(bound):
+                os.unlink(bound)
+            raise
+        finally:
+            os.rmdir(private)
+        return sock
+
+    async def _zd_serve(self) -> None:
+        server = await asyncio.start_unix_server(self._zd_handle_client, sock=self._zd_bind())
+        await self.audit_logger.zd_log_action("daemon_start", str(self.socket_path))
+
+        await self.workspace_pool.zd_start()
+        dispatcher = asyncio.create_task(self._zd_dispatch())
+        serving = asyncio.ensure_future(server.serve_forever())
+        # A plain kill must still cancel the jobs' scripts and remove the socket
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            loop.add_signal_handler(signum, serving.cancel)
+        try:
+            async with server:
+                await serving
+        except asyncio.CancelledError:
+            if not serving.cancelled():
+                raise
+        finally:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                loop.remove_signal_handler(signum)
+            dispatcher.cancel()
+            for job in list(self._pending):
+                self._pending.remove(job)
+                self._zd_finish(job, "cancelled")
+            for job in self.jobs.values():
+                if job.executor:
+                    job.executor.zd_cancel("daemon shutting down")
+            if self._job_tasks:
+                # Cancelled runs kill their scripts' process groups within the grace period
+                await asyncio.wait(self._job_tasks, timeout=self.config.kill_grace_period + 10)
+            await self.audit_logger.zd_log_action("daemon_stop", str(self.socket_path))
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            await self.workspace_pool.zd_close()
+            if self.ssh_transport:
+                await self.ssh_transport.zd_close()
+            if self.python_pool:
+                await self.python_pool.zd_close()
+            if self.credential_broker:
+                await self.credential_broker.zd_close()
+            if self.run_history:
+                await asyncio.to_thread(self.run_history.zd_close)
+
+    def zd_submit(self, step_paths: List[str], priority: int = 0,
+                  targets: Optional[List[str]] = None, user: str = "unknown") -> ZDJob:
+        """Queue a deployment and return its job."""
+        manager = self._zd_build_manager([Path(p) for p in step_paths])
+        if targets is None:
+            targets = [step.aws_profile for step in manager.steps]
+        seq = next(self._seq)
+        # Not len(self.jobs): finished jobs are pruned, so that could repeat an id
+        job = ZDJob(
+            job_id=f"job-{int(time.time())}-{seq}",
+            step_paths=[step.file_path for step in manager.steps],
+            priority=priority,
+            targets=set(targets),
+            seq=seq,
+            submitted_by=user,
+        )
+        self.jobs[job.job_id] = job
+        self._pending.append(job)
+        self._wakeup.set()
+        return job
+
+    def zd_cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job."""
+        job = self.jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        if job in self._pending:
+            self._pending.remove(job)
+            self._zd_finish(job, "cancelled")
+        elif job.executor:
+            job.executor.zd_cancel("cancelled via daemon")
+        return True
+
+    def _zd_build_manager(self, step_paths: List[Path]) -> ZDManager:
+        manager = ZDManager(self.step_cache)
+        for path in step_paths:
+            manager.zd_add_step(path.resolve())
+        return manager
+
+    async def _zd_dispatch(self) -> None:
+        """Start runnable jobs whenever the queue or the busy targets change."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            for job in sorted(self._pending, key=lambda j: (-j.priority, j.seq)):
+                if job.targets & self._busy_targets:
+                    job.status = "waiting"
+                    continue
+                if self._running >= self.config.daemon_max_jobs:
+                    # No longer waiting on a target, only for a free slot
+                    job.status = "queued"
+                    continue
+                self._pending.remove(job)
+                job.status = "running"
+                self._busy_targets |= job.targets
+                self._running += 1
+                task = asyncio.create_task(self._zd_run_job(job))
+                self._job_tasks.add(task)
+                task.add_done_callback(self._job_tasks.discard)
+
+    async def _zd_run_job(self, job: ZDJob) -> None:
+        status = "failed"
+        try:
+            manager = self._zd_build_manager(job.step_paths)
+            job.executor = ZDExecutor(
+                manager, self.audit_logger, self.config, self.repo_cache, self.workspace_pool,
+                self.ssh_transport, self.run_history, python_pool=self.python_pool,
+                env_resolver=self.env_resolver,
+                credential_broker=self.credential_broker,
+                resource_limits=self.resource_limits
+            )
+            self._zd_publish(job, {'event': 'state', 'status': job.status})
+            await self.audit_logger.zd_log_action("daemon_job_start", job.job_id)
+
+            if await job.executor.zd_prepare():
+                failed = False
+                # Only copies into the job history, so it can afford to be lossless
+                subscription = job.executor.bus.zd_subscribe("daemon", self.config.event_queue_size, BLOCK)
+                runner = asyncio.create_task(job.executor.zd_run())
+                try:
+                    async for event in subscription:
+                        self._zd_publish(job, {
+                            'event': 'output',
+                            'step': event.key,
+                            'formatted': event.formatted,
+                            'raw': event.raw,
+                            'states': list(event.states),
+                        })
+                        if "failed" in event.states:
+                            failed = True
+                    await runner
+                finally:
+                    if not runner.done():
+                        # The consumer stopped early; let the run stop and clean up as on any cancellation
+                        job.executor.zd_cancel("output consumer stopped")
+                        await asyncio.gather(runner, return_exceptions=True)
+                if job.executor.cancelled:
+                    status = "cancelled"
+                elif not failed:
+                    status = "succeeded"
+        except Exception as e:
+            self._zd_publish(job, {
+                'event': 'output', 'step': None,
+                'formatted': f"[red]Error: {str(e)}[/red]\n",
+                'raw': f"ERROR: {str(e)}\n",
+            })
+        finally:
+            self._busy_targets -= job.targets
+            self._running -= 1
+            self._zd_finish(job, status)
+            await self.audit_logger.zd_log_action("daemon_job_end", f"{job.job_id} | {status}")
+            self._wakeup.set()
+
+    def _zd_finish(self, job: ZDJob, status: str) -> None:
+        job.status = status
+        job.executor = None
+        self._zd_publish(job, {'event': 'done', 'status': status})
+        job.bus.zd_close()
+        self._zd_prune_jobs()
+
+    def _zd_prune_jobs(self) -> None:
+        """Forget the oldest finished jobs beyond daemon.keep_jobs, with their buffered output."""
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.config.daemon_keep_jobs)]:
+            # Clients still attached keep their subscription until it drains
+            del self.jobs[job.job_id]
+
+    def _zd_publish(self, job: ZDJob, event: dict) -> None:
+        job.history.append(event)
+        job.bus.zd_publish_nowait(event)
+
+    @staticmethod
+    def _zd_peer(writer: asyncio.StreamWriter) -> Optional[tuple]:
+        """(uid, gid) of the connected process, from the kernel rather than the client's word."""
+        sock = writer.get_extra_info('socket')
+        if sock is None or not hasattr(socket, 'SO_PEERCRED'):
+            return None
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _pid, uid, gid = struct.unpack('3i', creds)
+        return uid, gid
+
+    @classmethod
+    def _zd_peer_user(cls, writer: asyncio.StreamWriter) -> str:
+        """The user the connected process runs as."""
+        peer = cls._zd_peer(writer)
+        if peer is None:
+            return "unknown"
+        try:
+            return pwd.getpwuid(peer[0]).pw_name
+        except KeyError:
+            return f"uid {peer[0]}"
+
+    def _zd_peer_allowed(self, peer: Optional[tuple]) -> bool:
+        """Whether a peer is the daemon's user, root, or in the socket's group."""
+        if peer is None:
+            # Without SO_PEERCRED the socket's mode is the only check
+            return True
+        uid, gid = peer
+        if uid in (0, os.getuid()):
+            return True
+        try:
+            group = os.stat(self.socket_path).st_gid
+        except OSError:
+            return False
+        if gid == group:
+            return True
+        try:
+            return pwd.getpwuid(uid).pw_name in grp.getgrgid(group).gr_mem
+        except KeyError:
+            return False
+
+    async def _zd_handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            peer = self._zd_peer(writer)
+            if not self._zd_peer_allowed(peer):
+                await self.audit_logger.zd_log_action("daemon_denied", f"uid {peer[0]}")
+                await self._zd_send(writer, {'ok': False, 'error': "Permission denied"})
+                return
+            line = await reader.readline()
+            if not line:
+                # A liveness probe (ZDDaemonClient.zd_available)
+                return
+            request = json.loads(line)
+            op = request.get('op')
+
+            if op == 'submit':
+                job = self.zd_submit(
+                    request['steps'],
+                    priority=request.get('priority', 0),
+                    targets=request.get('targets'),
+                    user=self._zd_peer_user(writer),
+                )
+                await self.audit_logger.zd_log_action(
+                    "daemon_submit", f"{job.job_id} | {job.submitted_by} | {len(job.step_paths)} steps"
+                )
+                await self._zd_send(writer, {'ok': True, 'job': job.summary()})
+            elif op == 'status':
+                await self._zd_send(writer, {'ok': True, 'jobs': [j.summary() for j in self.jobs.values()]})
+            elif op == 'cancel':
+                cancelled = self.zd_cancel(request['job_id'])
+                if cancelled:
+                    await self.audit_logger.zd_log_action(
+                        "daemon_cancel", f"{request['job_id']} | {self._zd_peer_user(writer)}"
+                    )
+                await self._zd_send(writer, {'ok': cancelled})
+            elif op == 'attach':
+                await self._zd_stream_job(request['job_id'], writer)
+            else:
+                await self._zd_send(writer, {'ok': False, 'error': f"Unknown op: {op}"})
+
+        except Exception as e:
+            await self._zd_send(writer, {'ok': False, 'error': str(e)})
+        finally:
+            writer.close()
+
+    async def _zd_stream_job(self, job_id: str, writer: asyncio.StreamWriter) -> None:
+        """Replay a job's buffered output, then follow it live until it finishes."""
+        job = self.jobs.get(job_id)
+        if not job:
+            await self._zd_send(writer, {'ok': False, 'error': f"Unknown job: {job_id}"})
+            return
+
+        await self._zd_send(writer, {'ok': True, 'job': job.summary()})
+        # Snapshot and subscribe without awaiting in between so nothing is missed;
+        # the subscription of a finished job is already closed
+        backlog = list(job.history)
+        subscription = job.bus.zd_subscribe(f"attach {job.job_id}", self.config.event_queue_size, DROP_OLDEST)
+        try:
+            for event in backlog:
+                await self._zd_send(writer, event)
+            reported = 0
+            async for event in subscription:
+                if subscription.dropped > reported:
+                    skipped = subscription.dropped - reported
+                    reported = subscription.dropped
+                    await self._zd_send(writer, {
+                        'event': 'output', 'step': None,
+                        'formatted': f"[yellow]... {skipped} events skipped (client too slow)[/yellow]\n",
+                        'raw': f"... {skipped} events skipped (client too slow)\n",
+                    })
+                await self._zd_send(writer, event)
+                if event['event'] == 'done':
+                    return
+        finally:
+            job.bus.zd_unsubscribe(subscription)
+
+    @staticmethod
+    async def _zd_send(writer: asyncio.StreamWriter, message: dict) -> None:
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+class ZDDaemonClient:
+    """Client for submitting to and following jobs on a ZenDeploy daemon."""
+
+    def __init__(self, socket_path: Path):
+        self.socket_path = Path(socket_path)
+
+    async def zd_available(self, timeout: float = 2.0) -> bool:
+        """Whether a daemon accepts connections at the configured path.
+
+        A socket file left by a daemon that was killed refuses connections, so
+        callers fall back to running locally.
+        """
+        try:
+            _reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(str(self.socket_path)), timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    async def _zd_request(self, request: dict, check: bool = True) -> dict:
+        reader, writer = await asyncio.open_unix_connection(str(self.socket_path))
+        try:
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+        finally:
+            writer.close()
+        if check and not response.get('ok'):
+            raise RuntimeError(response.get('error', "Daemon request failed"))
+        return response
+
+    async def zd_submit(self, step_paths: List[Path], priority: int = 0,
+                        targets: Optional[List[str]] = None) -> str:
+        """Submit a deployment and return the job id."""
+        response = await self._zd_request({
+            'op': 'submit',
+            'steps': [str(Path(p).resolve()) for p in step_paths],
+            'priority': priority,
+            'targets': targets,
+        })
+        return response['job']['job_id']
+
+    async def zd_status(self) -> List[dict]:
+        """List all jobs known to the daemon."""
+        return (await self._zd_request({'op': 'status'}))['jobs']
+
+    async def zd_cancel(self, job_id: str) -> bool:
+        """Cancel a job."""
+        response = await self._zd_request({'op': 'cancel', 'job_id': job_id}, check=False)
+        return response.get('ok', False)
+
+    async def zd_attach(self, job_id: str) -> AsyncGenerator[dict, None]:
+        """Yield a job's events, starting with its buffered history."""
+        # Output lines can be long, so lift the default 64 KiB line limit
+        reader, writer = await asyncio.open_unix_connection(str(self.socket_path), limit=2 ** 24)
+        try:
+            writer.write(json.dumps({'op': 'attach', 'job_id': job_id}).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if not response.get('ok'):
+                raise RuntimeError(response.get('error', "Attach failed"))
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                event = json.loads(line)
+                yield event
+                if event['event'] == 'done':
+                    return
+        finally:
+            writer.close()
+
+async def _zd_follow(client: ZDDaemonClient, job_id: str) -> int:
+    status = "failed"
+    async for event in client.zd_attach(job_id):
+        if event['event'] == 'output':
+            sys.stdout.write(event['raw'])
+            sys.stdout.flush()
+        elif event['event'] == 'done':
+            status = event['status']
+    print(f"\n{job_id}: {status}")
+    return 0 if status == "succeeded" else 1
+
+async def _zd_cli(args) -> int:
+    config = ZDConfig.from_yaml(Path(args.config))
+    if args.socket:
+        config.daemon_socket = Path(args.socket).expanduser()
+    if not config.daemon_socket:
+        print("No daemon socket configured (set daemon.socket in zendeploy.yml or pass --socket)")
+        return 2
+
+    if args.command == 'serve':
+        await ZDDaemon(config).zd_serve()
+        return 0
+
+    client = ZDDaemonClient(config.daemon_socket)
+    if args.command == 'submit':
+        job_id = await client.zd_submit(args.steps, args.priority, args.target or None)
+        print(job_id)
+        return await _zd_follow(client, job_id) if args.attach else 0
+    if args.command == 'attach':
+        return await _zd_follow(client, args.job_id)
+    if args.command == 'cancel':
+        return 0 if await client.zd_cancel(args.job_id) else 1
+    if args.command == 'status':
+        for job in await client.zd_status():
+            print(f"{job['job_id']}  {job['status']:<10} prio={job['priority']}  "
+                  f"{job['submitted_by']}  {len(job['steps'])} steps")
+        return 0
+    return 2
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ZenDeploy daemon and client")
+    parser.add_argument('--config', default="zendeploy.yml", help="Path to zendeploy.yml")
+    parser.add_argument('--socket', help="Override the daemon socket path")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('serve', help="Run the daemon in the foreground")
+    submit = commands.add_parser('submit', help="Queue a deployment")
+    submit.add_argument('steps', nargs='+', help="Step YAML files, in order")
+    submit.add_argument('--priority', type=int, default=0, help="Higher runs first")
+    submit.add_argument('--target', action='append', help="Mutual-exclusion target (default: step AWS profiles)")
+    submit.add_argument('--attach', action='store_true', help="Follow the job's output")
+    for name, help_text in (('attach', "Follow a job's output"), ('cancel', "Cancel a job")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('job_id')
+    commands.add_parser('status', help="List jobs")
+
+    try:
+        return asyncio.run(_zd_cli(parser.parse_args()))
+    except KeyboardInterrupt:
+        return 130
+
+if __name__ == "__main__":
+    sys.exit(main())
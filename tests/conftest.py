@@ -0,0 +1,12 @@
+import sys
+from pathlib import Path
+import pytest
+
+# The modules live flat in src/ and import each other by name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from audit_logger import ZDLogger
+
+@pytest.fixture
+def audit_logger(tmp_path):
+    return ZDLogger(str(tmp_path / "logs"))
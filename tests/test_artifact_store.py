@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from artifact_store import ZDArtifactError, ZDArtifactStore
+
+def write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(size))
+
+def age(store, manifest, seconds):
+    for entry in manifest["files"].values():
+        path = store.zd_object_path(entry["sha256"])
+        os.utime(path, (path.stat().st_atime - seconds, path.stat().st_mtime - seconds))
+
+def test_pinned_objects_survive_eviction_until_unpinned(tmp_path):
+    mb = 1024 * 1024
+    running = ZDArtifactStore(tmp_path / "store", max_mb=1.5)
+    write(tmp_path / "a" / "old.bin", mb)
+    old = running.zd_collect(tmp_path / "a", ["old.bin"], {})
+    running.zd_save_manifest(old)
+    age(running, old, 3600)
+
+    # Another run (another store instance) pushes the store over its limit
+    other = ZDArtifactStore(tmp_path / "store", max_mb=1.5)
+    write(tmp_path / "b" / "new.bin", mb)
+    new = other.zd_collect(tmp_path / "b", ["new.bin"], {})
+    other.zd_save_manifest(new)
+    old_object = running.zd_object_path(old["files"]["old.bin"]["sha256"])
+    assert old_object.exists()
+
+    running.zd_unpin()
+    assert other.zd_evict() == 1
+    assert not old_object.exists()
+    assert not running._pin_file.exists()
+
+def test_pins_of_exited_processes_are_ignored(tmp_path):
+    store = ZDArtifactStore(tmp_path / "store", max_mb=0.5)
+    write(tmp_path / "a" / "file.bin", 1024 * 1024)
+    manifest = store.zd_collect(tmp_path / "a", ["file.bin"], {})
+    stale = store.pins_dir / f"999999999-{'0' * 32}"
+    store._pin_file.rename(stale)
+    store._pinned.clear()
+    assert store.zd_evict() == 1
+    assert not stale.exists()
+    assert not store.zd_object_path(manifest["files"]["file.bin"]["sha256"]).exists()
+
+def test_missing_object_is_an_artifact_error(tmp_path):
+    store = ZDArtifactStore(tmp_path / "store")
+    write(tmp_path / "a" / "dist" / "bundle.zip", 100)
+    manifest = store.zd_collect(tmp_path / "a", ["dist"], {"VERSION": "1"})
+    store.zd_object_path(manifest["files"]["dist/bundle.zip"]["sha256"]).unlink()
+    with pytest.raises(ZDArtifactError, match="'dist/bundle.zip' .* is missing"):
+        store.zd_materialize(manifest, tmp_path / "dest")
+
+def test_materialize_round_trip(tmp_path):
+    store = ZDArtifactStore(tmp_path / "store")
+    write(tmp_path / "a" / "run.sh", 10)
+    (tmp_path / "a" / "run.sh").chmod(0o755)
+    manifest = store.zd_collect(tmp_path / "a", ["run.sh"], {})
+    assert store.zd_materialize(manifest, tmp_path / "dest") == 1
+    assert (tmp_path / "dest" / "run.sh").read_bytes() == (tmp_path / "a" / "run.sh").read_bytes()
+    assert os.access(tmp_path / "dest" / "run.sh", os.X_OK)
+
+def test_parallel_steps_storing_identical_outputs(tmp_path):
+    store = ZDArtifactStore(tmp_path / "store")
+    for index in range(8):
+        (tmp_path / f"step{index}").mkdir()
+        (tmp_path / f"step{index}" / "bundle.zip").write_bytes(b"same content" * 100000)
+
+    def store_outputs(index):
+        manifest = store.zd_collect(tmp_path / f"step{index}", ["bundle.zip"], {"VERSION": "1"})
+        return store.zd_save_manifest(manifest, f"action-{index % 2}")
+
+    # Parallel steps ingest from worker threads of the same process
+    with ThreadPoolExecutor(8) as pool:
+        digests = set(pool.map(store_outputs, range(8)))
+    assert len(digests) == 1
+    leftovers = [path for path in (tmp_path / "store").rglob(".*") if path.is_file()]
+    assert leftovers == []
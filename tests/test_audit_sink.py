@@ -0,0 +1,175 @@
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+from audit_sink import ZDAuditShipper, ZDHTTPSink, ZDSocketSink
+
+COLLECTOR = Path(__file__).resolve().parent.parent / "src" / "audit_sink.py"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def collector(tmp_path):
+    """Starts the stand-in collector (audit_sink.py); returns a start function and its output file."""
+    processes = []
+
+    def start(*args):
+        output = tmp_path / f"collected-{len(processes)}.ndjson"
+        errors = tmp_path / f"collector-{len(processes)}.err"
+        process = subprocess.Popen([sys.executable, str(COLLECTOR), *args],
+                                   stdout=open(output, "w"), stderr=open(errors, "w"))
+        processes.append(process)
+        deadline = time.monotonic() + 10
+        while "Collecting" not in errors.read_text():
+            assert process.poll() is None and time.monotonic() < deadline, errors.read_text()
+            time.sleep(0.05)
+        return process, output
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+def records(count, start=0):
+    return [{"timestamp": f"2026-01-01T00:00:{i:02d}", "kind": "action", "seq": i}
+            for i in range(start, start + count)]
+
+async def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.02)
+
+def collected(path):
+    return [json.loads(line)["seq"] for line in path.read_text().splitlines() if line.strip()]
+
+def test_outage_spools_and_next_session_delivers_in_order(collector, tmp_path):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/"
+    spool = tmp_path / "spool"
+    failing, _ = collector("--http", str(port), "--fail")
+
+    async def outage():
+        shipper = ZDAuditShipper(ZDHTTPSink("collector", url), spool, flush_interval=0.05)
+        for record in records(5):
+            shipper.zd_submit(record)
+        await wait_until(lambda: shipper.spooled == 5)
+        await shipper.zd_close()
+        return shipper
+
+    shipper = asyncio.run(outage())
+    assert shipper.sent == 0
+    assert "503" in shipper.last_error
+    assert sum(len(p.read_text().splitlines()) for p in (spool / "collector").glob("*.ndjson")) == 5
+
+    failing.kill()
+    failing.wait()
+    _, output = collector("--http", str(port))
+
+    async def recovery():
+        shipper = ZDAuditShipper(ZDHTTPSink("collector", url), spool, flush_interval=0.05)
+        shipper.zd_submit(records(1, start=5)[0])
+        await wait_until(lambda: shipper.sent == 6)
+        await shipper.zd_close()
+        return shipper
+
+    shipper = asyncio.run(recovery())
+    assert shipper.dropped == 0
+    # The spooled backlog goes before the new record
+    assert collected(output) == [0, 1, 2, 3, 4, 5]
+    assert list((spool / "collector").glob("*.ndjson")) == []
+
+def test_socket_sink_delivers_batches(collector, tmp_path):
+    path = tmp_path / "collector.sock"
+    _, output = collector("--socket", str(path))
+
+    async def scenario():
+        shipper = ZDAuditShipper(ZDSocketSink("socket", str(path)), tmp_path / "spool",
+                                 batch_size=3, flush_interval=0.05)
+        for record in records(7):
+            shipper.zd_submit(record)
+        await wait_until(lambda: shipper.sent == 7)
+        await shipper.zd_close()
+
+    asyncio.run(scenario())
+    deadline = time.monotonic() + 5
+    while len(collected(output)) < 7 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert collected(output) == list(range(7))
+
+def test_full_queue_spools_instead_of_blocking(tmp_path):
+    class Unreachable(ZDSocketSink):
+        async def zd_send(self, batch):
+            raise ConnectionRefusedError("down")
+
+    async def scenario():
+        shipper = ZDAuditShipper(Unreachable("down", str(tmp_path / "none")), tmp_path / "spool",
+                                 queue_size=2, spool_max_mb=None)
+        for record in records(10):
+            shipper.zd_submit(record)
+        spooled_while_submitting = shipper.spooled
+        await shipper.zd_close()
+        return shipper, spooled_while_submitting
+
+    shipper, spooled_while_submitting = asyncio.run(scenario())
+    assert spooled_while_submitting > 0
+    assert shipper.spooled == 10
+    assert shipper.sent == 0
+
+def test_torn_spool_line_is_skipped(collector, tmp_path, audit_logger):
+    path = tmp_path / "collector.sock"
+    _, output = collector("--socket", str(path))
+    segment = tmp_path / "spool" / "socket" / "1-1.ndjson"
+    segment.parent.mkdir(parents=True)
+    # A session killed mid-write leaves a partial last line
+    segment.write_text("".join(json.dumps(record) + "\n" for record in records(3)) + '{"timestamp": "2026-01-0')
+
+    async def scenario():
+        shipper = ZDAuditShipper(ZDSocketSink("socket", str(path)), tmp_path / "spool", flush_interval=0.05)
+        errors = []
+        shipper.on_error = errors.append
+        shipper.zd_submit(records(1, start=3)[0])
+        await wait_until(lambda: shipper.sent == 4)
+        await shipper.zd_close()
+        return shipper, errors
+
+    shipper, errors = asyncio.run(scenario())
+    assert shipper.corrupt == 1
+    assert errors == ["skipped 1 unreadable spooled lines in 1-1.ndjson"]
+    assert not segment.exists()
+    deadline = time.monotonic() + 5
+    while len(collected(output)) < 4 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert collected(output) == [0, 1, 2, 3]
+
+def test_worker_survives_unexpected_errors(tmp_path, audit_logger):
+    class Unreachable(ZDSocketSink):
+        async def zd_send(self, batch):
+            raise ConnectionRefusedError("down")
+
+    spool = tmp_path / "spool"
+    # A file where the spool directory should be: spooling fails with an error the worker doesn't expect
+    spool.write_text("")
+
+    async def scenario():
+        shipper = ZDAuditShipper(Unreachable("down", str(tmp_path / "none")), spool, flush_interval=0.01)
+        audit_logger.shippers = [shipper]
+        shipper.on_error = lambda message: audit_logger._zd_sink_error("down", message)
+        shipper.zd_submit(records(1)[0])
+        await wait_until(lambda: shipper.errors == 1)
+        spool.unlink()
+        # The worker is still alive and spools the record once the directory can be made
+        await wait_until(lambda: shipper.spooled == 1)
+        await shipper.zd_close()
+        return shipper
+
+    shipper = asyncio.run(scenario())
+    assert shipper.errors == 1
+    assert "audit_sink_error | down: worker error: " in audit_logger.log_file.read_text()
@@ -0,0 +1,147 @@
+import asyncio
+import configparser
+import json
+import sys
+from pathlib import Path
+import pytest
+from aws_credentials import ZDCredentialBroker, ZDCredentialError
+from zd_config import ZDConfig
+
+# Stands in for a real credential_process: prints fixed credentials and counts its runs
+FAKE_PROCESS = """import json, sys
+with open(sys.argv[1], "a") as f:
+    f.write("run\\n")
+print(json.dumps({"Version": 1, "AccessKeyId": "AKIAFAKE", "SecretAccessKey": "fake-secret",
+                  "SessionToken": "fake-token", "Expiration": "2099-01-01T00:00:00+00:00"}))
+"""
+
+@pytest.fixture
+def aws_files(tmp_path, monkeypatch):
+    """An AWS config whose 'deploy' profile has the fake credential_process, next to static keys."""
+    process = tmp_path / "fake_process.py"
+    process.write_text(FAKE_PROCESS)
+    runs = tmp_path / "runs"
+    config = tmp_path / "config"
+    config.write_text(
+        "[profile deploy]\n"
+        f"credential_process = {sys.executable} {process} {runs}\n"
+        "region = eu-west-1\n"
+        "[profile other]\n"
+        "region = us-east-1\n"
+        "[profile second]\n"
+        f"credential_process = {sys.executable} {process} {runs}\n"
+        "[profile chained]\n"
+        "role_arn = arn:aws:iam::123456789012:role/x\n"
+        "source_profile = other\n"
+    )
+    credentials = tmp_path / "credentials"
+    credentials.write_text(
+        "[deploy]\naws_access_key_id = SHADOWS\naws_secret_access_key = broker\n"
+        "[other]\naws_access_key_id = AKIAOTHER\naws_secret_access_key = other-secret\n"
+    )
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config))
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(credentials))
+    return runs
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_broker_is_opt_in():
+    assert ZDConfig().aws_broker is False
+
+def test_credential_process_runs_once_per_session(aws_files, audit_logger):
+    async def scenario():
+        broker = ZDCredentialBroker(ZDConfig(aws_broker=True), audit_logger)
+        try:
+            first, second = await asyncio.gather(broker.zd_credentials("deploy"), broker.zd_credentials("deploy"))
+            third = await broker.zd_credentials("deploy")
+        finally:
+            await broker.zd_close()
+        return first, second, third
+
+    first, second, third = run(scenario())
+    assert first.access_key_id == "AKIAFAKE"
+    assert first is second is third
+    assert aws_files.read_text().count("run") == 1
+
+def test_process_injection_keeps_other_profiles(aws_files, audit_logger):
+    async def scenario():
+        broker = ZDCredentialBroker(ZDConfig(aws_broker=True), audit_logger)
+        try:
+            env = await broker.zd_env("deploy")
+            config = configparser.RawConfigParser()
+            config.read(env["AWS_CONFIG_FILE"])
+            credentials = configparser.RawConfigParser()
+            credentials.read(env["AWS_SHARED_CREDENTIALS_FILE"])
+            # What an SDK in the step would run to get the deploy profile's credentials
+            process = await asyncio.create_subprocess_shell(
+                config.get("profile deploy", "credential_process"), stdout=asyncio.subprocess.PIPE
+            )
+            stdout, _ = await process.communicate()
+        finally:
+            await broker.zd_close()
+        return env, config, credentials, json.loads(stdout)
+
+    env, config, credentials, served = run(scenario())
+    assert config.get("profile deploy", "region") == "eu-west-1"
+    assert config.get("profile other", "region") == "us-east-1"
+    assert config.get("profile chained", "source_profile") == "other"
+    assert not credentials.has_section("deploy")
+    assert credentials.get("other", "aws_access_key_id") == "AKIAOTHER"
+    assert served["AccessKeyId"] == "AKIAFAKE"
+    assert served["SessionToken"] == "fake-token"
+    # The broker answered from its cache instead of running the process again
+    assert aws_files.read_text().count("run") == 1
+    assert not Path(env["AWS_CONFIG_FILE"]).exists()
+
+def test_parallel_profiles_get_their_own_files(aws_files, audit_logger):
+    async def scenario():
+        broker = ZDCredentialBroker(ZDConfig(aws_broker=True), audit_logger)
+        try:
+            envs = await asyncio.gather(broker.zd_env("deploy"), broker.zd_env("second"), broker.zd_env("deploy"))
+            configs = []
+            for env in envs:
+                config = configparser.RawConfigParser()
+                config.read(env["AWS_CONFIG_FILE"])
+                configs.append(config)
+        finally:
+            await broker.zd_close()
+        return envs, configs
+
+    envs, configs = run(scenario())
+    assert envs[0] == envs[2]
+    assert envs[0]["AWS_CONFIG_FILE"] != envs[1]["AWS_CONFIG_FILE"]
+    # Each file brokers its own profile and leaves the other on its original credential_process
+    assert configs[0].get("profile deploy", "credential_process").endswith(" deploy")
+    assert "fake_process.py" in configs[0].get("profile second", "credential_process")
+    assert configs[1].get("profile second", "credential_process").endswith(" second")
+    assert "fake_process.py" in configs[1].get("profile deploy", "credential_process")
+
+def test_env_injection(aws_files, audit_logger):
+    async def scenario():
+        broker = ZDCredentialBroker(ZDConfig(aws_broker=True, aws_broker_inject="env"), audit_logger)
+        try:
+            return await broker.zd_env("deploy")
+        finally:
+            await broker.zd_close()
+
+    assert run(scenario()) == {
+        "AWS_ACCESS_KEY_ID": "AKIAFAKE", "AWS_SECRET_ACCESS_KEY": "fake-secret", "AWS_SESSION_TOKEN": "fake-token"
+    }
+
+def test_missing_resolver_is_not_retried(aws_files, audit_logger, tmp_path):
+    missing = str(tmp_path / "no-such-aws")
+
+    async def scenario():
+        broker = ZDCredentialBroker(ZDConfig(aws_broker=True, aws_broker_command=(missing,)), audit_logger)
+        try:
+            with pytest.raises(ZDCredentialError, match="cannot run"):
+                await broker.zd_credentials("other")
+            # Remembered, so later steps fall back at once
+            assert "other" in broker._unavailable
+            with pytest.raises(ZDCredentialError, match="cannot run"):
+                await broker.zd_credentials("other")
+        finally:
+            await broker.zd_close()
+
+    run(scenario())
@@ -0,0 +1,85 @@
+import asyncio
+from concurrency_governor import ZDGovernor, ZDHostSignals
+from zd_config import ZDConfig
+
+IDLE = ZDHostSignals(load_avg=0.1, cpu_count=4, mem_available_mb=8192,
+                     cpu_pressure=0.0, memory_pressure=0.0, io_pressure=0.0)
+LOADED = ZDHostSignals(load_avg=20.0, cpu_count=4, mem_available_mb=8192,
+                       cpu_pressure=0.0, memory_pressure=0.0, io_pressure=0.0)
+
+def config(**overrides):
+    return ZDConfig(**{"min_parallel": 2, "max_parallel": 8, **overrides})
+
+def test_host_signals_from_proc(tmp_path):
+    (tmp_path / "loadavg").write_text("3.50 2.00 1.00 2/300 1234\n")
+    (tmp_path / "meminfo").write_text("MemTotal: 16384000 kB\nMemAvailable: 1048576 kB\n")
+    (tmp_path / "pressure").mkdir()
+    (tmp_path / "pressure" / "cpu").write_text(
+        "some avg10=42.50 avg60=10.00 avg300=1.00 total=1\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+    )
+    signals = ZDHostSignals.read(tmp_path)
+    assert signals.load_avg == 3.5
+    assert signals.mem_available_mb == 1024
+    assert signals.cpu_pressure == 42.5
+    # Missing files are unknown, not zero
+    assert signals.memory_pressure is None and signals.io_pressure is None
+    assert signals.overload_reason(config(max_pressure=25.0, max_load_per_cpu=100)) == "cpu pressure 42.5%"
+
+def test_overload_reasons():
+    assert IDLE.overload_reason(config()) is None
+    assert LOADED.overload_reason(config()).startswith("load 20.00")
+    low_memory = ZDHostSignals(0.1, 4, 100, None, None, None)
+    assert low_memory.overload_reason(config(min_free_memory_mb=512)) == "100MB memory available"
+
+def test_limit_bounds_in_flight_weight(audit_logger):
+    async def scenario():
+        governor = ZDGovernor(config(), audit_logger)
+        assert await governor.zd_acquire()
+        assert await governor.zd_acquire()
+        waiter = asyncio.create_task(governor.zd_acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        governor.zd_release()
+        assert await asyncio.wait_for(waiter, 1)
+        return governor.in_flight
+
+    assert asyncio.run(scenario()) == 2
+
+def test_heavy_step_runs_alone(audit_logger):
+    async def scenario():
+        governor = ZDGovernor(config(), audit_logger)
+        assert await governor.zd_acquire(5)
+        light = asyncio.create_task(governor.zd_acquire(1))
+        await asyncio.sleep(0.01)
+        assert not light.done()
+        governor.zd_release(5)
+        return await asyncio.wait_for(light, 1)
+
+    assert asyncio.run(scenario())
+
+def test_close_wakes_waiters(audit_logger):
+    async def scenario():
+        governor = ZDGovernor(config(min_parallel=1), audit_logger)
+        await governor.zd_acquire()
+        waiter = asyncio.create_task(governor.zd_acquire())
+        await asyncio.sleep(0.01)
+        governor.zd_close()
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(scenario()) is False
+
+def test_adjust_grows_when_busy_and_shrinks_under_load(audit_logger):
+    async def scenario():
+        governor = ZDGovernor(config(max_parallel=4), audit_logger)
+        # Idle slots: no reason to grow
+        await governor.zd_adjust(IDLE)
+        assert governor.limit == 2
+        for _ in range(5):
+            governor.in_flight = governor.limit
+            await governor.zd_adjust(IDLE)
+        assert governor.limit == 4
+        for _ in range(5):
+            await governor.zd_adjust(LOADED)
+        return governor.limit
+
+    assert asyncio.run(scenario()) == 2
@@ -0,0 +1,173 @@
+import asyncio
+import gzip
+import subprocess
+import time
+import tracemalloc
+import pytest
+from deployment_executor import ZDExecutor
+from deployment_manager import ZDManager
+from zd_config import ZDConfig
+
+@pytest.fixture
+def plan(tmp_path):
+    """Build a plan of steps running the given bash scripts from a local repository."""
+    repo = tmp_path / "repo"
+    (repo / "scripts").mkdir(parents=True)
+
+    def build(*scripts, **step_fields):
+        manager = ZDManager()
+        for index, body in enumerate(scripts):
+            script = repo / "scripts" / f"step{index}.sh"
+            script.write_text("#!/bin/bash\n" + body)
+            script.chmod(0o755)
+            lines = [f"name: step{index}", "aws_profile: default", f"repo_url: {repo}", "ssh_key: ''",
+                     f"script_path: scripts/step{index}.sh"]
+            lines += [f"{key}: {value}" for key, value in step_fields.items()]
+            (tmp_path / f"step{index}.yml").write_text("\n".join(lines) + "\n")
+        subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+        subprocess.run(["git", "add", "."], cwd=repo, check=True)
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "scripts"],
+                       cwd=repo, check=True)
+        for index in range(len(scripts)):
+            manager.zd_add_step(tmp_path / f"step{index}.yml")
+        return manager
+
+    return build
+
+def run(manager, audit_logger, tmp_path, instrument=None, **settings):
+    """Run a plan to the end and return its executor and every output event.
+
+    instrument is called with the executor before it is prepared.
+    """
+    config = ZDConfig(cache_dir=tmp_path / "cache", workspace_root=tmp_path / "workspaces",
+                      preflight=False, history_store=False, **settings)
+
+    async def scenario():
+        executor = ZDExecutor(manager, audit_logger, config)
+        if instrument:
+            instrument(executor)
+        assert await executor.zd_prepare()
+        subscription = executor.bus.zd_subscribe("test", 10000)
+        runner = asyncio.create_task(executor.zd_run())
+        try:
+            events = [event async for event in subscription]
+            await runner
+        finally:
+            await executor.zd_cleanup()
+            await executor.workspace_pool.zd_close()
+        return executor, events
+
+    return asyncio.run(scenario())
+
+def test_secrets_are_redacted_before_output_is_published(plan, audit_logger, tmp_path):
+    manager = plan('echo "token is $TOKEN"\n',
+                   env_vars="{TOKEN: hunter22}", secrets="[TOKEN]")
+    executor, events = run(manager, audit_logger, tmp_path, record_session=True)
+    raw = "".join(event.raw for event in events)
+    formatted = "".join(event.formatted for event in events)
+    assert "token is ********" in raw
+    assert "hunter22" not in raw and "hunter22" not in formatted
+    # The output store segments and the session recording are written from the bus
+    written = [path for path in (tmp_path / "logs").rglob("*") if path.is_file()]
+    assert any(path.name.endswith(".zdrec.gz") for path in written)
+    for path in written:
+        data = gzip.decompress(path.read_bytes()) if path.name.endswith(".gz") else path.read_bytes()
+        assert b"hunter22" not in data, path
+
+def gone(pid):
+    """Whether a process has exited (reaped, or a zombie nobody has reaped yet)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(")")[2].split()[0] == "Z"
+    except FileNotFoundError:
+        return True
+
+def test_step_timeout_kills_the_script(plan, audit_logger, tmp_path):
+    manager = plan("echo started\nsleep 30\necho finished\n", timeout=0.5)
+    start = time.monotonic()
+    _, events = run(manager, audit_logger, tmp_path)
+    raw = "".join(event.raw for event in events)
+    assert time.monotonic() - start < 10
+    assert "started" in raw and "finished" not in raw
+    assert "Script terminated: step timeout after 0.5s" in raw
+    assert [state for event in events for state in event.states] == ["running", "failed"]
+
+def test_sigterm_is_escalated_and_the_group_swept(plan, audit_logger, tmp_path):
+    pid_file = tmp_path / "grandchild.pid"
+    # The script and its background grandchild both ignore SIGTERM
+    manager = plan(f"trap '' TERM\n(trap '' TERM; sleep 30) &\necho $! > {pid_file}\nsleep 30\n", timeout=0.5)
+    start = time.monotonic()
+    _, events = run(manager, audit_logger, tmp_path, kill_grace_period=0.5)
+    assert time.monotonic() - start < 10
+    assert "ignored SIGTERM for 0.5s" in audit_logger.log_file.read_text()
+    assert gone(int(pid_file.read_text()))
+    assert any("failed" in event.states for event in events)
+
+def test_plan_timeout_cancels_the_run(plan, audit_logger, tmp_path):
+    manager = plan("sleep 30\n", "echo second\n")
+    start = time.monotonic()
+    executor, events = run(manager, audit_logger, tmp_path, plan_timeout=0.5)
+    raw = "".join(event.raw for event in events)
+    assert time.monotonic() - start < 10
+    assert executor.cancelled
+    assert "=== Deployment Cancelled: plan timeout after 0.5s ===" in raw
+    assert "second" not in raw
+
+def timeline(log):
+    """An instrument recording clones and step state changes, in the order they happen."""
+    def instrument(executor):
+        clone, publish = executor.zd_clone_repo, executor.bus.zd_publish
+
+        async def logged_clone(step, directory):
+            log.append(("clone", step.order))
+            return await clone(step, directory)
+
+        async def logged_publish(event):
+            log.extend((state, event.step.order) for state in getattr(event, "states", ()) if event.step)
+            await publish(event)
+
+        executor.zd_clone_repo = logged_clone
+        executor.bus.zd_publish = logged_publish
+
+    return instrument
+
+@pytest.mark.parametrize("depth", [0, 1])
+def test_pipelining_checks_out_the_next_step_while_one_runs(plan, audit_logger, tmp_path, depth):
+    manager = plan("sleep 0.3\n", "sleep 0.3\n", "echo last\n")
+    log = []
+    run(manager, audit_logger, tmp_path, timeline(log), pipeline_depth=depth, share_checkouts=False)
+    assert [order for state, order in log if state == "succeeded"] == [0, 1, 2]
+    if depth:
+        # Step 2 is cloned while step 1 runs, but nothing further ahead than the pipeline depth
+        assert log.index(("clone", 1)) < log.index(("succeeded", 0)) < log.index(("clone", 2))
+    else:
+        assert log.index(("succeeded", 0)) < log.index(("clone", 1))
+
+def test_resource_report_covers_each_step(plan, audit_logger, tmp_path):
+    manager = plan("echo one\n", "echo two\n")
+    executor, events = run(manager, audit_logger, tmp_path, resource_report=True)
+    raw = "".join(event.raw for event in events)
+    assert "=== Resource Report ===" in raw
+    assert [phase.name for phase in executor.resources.phases] == ["steps"]
+    assert [step.name for step in executor.resources.steps] == ["step0", "step1"]
+    assert all(step.usage["max_rss_kb"] > 0 and step.usage_exact for step in executor.resources.steps)
+    assert not tracemalloc.is_tracing()
+    written, = audit_logger.log_file.parent.glob(f"{audit_logger.log_file.stem}_resources_*.txt")
+    assert f"Resource report written to {written}" in raw
+
+def test_steps_on_one_repository_share_a_clone(plan, audit_logger, tmp_path):
+    # A worktree's .git is a file pointing into the shared clone
+    manager = plan(*['cd "$(dirname "$0")/.." && test -f .git\n'] * 3)
+    log = []
+    run(manager, audit_logger, tmp_path, timeline(log), share_checkouts=True)
+    assert [order for state, order in log if state == "succeeded"] == [0, 1, 2]
+    assert [entry for entry in log if entry[0] == "clone"] == [("clone", 0)]
+    assert "for 3 steps" in audit_logger.log_file.read_text()
+
+def test_failed_shared_clone_fails_every_step(plan, audit_logger, tmp_path):
+    manager = plan("echo one\n", "echo two\n")
+    subprocess.run(["rm", "-rf", str(tmp_path / "repo")], check=True)
+    log = []
+    run(manager, audit_logger, tmp_path, timeline(log), share_checkouts=True)
+    assert [entry for entry in log if entry[0] == "clone"] == [("clone", 0)]
+    assert [order for state, order in log if state == "failed"] == [0, 1]
@@ -0,0 +1,26 @@
+import asyncio
+import shutil
+from pathlib import Path
+import pytest
+from audit_logger import REDACTED
+from deployment_manager import ZDManager, ZDStepCache
+from yaml_preview import ZDYamlPreview
+
+STEP = Path(__file__).parent / "deployment_yamls" / "step1.yml"
+
+@pytest.mark.parametrize("step_cache", [None, ZDStepCache()])
+def test_same_file_by_another_path_is_a_duplicate(tmp_path, monkeypatch, step_cache):
+    shutil.copy(STEP, tmp_path / "step.yml")
+    monkeypatch.chdir(tmp_path)
+    manager = ZDManager(step_cache)
+    manager.zd_add_step(Path("step.yml"))
+    with pytest.raises(ValueError, match="already in ZenDeploy steps"):
+        manager.zd_add_step(tmp_path / "sub" / ".." / "step.yml")
+    assert len(manager.steps) == 1
+
+def test_yaml_preview_redacts_secret_env_vars(tmp_path):
+    step = tmp_path / "step.yml"
+    step.write_text(STEP.read_text().rstrip() + "\n  TOKEN: hunter22\nsecrets: [TOKEN]\n")
+    rows = dict(asyncio.run(ZDYamlPreview().zd_rows(step)).rows)
+    assert rows["env_vars.TOKEN"] == REDACTED
+    assert rows["env_vars.TEST_VAR"] == "Hello"
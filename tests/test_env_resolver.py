@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from env_resolver import ZDEnvResolver, ZDInterpolationError, ZDReference, zd_parse, zd_references
+from zd_config import ZDConfig
+
+def test_escapes_and_literals():
+    assert zd_parse("plain") == ["plain"]
+    assert zd_parse(42) == ["42"]
+    assert zd_parse("$${HOME} stays") == ["${HOME} stays"]
+    assert zd_parse("a-${env:USER}-b") == ["a-", ZDReference("env", "USER"), "-b"]
+
+def test_nested_braces_in_commands():
+    assert zd_parse("${cmd:awk '{print $1}' f}") == [ZDReference("cmd", "awk '{print $1}' f")]
+
+def test_step_references():
+    reference = zd_parse("${step.build.output.IMAGE_TAG}")[0]
+    assert reference == ZDReference("step", "build", "IMAGE_TAG")
+    assert str(reference) == "${step.build.output.IMAGE_TAG}"
+    assert zd_references({"A": "${step.build.output.X}", "B": "${env:Y}", "C": "${oops"}) == {
+        ZDReference("step", "build", "X"), ZDReference("env", "Y")
+    }
+
+@pytest.mark.parametrize("value", ["${unterminated", "${nope:x}", "${env:}"])
+def test_malformed_references(value):
+    with pytest.raises(ZDInterpolationError):
+        zd_parse(value)
+    assert ZDEnvResolver.zd_problems({"KEY": value})[0].startswith("KEY: ")
+
+def resolve(resolver, env_vars, step_outputs=None):
+    return resolver.zd_resolve(env_vars, step_outputs or {})
+
+def test_values_are_resolved(tmp_path, monkeypatch, audit_logger):
+    monkeypatch.setenv("ZD_TEST_REGION", "eu-west-1")
+    secret = tmp_path / "secret"
+    secret.write_text("s3cret\n")
+    resolver = ZDEnvResolver(ZDConfig(), audit_logger)
+    outputs = {"build": ("digest", {"results": {"TAG": "v1"}})}
+    resolved = asyncio.run(resolve(resolver, {
+        "REGION": "${env:ZD_TEST_REGION}",
+        "SECRET": f"${{file:{secret}}}",
+        "GREETING": "${cmd:echo hi}-$${literal}",
+        "TAG": "${step.build.output.TAG}",
+        "COUNT": 3,
+    }, outputs))
+    assert resolved == {"REGION": "eu-west-1", "SECRET": "s3cret", "GREETING": "hi-${literal}",
+                        "TAG": "v1", "COUNT": "3"}
+
+def test_commands_are_memoized_and_shared(tmp_path, audit_logger):
+    counter = tmp_path / "runs"
+    command = f"echo run >> {counter}; sleep 0.1; echo value"
+    resolver = ZDEnvResolver(ZDConfig(interpolation_ttl=300), audit_logger)
+
+    async def scenario():
+        # Concurrent steps wait on one lookup
+        first = await asyncio.gather(*(resolve(resolver, {"V": f"${{cmd:{command}}}"}) for _ in range(5)))
+        again = await resolve(resolver, {"W": f"x${{cmd:{command}}}"})
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    assert all(result == {"V": "value"} for result in first)
+    assert again == {"W": "xvalue"}
+    assert counter.read_text().count("run") == 1
+
+def test_expired_values_are_looked_up_again(tmp_path, audit_logger):
+    counter = tmp_path / "runs"
+    resolver = ZDEnvResolver(ZDConfig(interpolation_ttl=0), audit_logger)
+
+    async def scenario():
+        for _ in range(3):
+            await resolve(resolver, {"V": f"${{cmd:echo run >> {counter}}}"})
+
+    asyncio.run(scenario())
+    assert counter.read_text().count("run") == 3
+
+def test_step_results_are_not_memoized(audit_logger):
+    resolver = ZDEnvResolver(ZDConfig(), audit_logger)
+    env_vars = {"TAG": "${step.build.output.TAG}"}
+
+    async def scenario():
+        first = await resolve(resolver, env_vars, {"build": ("a", {"results": {"TAG": "v1"}})})
+        second = await resolve(resolver, env_vars, {"build": ("b", {"results": {"TAG": "v2"}})})
+        return first, second
+
+    assert asyncio.run(scenario()) == ({"TAG": "v1"}, {"TAG": "v2"})
+
+def test_failures(monkeypatch, audit_logger):
+    monkeypatch.delenv("ZD_TEST_UNSET", raising=False)
+    resolver = ZDEnvResolver(ZDConfig(interpolation_cmd_timeout=0.2), audit_logger)
+    for env_vars, message in (({"A": "${env:ZD_TEST_UNSET}"}, "not set"),
+                              ({"A": "${cmd:echo oops >&2; exit 3}"}, "exit code 3: oops"),
+                              ({"A": "${cmd:sleep 5}"}, "timed out"),
+                              ({"A": "${step.build.output.X}"}, "has no outputs")):
+        with pytest.raises(ZDInterpolationError, match=message):
+            asyncio.run(resolve(resolver, env_vars))
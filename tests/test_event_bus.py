@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from event_bus import BLOCK, COALESCE, DROP_OLDEST, ZDEventBus, ZDOutputEvent, ZDSubscription
+
+def event(order, text):
+    step = SimpleNamespace(order=order) if order is not None else None
+    return ZDOutputEvent(step, text, text)
+
+async def drain(subscription):
+    return [item async for item in subscription]
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ZDSubscription("x", policy="lossy")
+
+def test_drop_oldest_keeps_newest_and_counts():
+    async def scenario():
+        bus = ZDEventBus()
+        subscription = bus.zd_subscribe("viewer", 3, DROP_OLDEST)
+        for index in range(10):
+            await bus.zd_publish(index)
+        bus.zd_close()
+        return subscription, await drain(subscription)
+
+    subscription, received = asyncio.run(scenario())
+    assert received == [7, 8, 9]
+    assert subscription.dropped == 7
+    assert subscription.peak == 3
+
+def test_coalesce_merges_per_step_in_order():
+    async def scenario():
+        bus = ZDEventBus()
+        subscription = bus.zd_subscribe("screen", 2, COALESCE)
+        for index in range(6):
+            await bus.zd_publish(event(index % 2, f"{index}"))
+        await bus.zd_publish(event(None, "run"))
+        bus.zd_close()
+        return subscription, await drain(subscription)
+
+    subscription, received = asyncio.run(scenario())
+    # Nothing is lost: each step's output arrives merged, in order
+    assert "".join(e.formatted for e in received if e.key == 0) == "024"
+    assert "".join(e.formatted for e in received if e.key == 1) == "135"
+    assert [e.raw for e in received if e.key is None] == ["run"]
+    assert subscription.coalesced == 4
+    # Bounded by maxsize plus one entry per key
+    assert len(received) <= 2 + 3
+
+def test_block_applies_backpressure_without_loss():
+    async def scenario():
+        bus = ZDEventBus()
+        subscription = bus.zd_subscribe("files", 2, BLOCK)
+        received = []
+
+        async def consume():
+            async for item in subscription:
+                received.append(item)
+                await asyncio.sleep(0.001)
+
+        consumer = asyncio.create_task(consume())
+        for index in range(50):
+            await bus.zd_publish(index)
+            assert len(subscription) <= 2
+        bus.zd_close()
+        await consumer
+        return received, subscription
+
+    received, subscription = asyncio.run(scenario())
+    assert received == list(range(50))
+    assert subscription.dropped == subscription.coalesced == 0
+
+def test_full_blocking_subscription_rejects_nowait():
+    subscription = ZDSubscription("files", 1, BLOCK)
+    subscription.zd_put_nowait(1)
+    with pytest.raises(asyncio.QueueFull):
+        subscription.zd_put_nowait(2)
+
+def test_slow_subscriber_does_not_hold_up_others():
+    async def scenario():
+        bus = ZDEventBus()
+        fast = bus.zd_subscribe("fast", 1000, BLOCK)
+        slow = bus.zd_subscribe("slow", 1, DROP_OLDEST)
+        for index in range(100):
+            await asyncio.wait_for(bus.zd_publish(index), 1)
+        bus.zd_close()
+        return await drain(fast), await drain(slow)
+
+    fast, slow = asyncio.run(scenario())
+    assert fast == list(range(100))
+    assert slow == [99]
+
+def test_unsubscribe_and_late_subscribe():
+    async def scenario():
+        bus = ZDEventBus()
+        subscription = bus.zd_subscribe("gone")
+        await bus.zd_publish(1)
+        bus.zd_unsubscribe(subscription)
+        await bus.zd_publish(2)
+        bus.zd_close()
+        late = bus.zd_subscribe("late")
+        return await drain(subscription), await drain(late), bus.subscriptions
+
+    gone, late, subscriptions = asyncio.run(scenario())
+    assert gone == [] and late == []
+    assert subscriptions == ()
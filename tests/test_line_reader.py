@@ -0,0 +1,53 @@
+import asyncio
+from line_reader import ZDLineReader
+
+def read(data: bytes, chunk_size: int = 65536, max_line_length: int = 16384):
+    """All lines a reader produces from data, and the batches they came in."""
+    async def scenario():
+        stream = asyncio.StreamReader()
+        stream.feed_data(data)
+        stream.feed_eof()
+        reader = ZDLineReader(stream, chunk_size, max_line_length)
+        return [batch async for batch in reader.zd_batches()]
+
+    batches = asyncio.run(scenario())
+    return [line for batch in batches for line in batch], batches
+
+def test_plain_lines_and_unterminated_last_line():
+    lines, _ = read(b"one\ntwo\r\nthree")
+    assert lines == ["one", "two", "three"]
+
+def test_carriage_return_redraws_keep_final_state():
+    lines, _ = read(b"10%\r50%\r100%\ndone\n")
+    assert lines == ["100%", "done"]
+
+def test_crlf_split_across_chunks_is_one_line_end():
+    # Each chunk boundary can fall between \r and \n
+    for chunk_size in range(1, 8):
+        lines, _ = read(b"ab\r\ncd\r\n", chunk_size=chunk_size)
+        assert lines == ["ab", "cd"], chunk_size
+
+def test_trailing_carriage_return_at_eof_ends_the_line():
+    lines, _ = read(b"last\r")
+    assert lines == ["last"]
+
+def test_long_lines_are_truncated_with_a_note():
+    lines, _ = read(b"x" * 100 + b"\nshort\n", chunk_size=7, max_line_length=10)
+    assert lines == ["x" * 10 + " ...[truncated 90 chars]", "short"]
+
+def test_redraw_resets_truncation():
+    lines, _ = read(b"y" * 50 + b"\rok\n", max_line_length=10)
+    assert lines == ["ok"]
+
+def test_multibyte_characters_split_across_chunks():
+    text = "héllo wörld ✓\n"
+    lines, _ = read(text.encode() * 3, chunk_size=1)
+    assert lines == [text.strip()] * 3
+
+def test_invalid_utf8_is_replaced():
+    lines, _ = read(b"bad \xff byte\n")
+    assert lines == ["bad � byte"]
+
+def test_lines_batched_per_chunk():
+    _, batches = read(b"a\nb\nc\n", chunk_size=65536)
+    assert batches == [["a", "b", "c"]]
@@ -0,0 +1,80 @@
+import pytest
+from output_classifier import BUILTIN_RULES, ZDOutputClassifier, ZDOutputRule, ZDOutputSummary
+from zd_config import ZDConfig
+
+def classifier(*specs):
+    return ZDOutputClassifier([ZDOutputRule.from_dict(spec) for spec in specs])
+
+def test_builtin_rules():
+    builtin = ZDOutputClassifier.for_config(ZDConfig())
+    assert builtin.zd_classify("Error: No changes") == "error"
+    assert builtin.zd_classify("  ERROR[E042]: bad input") == "error"
+    assert builtin.zd_classify("Traceback (most recent call last):") == "error"
+    assert builtin.zd_classify("Warning: deprecated flag") == "warning"
+    assert builtin.zd_classify("no errors: all good") is None
+    assert builtin.zd_classify("plain output") is None
+
+def test_builtin_rules_can_be_disabled():
+    assert ZDOutputClassifier.for_config(ZDConfig(classifier_builtin=False)).zd_classify("Error: x") is None
+
+def test_most_severe_rule_wins():
+    rules = classifier({"pattern": "disk", "severity": "warning"}, {"pattern": "full", "severity": "fatal"})
+    assert rules.zd_classify("disk full") == "fatal"
+    assert rules.zd_classify("disk ok") == "warning"
+
+def test_ignore_rules_exempt_lines():
+    rules = classifier({"pattern": "Error:", "literal": True}, {"pattern": "Error: No changes", "severity": "ignore"})
+    assert rules.zd_classify("Error: No changes") is None
+    assert rules.zd_classify("Error: access denied") == "error"
+
+def test_literal_and_ignore_case():
+    rules = classifier({"pattern": "a.b(c)", "literal": True, "severity": "warning"},
+                       {"pattern": "panic", "ignore_case": True, "severity": "fatal"})
+    assert rules.zd_classify("x a.b(c) y") == "warning"
+    assert rules.zd_classify("axb(c)") is None
+    assert rules.zd_classify("PANIC: oh no") == "fatal"
+
+def test_rule_validation():
+    with pytest.raises(ValueError, match="Unknown severity"):
+        ZDOutputRule.from_dict({"pattern": "x", "severity": "critical"})
+    assert ZDOutputClassifier.zd_problems([{"pattern": "("}])[0].startswith("Output rule '('")
+    assert ZDOutputClassifier.zd_problems([{"severity": "error"}]) == [
+        "Output rule {'severity': 'error'} needs a pattern"
+    ]
+    assert ZDOutputClassifier.zd_problems({"pattern": "x"}) == [
+        "output_rules must be a list of {pattern, severity} mappings"
+    ]
+    assert ZDOutputClassifier.zd_problems([{"pattern": "ok", "severity": "ignore"}]) == []
+
+def test_step_rules_extend_and_are_compiled_once():
+    base = ZDOutputClassifier([ZDOutputRule.from_dict(spec) for spec in BUILTIN_RULES])
+    specs = [{"pattern": "drift detected", "severity": "fatal"}]
+    step = base.zd_for_step(specs)
+    assert step.zd_classify("drift detected in vpc") == "fatal"
+    assert step.zd_classify("Error: x") == "error"
+    assert base.zd_classify("drift detected in vpc") is None
+    assert base.zd_for_step([dict(spec) for spec in specs]) is step
+    assert base.zd_for_step([]) is base
+
+def test_summary_counts_and_samples():
+    summary = ZDOutputSummary(max_samples=2)
+    for index in range(4):
+        summary.zd_add("error", f"Error: {index}")
+    summary.zd_add("warning", "Warning: w")
+    assert summary.counts == {"fatal": 0, "error": 4, "warning": 1}
+    assert summary.samples["error"] == ["Error: 0", "Error: 1"]
+    assert summary.matched == 5
+
+def test_rules_with_groups_are_matched_on_their_own():
+    rules = classifier({"pattern": r"(?P<code>E\d+) failed", "severity": "error"},
+                       {"pattern": r"(?P<code>W\d+) retry", "severity": "warning"},
+                       {"pattern": r"(\w)\1\1", "severity": "fatal"},
+                       {"pattern": "timeout", "severity": "warning"})
+    assert rules.zd_classify("E42 failed") == "error"
+    assert rules.zd_classify("W7 retry") == "warning"
+    assert rules.zd_classify("zzz") == "fatal"
+    assert rules.zd_classify("xyz") is None
+    assert rules.zd_classify("read timeout") == "warning"
+    assert ZDOutputClassifier.zd_problems([
+        {"pattern": r"(?P<code>E\d+)"}, {"pattern": r"(?P<code>W\d+)", "severity": "warning"}
+    ]) == []
@@ -0,0 +1,60 @@
+import re
+from types import SimpleNamespace
+import pytest
+import output_store
+from output_store import ZDOutputStore
+
+@pytest.fixture
+def segment(tmp_path):
+    store = ZDOutputStore(tmp_path / "run")
+    yield store.zd_segment(SimpleNamespace(order=0, name="deploy app"))
+    store.zd_close()
+
+def test_paging_reads_only_the_requested_lines(segment):
+    segment.zd_append("".join(f"line {n}\n" for n in range(1000)))
+    reader = segment.zd_reader()
+    assert segment.data_path.name == "step_001_deploy_app.out"
+    assert reader.line_count == segment.line_count == 1000
+    assert reader.zd_lines(0, 2) == ["line 0", "line 1"]
+    assert reader.zd_lines(998, 10) == ["line 998", "line 999"]
+    assert reader.zd_lines(-5, 1) == ["line 0"]
+    assert reader.zd_line_at(len("line 0\n")) == 1
+    reader.zd_close()
+
+def test_refresh_picks_up_appended_lines(segment):
+    reader = segment.zd_reader()
+    assert reader.line_count == 0 and reader.zd_lines(0, 10) == []
+    segment.zd_append("first\nzürich ✓\n")
+    segment.zd_flush()
+    reader.zd_refresh()
+    assert reader.zd_lines(0, 10) == ["first", "zürich ✓"]
+    reader.zd_close()
+
+def test_search_finds_each_matching_line_once_across_chunks(segment):
+    segment.zd_append("".join(f"{'error ' * 3 if n % 100 == 0 else 'ok'} {n}\n" for n in range(1000)))
+    reader = segment.zd_reader()
+    results = list(reader.zd_search(re.compile(rb"error"), chunk_bytes=256))
+    hits = [(line_no, line) for line_no, line in results if line_no is not None]
+    assert [line_no for line_no, _ in hits] == list(range(0, 1000, 100))
+    assert hits[1][1] == "error error error  100"
+    # Control goes back to the caller after every chunk
+    assert results.count((None, None)) > 10
+    assert [line_no for line_no, _ in reader.zd_search(re.compile(rb"error"), start_line=901) if line_no is not None] == []
+    reader.zd_close()
+
+def test_index_is_read_as_little_endian_on_any_host(segment, monkeypatch):
+    segment.zd_append("a\nbb\nccc\n")
+    monkeypatch.setattr(output_store, "_NATIVE_INDEX", False)
+    reader = segment.zd_reader()
+    assert reader.zd_lines(0, 3) == ["a", "bb", "ccc"]
+    assert reader.zd_line_at(5) == 2
+    reader.zd_close()
+
+def test_partial_index_entries_are_ignored(segment):
+    segment.zd_append("a\nb\n")
+    segment.zd_flush()
+    with open(segment.index_path, "ab") as index:
+        index.write(b"\x00\x01\x02")
+    reader = segment.zd_reader()
+    assert reader.zd_lines(0, 5) == ["a", "b"]
+    reader.zd_close()
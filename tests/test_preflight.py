@@ -0,0 +1,84 @@
+import asyncio
+import subprocess
+from pathlib import Path
+import pytest
+from deployment_manager import ZDStep
+from preflight import ZDPreflight
+from zd_config import ZDConfig
+
+@pytest.fixture
+def repo(tmp_path):
+    """A file:// repository with one script."""
+    path = tmp_path / "repo"
+    path.mkdir()
+    (path / "deploy.sh").write_text("#!/bin/sh\necho deployed\n")
+    for command in (["init", "-q"], ["add", "deploy.sh"],
+                    ["-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "init"]):
+        subprocess.run(["git", *command], cwd=path, check=True)
+    return f"file://{path}"
+
+@pytest.fixture
+def no_aws(tmp_path, monkeypatch):
+    """No AWS config files and no ambient credentials."""
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(tmp_path / "missing-config"))
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "missing-credentials"))
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_PROFILE", "AWS_CONTAINER_CREDENTIALS_RELATIVE_URI",
+                 "AWS_CONTAINER_CREDENTIALS_FULL_URI", "AWS_WEB_IDENTITY_TOKEN_FILE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr("preflight._EC2_MARKERS", ((str(tmp_path / "not-ec2"), "ec2"),))
+
+def make_step(repo_url, profile="default", order=0):
+    return ZDStep(Path(f"step{order}.yml"), order, f"step{order}", profile, repo_url, "~/.ssh/id_rsa",
+                  "deploy.sh", {})
+
+def check(steps, audit_logger):
+    config = ZDConfig(prefetch=False)
+    return asyncio.run(ZDPreflight(config, audit_logger).zd_check(steps))
+
+def test_missing_profile_is_a_warning(repo, no_aws, audit_logger):
+    issues = check([make_step(repo, "staging")], audit_logger)
+    assert [(issue.check, issue.warning) for issue in issues] == [("aws_profile", True)]
+
+def test_default_profile_with_ambient_credentials(repo, no_aws, monkeypatch, audit_logger):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIAENV")
+    assert check([make_step(repo)], audit_logger) == []
+    # Only the default chain picks up ambient credentials
+    assert [issue.check for issue in check([make_step(repo, "staging")], audit_logger)] == ["aws_profile"]
+
+def test_blocking_problems_are_not_warnings(repo, no_aws, audit_logger):
+    step = make_step(repo)
+    step.script_path = "missing.sh"
+    issues = check([step], audit_logger)
+    assert any(issue.check == "script" and not issue.warning for issue in issues)
+
+def test_https_step_needs_no_ssh_key(repo, no_aws, tmp_path, monkeypatch, audit_logger):
+    # Serve the https URL from the local repository, so no network is needed
+    monkeypatch.setenv("GIT_CONFIG_COUNT", "1")
+    monkeypatch.setenv("GIT_CONFIG_KEY_0", f"url.{repo[len('file://'):]}.insteadOf")
+    monkeypatch.setenv("GIT_CONFIG_VALUE_0", "https://git.example.com/deploy.git")
+    step = make_step("https://git.example.com/deploy.git")
+    step.ssh_key = str(tmp_path / "no-such-key")
+    assert [issue.check for issue in check([step], audit_logger)] == ["aws_profile"]
+    step.ssh_key = ""
+    assert [issue.check for issue in check([step], audit_logger)] == ["aws_profile"]
+
+def test_ssh_step_checks_its_key(repo, no_aws, tmp_path, audit_logger):
+    step = make_step("git@git.example.com:team/deploy.git")
+    step.ssh_key = str(tmp_path / "no-such-key")
+
+    async def scenario():
+        # Stand in for the repository check, which would need the host
+        source = asyncio.get_running_loop().create_future()
+        source.set_result((None, None))
+        preflight = ZDPreflight(ZDConfig(prefetch=False), audit_logger)
+        return await preflight._zd_check_step(step, {"default"}, {step.repo_url: source})
+
+    assert [issue.check for issue in asyncio.run(scenario())] == ["ssh_key"]
+
+def test_caches_warn_while_tool_caches_are_off(repo, no_aws, audit_logger):
+    step = make_step(repo, "staging")
+    step.caches = ["terraform"]
+    issues = check([step], audit_logger)
+    assert [(issue.check, issue.warning) for issue in issues] == [("aws_profile", True), ("caches", True)]
+    assert not ZDConfig().tool_caches
+    assert "terraform" not in ZDConfig().tool_cache_builtin
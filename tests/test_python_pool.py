@@ -0,0 +1,73 @@
+import asyncio
+import os
+import signal
+from python_pool import ZDPythonPool
+from zd_config import ZDConfig
+
+JOBS = '''
+import os, sys, time
+
+def ok():
+    print("hello from", os.environ["GREETING"])
+    print("to stderr", file=sys.stderr)
+    return 3
+
+def hang():
+    print("started", flush=True)
+    time.sleep(60)
+'''
+
+def call(audit_logger, scenario, preload=("json",)):
+    """Run scenario(pool) with a pool preloading the given modules, closing it afterwards."""
+    pool = ZDPythonPool(ZDConfig(python_preload=preload), audit_logger)
+
+    async def main():
+        try:
+            return await scenario(pool)
+        finally:
+            await pool.zd_close()
+
+    return asyncio.run(main())
+
+def test_call_reports_exit_code_and_output(audit_logger, tmp_path):
+    (tmp_path / "jobs.py").write_text(JOBS)
+
+    async def scenario(pool):
+        process = await pool.zd_call("jobs:ok", tmp_path, {"GREETING": "zendeploy"})
+        stdout, stderr, code = await asyncio.gather(process.stdout.read(), process.stderr.read(), process.wait())
+        return process, stdout, stderr, code
+
+    process, stdout, stderr, code = call(audit_logger, scenario)
+    assert code == process.returncode == 3
+    assert stdout == b"hello from zendeploy\n"
+    assert stderr == b"to stderr\n"
+    assert process.usage["max_rss_kb"] > 0
+    assert process.shadowed == []
+
+def test_killed_call_has_no_exit_code(audit_logger, tmp_path):
+    (tmp_path / "jobs.py").write_text(JOBS)
+
+    async def scenario(pool):
+        process = await pool.zd_call("jobs:hang", tmp_path, {})
+        assert await process.stdout.readline() == b"started\n"
+        # Each call leads its own process group, as scripts do
+        os.killpg(process.pid, signal.SIGKILL)
+        return await asyncio.wait_for(process.wait(), 10)
+
+    assert call(audit_logger, scenario) == -1
+
+def test_checkout_copies_of_preloaded_modules_are_reported(audit_logger, tmp_path):
+    (tmp_path / "jobs.py").write_text("import json\n\ndef run():\n    print(getattr(json, 'VENDORED', False))\n")
+    (tmp_path / "json").mkdir()
+    (tmp_path / "json" / "__init__.py").write_text("VENDORED = True\n")
+
+    async def scenario(pool):
+        process = await pool.zd_call("jobs:run", tmp_path, {})
+        stdout, stderr, _ = await asyncio.gather(process.stdout.read(), process.stderr.read(), process.wait())
+        return process, stdout, stderr
+
+    process, stdout, stderr = call(audit_logger, scenario)
+    assert process.shadowed == ["json"]
+    assert stdout == b"False\n"
+    assert stderr.startswith(b"Warning: json is preloaded by the Python worker")
+    assert "python_pool_shadowed | jobs:run: json" in audit_logger.log_file.read_text()
@@ -0,0 +1,50 @@
+import asyncio
+import git
+from repo_cache import ZDRepoCache
+
+def make_repo(path):
+    repo = git.Repo.init(path)
+    (path / "README").write_text("hello\n")
+    repo.index.add(["README"])
+    repo.index.commit("initial")
+    return repo
+
+def test_interrupted_clone_leftovers_are_removed(tmp_path, audit_logger):
+    make_repo(tmp_path / "origin")
+    url = str(tmp_path / "origin")
+    cache = ZDRepoCache(tmp_path / "cache", audit_logger)
+    mirror = cache.zd_mirror_path(url)
+    # Left by an interrupted clone of this and of an older version
+    (cache.repo_dir / f".{mirror.stem}.partial-abc123").mkdir()
+    (mirror.with_suffix(".partial") / "objects").mkdir(parents=True)
+
+    path = asyncio.run(cache.zd_mirror(url))
+    assert path == mirror
+    assert git.Repo(path).bare
+    assert sorted(p.name for p in cache.repo_dir.iterdir()) == [".locks", mirror.name]
+
+def test_failed_clone_leaves_nothing_behind(tmp_path, audit_logger):
+    cache = ZDRepoCache(tmp_path / "cache", audit_logger)
+    try:
+        asyncio.run(cache.zd_mirror(str(tmp_path / "missing")))
+    except git.GitCommandError:
+        pass
+    else:
+        raise AssertionError("clone of a missing repository succeeded")
+    assert [p.name for p in cache.repo_dir.iterdir()] == [".locks"]
+
+def test_second_cache_fetches_the_existing_mirror(tmp_path, audit_logger):
+    origin = make_repo(tmp_path / "origin")
+    url = str(tmp_path / "origin")
+
+    async def scenario():
+        # Two processes sharing a cache directory, as the TUI and the daemon do
+        first, second = ZDRepoCache(tmp_path / "cache", audit_logger), ZDRepoCache(tmp_path / "cache", audit_logger)
+        await asyncio.gather(first.zd_mirror(url), second.zd_mirror(url))
+        (tmp_path / "origin" / "README").write_text("changed\n")
+        origin.index.add(["README"])
+        head = origin.index.commit("second").hexsha
+        return head, await second.zd_mirror(url)
+
+    head, path = asyncio.run(scenario())
+    assert git.Repo(path).commit("HEAD").hexsha == head
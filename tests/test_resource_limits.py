@@ -0,0 +1,109 @@
+import asyncio
+import time
+import pytest
+from resource_limits import ZDResourceLimit, ZDResourceLimits
+from zd_config import ZDConfig
+
+def limits(audit_logger, **specs):
+    return ZDResourceLimits(ZDConfig(resource_limits=tuple(specs.items())), audit_logger)
+
+def test_limit_specs():
+    assert ZDResourceLimit.from_spec("aws", 3).capacity == 3
+    bucket = ZDResourceLimit.from_spec("api", {"rate": 30, "period": 60})
+    assert (bucket.capacity, bucket.burst, bucket.tokens) == (None, 30, 30)
+    for spec, message in (({"rate": 0}, "positive"), ({"size": 1}, "unknown settings"),
+                          ({"period": 5}, "capacity or a rate"), (True, "positive")):
+        with pytest.raises(ValueError, match=message):
+            ZDResourceLimit.from_spec("x", spec)
+
+def test_preflight_problems():
+    config = ZDConfig(resource_limits=(("aws", 2), ("api", {"rate": 1, "burst": 2}), ("bad", {"rate": -1})))
+    assert ZDResourceLimits.zd_problems({"aws": 2, "api": 2, "lock": 1}, config) == []
+    assert ZDResourceLimits.zd_problems({"aws": 3, "api": 3, "lock": 0, "bad": 1}, config) == [
+        "Claims 3 of 'aws', which has a capacity of 2",
+        "Claims 3 of 'api', more than its burst of 2",
+        "Claim on 'lock' must be a positive number",
+        "Limit 'bad': rate must be a positive number",
+    ]
+    assert ZDResourceLimits.zd_problems(["aws"], config) == ["resources must be a mapping of resource name to amount"]
+
+def test_unconfigured_resources_are_locks(audit_logger):
+    resource_limits = limits(audit_logger)
+    lease = resource_limits.zd_try_acquire({"tfstate/prod": 1}, "step 1")
+    assert lease is not None
+    assert resource_limits.zd_try_acquire({"tfstate/prod": 1}, "step 2") is None
+    assert resource_limits.zd_blockers({"tfstate/prod": 1}) == ["tfstate/prod (held by step 1)"]
+    resource_limits.zd_release(lease)
+    # Releasing twice doesn't return capacity twice
+    resource_limits.zd_release(lease)
+    assert resource_limits.zd_try_acquire({"tfstate/prod": 1}, "step 2") is not None
+    assert resource_limits.zd_try_acquire({"tfstate/prod": 1}, "step 3") is None
+
+def test_capacity_is_shared(audit_logger):
+    resource_limits = limits(audit_logger, aws=3)
+    leases = [resource_limits.zd_try_acquire({"aws": 1}, f"step {i}") for i in range(3)]
+    assert all(leases)
+    assert resource_limits.zd_try_acquire({"aws": 1}, "step 4") is None
+
+def test_claims_are_granted_together_in_arrival_order(audit_logger):
+    async def scenario():
+        resource_limits = limits(audit_logger, aws=2)
+        granted = []
+        held = resource_limits.zd_try_acquire({"tfstate": 1}, "holder")
+
+        async def claim(name, claims):
+            lease = await resource_limits.zd_acquire(claims, name)
+            granted.append(name)
+            return lease
+
+        # Needs the held lock as well, so it waits without taking any aws capacity
+        both = asyncio.create_task(claim("both", {"tfstate": 1, "aws": 2}))
+        await asyncio.sleep(0.01)
+        # Shares aws with an earlier waiter, so it may not go ahead of it
+        aws_only = asyncio.create_task(claim("aws-only", {"aws": 1}))
+        # Shares nothing with the waiters, so it goes straight away
+        other = asyncio.create_task(claim("other", {"elsewhere": 1}))
+        await asyncio.sleep(0.01)
+        assert granted == ["other"] and other.done()
+        assert resource_limits.zd_blockers({"aws": 1}) == ["aws (queued)"]
+
+        resource_limits.zd_release(await other)
+        resource_limits.zd_release(held)
+        resource_limits.zd_release(await both)
+        await aws_only
+        return granted
+
+    assert asyncio.run(scenario()) == ["other", "both", "aws-only"]
+
+def test_cancelled_waiter_leaves_the_queue(audit_logger):
+    async def scenario():
+        resource_limits = limits(audit_logger)
+        held = resource_limits.zd_try_acquire({"lock": 1}, "holder")
+        waiter = asyncio.create_task(resource_limits.zd_acquire({"lock": 1}, "waiter"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        resource_limits.zd_release(held)
+        return resource_limits.zd_try_acquire({"lock": 1}, "next")
+
+    assert asyncio.run(scenario()) is not None
+
+def test_token_bucket(audit_logger):
+    async def scenario():
+        resource_limits = limits(audit_logger, api={"rate": 10, "period": 1, "burst": 2})
+        started = time.monotonic()
+        # The burst goes at once; tokens are spent, not returned on release
+        for index in range(2):
+            resource_limits.zd_release(resource_limits.zd_try_acquire({"api": 1}, f"burst {index}"))
+        assert resource_limits.zd_try_acquire({"api": 1}, "over") is None
+        assert resource_limits.zd_blockers({"api": 1})[0].startswith("api (rate limit, 0.1s")
+        times = []
+        for index in range(3):
+            await resource_limits.zd_acquire({"api": 1}, f"paced {index}")
+            times.append(time.monotonic() - started)
+        return times
+
+    times = asyncio.run(scenario())
+    # Refilled at 10 per second: one more claim roughly every 0.1s
+    assert 0.07 <= times[0] < 0.3
+    assert 0.25 <= times[-1] < 0.6
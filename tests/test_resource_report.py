@@ -0,0 +1,78 @@
+import asyncio
+import subprocess
+import sys
+import tracemalloc
+from types import SimpleNamespace
+from resource_report import RUSAGE_WRAPPER, ZDResourceMonitor
+
+def test_wrapper_reports_usage_and_exit_code(tmp_path):
+    usage_file = ZDResourceMonitor.zd_usage_file()
+    result = subprocess.run([sys.executable, "-c", RUSAGE_WRAPPER, str(usage_file),
+                             "/bin/sh", "-c", "echo hi; exit 3"], capture_output=True, text=True)
+    assert result.returncode == 3
+    assert result.stdout == "hi\n"
+    usage = ZDResourceMonitor.zd_read_usage(usage_file)
+    assert usage["max_rss_kb"] > 0
+    assert {"user", "sys", "major_faults", "read_blocks", "write_blocks"} <= usage.keys()
+    assert not usage_file.exists()
+
+def test_wrapper_exits_the_way_the_script_did():
+    usage_file = ZDResourceMonitor.zd_usage_file()
+    result = subprocess.run([sys.executable, "-c", RUSAGE_WRAPPER, str(usage_file),
+                             "/bin/sh", "-c", "kill -KILL $$"])
+    assert result.returncode == -9
+    assert ZDResourceMonitor.zd_read_usage(usage_file) is not None
+
+def test_missing_or_empty_usage_is_unavailable(tmp_path):
+    assert ZDResourceMonitor.zd_read_usage(tmp_path / "missing.json") is None
+    empty = ZDResourceMonitor.zd_usage_file()
+    assert ZDResourceMonitor.zd_read_usage(empty) is None
+    assert not empty.exists()
+
+def test_phases_record_heap_growth():
+    monitor = ZDResourceMonitor(top=5, frames=5)
+    monitor.zd_start()
+    try:
+        retained = [bytearray(1024) for _ in range(200)]
+        asyncio.run(monitor.zd_phase("steps"))
+    finally:
+        monitor.zd_stop()
+    assert not tracemalloc.is_tracing()
+    phase, = monitor.phases
+    assert phase.name == "steps"
+    assert phase.current_kb >= 200 and phase.peak_kb >= phase.current_kb
+    assert set(phase.components_kb) == {"executor", "logger", "widgets", "other"}
+    assert any("test_resource_report.py" in site for site, _, _ in phase.top_sites)
+    del retained
+
+def test_tracing_started_elsewhere_is_left_running():
+    tracemalloc.start()
+    try:
+        monitor = ZDResourceMonitor()
+        monitor.zd_start()
+        monitor.zd_stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_report_marks_approximate_usage(audit_logger):
+    monitor = ZDResourceMonitor()
+    usage = {"user": 1.5, "sys": 0.25}
+    monitor.zd_record_step(SimpleNamespace(name="build"), 2.0, 0.0, {**usage, "max_rss_kb": 2048})
+    monitor.zd_record_step(SimpleNamespace(name="killed"), 3.0, 0.0,
+                           {**usage, "session_max_rss_kb": 4096}, usage_exact=False)
+    monitor.zd_record_step(SimpleNamespace(name="python"), 1.0, 0.0, None)
+    lines = monitor.zd_report()
+    assert lines[0] == "=== Resource Report ==="
+    assert lines[1].startswith("ZenDeploy process: max_rss=")
+    assert lines[2] == "Step build: 2.0s user=1.50s sys=0.25s max_rss=2048KB heap_delta=+0KB"
+    assert lines[3] == ("Step killed: 3.0s user=1.50s sys=0.25s session_peak_rss=4096KB (approximate) "
+                        "heap_delta=+0KB")
+    assert lines[4] == "Step python: 1.0s script usage unavailable heap_delta=+0KB"
+
+    path = monitor.zd_write(audit_logger)
+    assert path.parent == audit_logger.log_file.parent
+    assert path.name.startswith(f"{audit_logger.log_file.stem}_resources_")
+    text = path.read_text()
+    assert text.startswith("Generated: ")
+    assert "Step killed: 3.0s" in text
@@ -0,0 +1,50 @@
+import sqlite3
+from types import SimpleNamespace
+import pytest
+from run_history import ZDRunHistory, zd_format_duration, zd_step_fingerprint
+from zd_config import ZDConfig
+
+def step(order, name="migrate", command="migrate.sh"):
+    return SimpleNamespace(order=order, name=name, repo_url="git@github.com:org/ops.git",
+                           command=command, aws_profile="prod")
+
+@pytest.fixture
+def history(tmp_path):
+    history = ZDRunHistory(tmp_path / "history.sqlite")
+    yield history
+    history.zd_close()
+
+def record(history, target, *durations, outcome="succeeded"):
+    run_id = history.zd_start_run(1)
+    for started_at, duration in enumerate(durations):
+        history.zd_record_step(run_id, target, float(started_at), duration, None, 0, 0, outcome)
+    history.zd_finish_run(run_id, outcome)
+
+def test_estimates_are_medians_of_recent_successes(history):
+    record(history, step(0), 10, 30, 20)
+    record(history, step(0), 500, outcome="failed")
+    record(history, step(1, "deploy"), 7)
+    assert history.zd_estimates([step(0), step(1, "deploy"), step(2, "new")]) == {0: 20, 1: 7}
+
+def test_steps_are_identified_by_what_they_deploy(history):
+    record(history, step(3), 12)
+    # The same step at another position in a plan shares its history; another command doesn't
+    assert history.zd_durations(zd_step_fingerprint(step(0))) == [12]
+    assert history.zd_durations(zd_step_fingerprint(step(3, command="other.sh"))) == []
+
+def test_baseline_needs_enough_samples(history):
+    record(history, step(0), 10, 11)
+    assert history.zd_baseline(step(0)) is None
+    record(history, step(0), 40)
+    assert history.zd_baseline(step(0)) == 11
+
+def test_close_releases_the_database(tmp_path):
+    history = ZDRunHistory.for_config(ZDConfig(cache_dir=tmp_path))
+    assert history.path == tmp_path / "history.sqlite"
+    history.zd_close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        history.zd_start_run(1)
+    assert ZDRunHistory.for_config(ZDConfig(history_store=False)) is None
+
+def test_format_duration():
+    assert [zd_format_duration(s) for s in (45, 192, 3900)] == ["45s", "3m12s", "1h05m"]
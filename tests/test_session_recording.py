@@ -0,0 +1,62 @@
+import asyncio
+import gzip
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from session_recording import ZDSessionRecorder, ZDSessionReplay
+
+STEPS = [SimpleNamespace(order=0, name="migrate"), SimpleNamespace(order=1, name="deploy")]
+
+def replay(path, speed):
+    async def scenario():
+        recording = ZDSessionReplay(path)
+        return recording, [item async for item in recording.zd_replay(speed)]
+
+    return asyncio.run(scenario())
+
+def test_recording_round_trip(audit_logger):
+    recorder = ZDSessionRecorder.for_session(audit_logger, STEPS)
+    assert recorder.path.parent == audit_logger.log_file.parent
+    assert recorder.path.name.endswith(".zdrec.gz")
+    recorder.zd_record(None, ("[yellow]start[/yellow]\n", "start\n"))
+    recorder.zd_record(STEPS[1], ("[b]ünïcode[/b]\n", "ünïcode\n"))
+    recorder.zd_close()
+    recorder.zd_record(STEPS[0], ("late\n", "late\n"))
+    assert recorder.events == 2
+
+    recording, events = replay(recorder.path, None)
+    assert [(step.order, step.name) for step in recording.steps] == [(0, "migrate"), (1, "deploy")]
+    assert [(getattr(step, "name", None), formatted, raw) for step, formatted, raw, _ in events] == [
+        (None, "[yellow]start[/yellow]\n", "start\n"), ("deploy", "[b]ünïcode[/b]\n", "ünïcode\n")
+    ]
+    assert recording.events == 2
+
+def write(path, header, *lines):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for entry in (header, *lines):
+            f.write(json.dumps(entry) + "\n")
+
+def test_replay_is_paced_by_speed(tmp_path):
+    path = tmp_path / "paced.zdrec.gz"
+    write(path, {"version": 2, "steps": []}, [0.0, None, "a", "a"], [0.4, None, "b", "b"])
+    start = time.monotonic()
+    recording, events = replay(path, 2.0)
+    assert len(events) == 2
+    assert 0.15 <= time.monotonic() - start < 2
+    assert recording.elapsed >= 0.15
+
+def test_version_1_states_come_from_the_old_markers(tmp_path):
+    path = tmp_path / "v1.zdrec.gz"
+    write(path, {"version": 1, "steps": [{"order": 0, "name": "migrate"}]},
+          [0.0, 0, "h", "\n=== Step 1: migrate ===\n"],
+          [0.1, 0, "f", "=== Step 1 Failed ===\n"],
+          [0.2, None, "p", "=== Preflight Failed: 2 problems ===\n"])
+    _, events = replay(path, None)
+    assert [states for *_, states in events] == [("running",), ("failed",), ("failed",)]
+
+def test_unknown_versions_are_refused(tmp_path):
+    path = tmp_path / "future.zdrec.gz"
+    write(path, {"version": 99, "steps": []})
+    with pytest.raises(ValueError, match="Unsupported recording version"):
+        ZDSessionReplay(path)
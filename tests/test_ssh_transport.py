@@ -0,0 +1,50 @@
+import asyncio
+import shlex
+from pathlib import Path
+import pytest
+from ssh_transport import ZDSSHTransport, zd_git_ssh_command
+from zd_config import ZDConfig
+
+@pytest.mark.parametrize("url, destination", [
+    ("git@github.com:org/repo.git", ("git@github.com", None)),
+    ("github.com:org/repo.git", ("github.com", None)),
+    ("ssh://deploy@git.example.com:2222/org/repo.git", ("deploy@git.example.com", 2222)),
+    ("git+ssh://git.example.com/org/repo.git", ("git.example.com", None)),
+    ("https://github.com/org/repo.git", None),
+    ("file://./tests/test_repos/repo1", None),
+    ("/srv/git/repo.git", None),
+    ("./repo", None),
+])
+def test_ssh_destination(url, destination):
+    assert ZDSSHTransport.zd_ssh_destination(url) == destination
+
+def test_control_paths_are_shared_per_host_and_key(audit_logger):
+    transport = ZDSSHTransport(ZDConfig(ssh_control_persist=30), audit_logger)
+    try:
+        first = transport.zd_ssh_command("git@github.com:org/a.git", "~/.ssh/deploy")
+        second = transport.zd_ssh_command("git@github.com:org/b.git", "~/.ssh/deploy")
+        other_key = transport.zd_ssh_command("git@github.com:org/a.git", "~/.ssh/other")
+        other_port = transport.zd_ssh_command("ssh://git@github.com:2222/org/a.git", "~/.ssh/deploy")
+        assert transport.zd_ssh_command("https://github.com/org/a.git", "~/.ssh/deploy") is None
+
+        def control_path(command):
+            option = next(arg for arg in shlex.split(command) if arg.startswith("ControlPath="))
+            return option.partition("=")[2]
+
+        assert first == second
+        assert len({control_path(c) for c in (first, other_key, other_port)}) == 3
+        assert control_path(first).startswith(str(transport.control_dir))
+        assert "ControlPersist=30" in first
+        assert shlex.split(first)[1:3] == ["-i", str(Path.home() / ".ssh/deploy")]
+    finally:
+        control_dir = transport.control_dir
+        asyncio.run(transport.zd_close())
+    assert not control_dir.exists()
+
+def test_fallback_command_expands_and_quotes_the_key(monkeypatch):
+    monkeypatch.setenv("HOME", "/home/deploy user")
+    command = zd_git_ssh_command(None, "git@github.com:org/repo.git", "~/keys/id; rm -rf x")
+    assert shlex.split(command) == ["ssh", "-i", "/home/deploy user/keys/id; rm -rf x"]
+    assert zd_git_ssh_command(None, "git@github.com:org/repo.git", "") is None
+    assert zd_git_ssh_command(None, "https://github.com/org/repo.git", "~/.ssh/id_rsa") is None
+    assert zd_git_ssh_command(None, "file://./tests/test_repos/repo1", "~/.ssh/id_rsa") is None
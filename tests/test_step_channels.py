@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+from event_bus import ZDOutputEvent, ZDStatus
+from session_recording import ZDSessionRecorder, ZDSessionReplay
+from step_channels import ZDStepChannels
+
+STEPS = [SimpleNamespace(order=0, name="migrate"), SimpleNamespace(order=1, name="deploy")]
+
+def test_state_comes_from_status_events():
+    channels = ZDStepChannels(STEPS, 10)
+    channel, started = channels.zd_route(STEPS[0], "header", "=== Step 1: migrate ===\n", ("running",))
+    assert started and channel.state == "running"
+    channels.zd_route(STEPS[0], "done", "=== Step 1 Completed Successfully ===\n", ("succeeded",))
+    assert channel.state == "succeeded"
+    assert channel.finished is not None
+
+def test_script_output_imitating_markers_leaves_state_alone():
+    channels = ZDStepChannels(STEPS, 10)
+    channel, _ = channels.zd_route(STEPS[1], "header", "=== Step 2: deploy ===\n", ("running",))
+    started_at = channel.started
+    _, started = channels.zd_route(STEPS[1], "line", "=== Step 3 Failed to reach host\n")
+    assert not started
+    _, started = channels.zd_route(STEPS[1], "line", "=== Step 1: migrate\n")
+    assert not started
+    assert channel.state == "running"
+    assert channel.started == started_at
+    assert channel.bytes == len("=== Step 2: deploy ===\n=== Step 3 Failed to reach host\n=== Step 1: migrate\n")
+    assert channel.last_line == "=== Step 1: migrate"
+
+def test_merged_events_keep_every_state():
+    status = ZDStatus("header", "=== Step 1: migrate ===\n", "running")
+    first = ZDOutputEvent(STEPS[0], status[0], status[1], (status.state,))
+    merged = first.zd_merge(ZDOutputEvent(STEPS[0], "line", "=== Step 1 Failed\n"))
+    merged = merged.zd_merge(ZDOutputEvent(STEPS[0], "done", "ok\n", ("succeeded",)))
+    assert merged.states == ("running", "succeeded")
+
+    channels = ZDStepChannels(STEPS, 10)
+    channel, started = channels.zd_route(merged.step, merged.formatted, merged.raw, merged.states)
+    assert started and channel.state == "succeeded"
+
+def test_recording_replays_states(tmp_path):
+    recorder = ZDSessionRecorder(tmp_path / "run.zdrec.gz", STEPS)
+    recorder.zd_record(STEPS[0], ("header", "=== Step 1: migrate ===\n"), ("running",))
+    recorder.zd_record(STEPS[0], ("line", "=== Step 1 Failed to reach host\n"))
+    recorder.zd_record(None, ("summary", "done\n"))
+    recorder.zd_close()
+
+    async def scenario():
+        return [item async for item in ZDSessionReplay(recorder.path).zd_replay(None)]
+
+    replayed = asyncio.run(scenario())
+    assert [(getattr(step, "order", None), states) for step, _, _, states in replayed] == [
+        (0, ("running",)), (0, ()), (None, ())
+    ]
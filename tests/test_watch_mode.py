@@ -0,0 +1,76 @@
+import asyncio
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+from deployment_manager import ZDManager
+from watch_mode import ZDWatcher, zd_affected_steps
+from zd_config import ZDConfig
+
+def commit(repo, message):
+    (repo / "script.sh").write_text(f"echo {message}\n")
+    subprocess.run(["git", "add", "."], cwd=repo, check=True)
+    subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", message],
+                   cwd=repo, check=True)
+
+@pytest.fixture
+def steps(tmp_path):
+    """Two steps on one local repository; the second takes step0's results."""
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    commit(repo, "first")
+    manager = ZDManager()
+    for index, extra in enumerate(["", "env_vars: {VALUE: '${step.step0.VALUE}'}\n"]):
+        path = tmp_path / f"step{index}.yml"
+        path.write_text(f"name: step{index}\naws_profile: default\nrepo_url: {repo}\n"
+                        f"ssh_key: ''\nscript_path: script.sh\n{extra}")
+        manager.zd_add_step(path)
+    return manager.steps
+
+def watch(audit_logger, steps, change, polling=False, timeout=5.0):
+    """Start a watcher, apply change, and return the first set of changed orders (None if none came)."""
+    config = ZDConfig(watch_debounce=0.1, watch_poll_interval=0.2 if polling else 30.0)
+
+    async def scenario():
+        watcher = ZDWatcher(config, audit_logger)
+        if polling:
+            watcher._inotify.zd_close()
+            watcher._inotify = None
+        await watcher.zd_start(steps)
+        try:
+            change()
+            changes = watcher.zd_changes()
+            return await asyncio.wait_for(changes.__anext__(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            watcher.zd_close()
+
+    return asyncio.run(scenario())
+
+def test_affected_steps_follow_dependencies():
+    def step(order, name, *depends):
+        return SimpleNamespace(order=order, name=name, dependencies=set(depends))
+    plan = [step(0, "a"), step(1, "b", "a"), step(2, "c"), step(3, "d", "b"), step(4, "e", "c")]
+    assert [s.name for s in zd_affected_steps(plan, {0})] == ["a", "b", "d"]
+    assert [s.name for s in zd_affected_steps(plan, {1, 2})] == ["b", "c", "d", "e"]
+    assert zd_affected_steps(plan, set()) == []
+
+def test_edited_step_file_is_reported(audit_logger, steps):
+    path = steps[1].file_path
+    assert watch(audit_logger, steps, lambda: path.write_text(path.read_text() + "timeout: 5\n")) == {1}
+    assert "watch_change" in audit_logger.log_file.read_text()
+
+def test_rewriting_the_same_content_is_not_a_change(audit_logger, steps):
+    path = steps[0].file_path
+    assert watch(audit_logger, steps, lambda: path.write_text(path.read_text()), timeout=1.0) is None
+
+def test_new_commit_reports_every_step_on_the_repository(audit_logger, steps):
+    repo = Path(steps[0].repo_url)
+    assert watch(audit_logger, steps, lambda: commit(repo, "second")) == {0, 1}
+
+def test_polling_when_inotify_is_unavailable(audit_logger, steps):
+    path = steps[0].file_path
+    assert watch(audit_logger, steps, lambda: path.write_text(path.read_text() + "timeout: 5\n"),
+                 polling=True) == {0}
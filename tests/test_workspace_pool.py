@@ -0,0 +1,97 @@
+import asyncio
+import os
+import stat
+import pytest
+import workspace_pool
+from workspace_pool import ZDWorkspacePool, ZDWorkspaceQuotaError, ZDWorkspaceRootError
+from zd_config import ZDConfig
+
+def test_quota_uses_the_sampled_usage(tmp_path, audit_logger, monkeypatch):
+    async def scenario():
+        pool = ZDWorkspacePool(ZDConfig(workspace_root=str(tmp_path / "pool"), workspace_quota_mb=1), audit_logger)
+        walks = []
+        measure = pool.zd_usage_mb
+        monkeypatch.setattr(pool, "zd_usage_mb", lambda: walks.append(1) or measure())
+        workspace = await pool.zd_acquire("step")
+        (workspace / "big").write_bytes(b"x" * 2 * 1024 * 1024)
+        # Under quota at the last sample: no walk of the root
+        second = await pool.zd_acquire("step")
+        assert len(walks) == 1
+        pool._usage_mb = 2.0
+        # Over quota at the last sample: drain, re-measure, and refuse
+        with pytest.raises(ZDWorkspaceQuotaError, match="2MB used of 1MB"):
+            await pool.zd_acquire("step")
+        await pool.zd_release(workspace)
+        await pool.zd_drain()
+        # Once the space is freed the re-measure lets the step go
+        assert await pool.zd_acquire("step")
+        await pool.zd_release(second)
+        await pool.zd_close()
+        return len(walks)
+
+    assert asyncio.run(scenario()) == 3
+
+def test_usage_is_resampled(tmp_path, audit_logger, monkeypatch):
+    monkeypatch.setattr(workspace_pool, "_USAGE_INTERVAL", 0.01)
+
+    async def scenario():
+        pool = ZDWorkspacePool(ZDConfig(workspace_root=str(tmp_path / "pool"), workspace_quota_mb=10), audit_logger)
+        workspace = await pool.zd_acquire("step")
+        (workspace / "big").write_bytes(b"x" * 1024 * 1024)
+        await asyncio.sleep(0.1)
+        usage = pool._usage_mb
+        await pool.zd_close()
+        return usage, pool._sampler
+
+    usage, sampler = asyncio.run(scenario())
+    assert usage >= 1
+    assert sampler is None
+
+def test_default_root_is_per_user(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert workspace_pool.zd_default_workspace_root() == tmp_path / "zendeploy"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert workspace_pool.zd_default_workspace_root().name == f"zendeploy-{os.getuid()}"
+
+def test_root_is_created_private(tmp_path, audit_logger):
+    async def scenario():
+        pool = ZDWorkspacePool(ZDConfig(workspace_root=str(tmp_path / "pool")), audit_logger)
+        await pool.zd_acquire("step")
+        await pool.zd_close()
+
+    asyncio.run(scenario())
+    assert stat.S_IMODE((tmp_path / "pool").stat().st_mode) == 0o700
+
+@pytest.mark.parametrize("make_root", [
+    lambda root: root.mkdir(mode=0o755) or root.chmod(0o755),
+    lambda root: root.symlink_to(root.parent),
+])
+def test_shared_root_is_refused(tmp_path, audit_logger, make_root):
+    make_root(tmp_path / "pool")
+
+    async def scenario():
+        await ZDWorkspacePool(ZDConfig(workspace_root=str(tmp_path / "pool")), audit_logger).zd_start()
+
+    with pytest.raises(ZDWorkspaceRootError):
+        asyncio.run(scenario())
+
+def test_only_unlocked_process_dirs_are_reclaimed(tmp_path, audit_logger):
+    async def scenario():
+        config = ZDConfig(workspace_root=str(tmp_path / "pool"), workspace_prewarm=1)
+        running = ZDWorkspacePool(config, audit_logger)
+        exited = ZDWorkspacePool(config, audit_logger)
+        await running.zd_start()
+        await exited.zd_start()
+        await exited.zd_close()
+        # Same PID as this process, so a liveness check could not tell them apart
+        starting = ZDWorkspacePool(config, audit_logger)
+        await starting.zd_start()
+        await starting.zd_drain()
+        dirs = {path.name for path in (tmp_path / "pool").glob("pid-*")}
+        await running.zd_close()
+        await starting.zd_close()
+        return dirs, running.process_dir.name, exited.process_dir.name
+
+    dirs, running, exited = asyncio.run(scenario())
+    assert running in dirs
+    assert exited not in dirs
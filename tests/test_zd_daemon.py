@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sqlite3
+import stat
+import pytest
+from run_history import ZDRunHistory
+from zd_config import ZDConfig
+from zd_daemon import ZDDaemon, ZDDaemonClient, ZDJob
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = ZDConfig(daemon_socket=tmp_path / "run" / "zd.sock", cache_dir=tmp_path / "cache",
+                      workspace_root=tmp_path / "workspaces", history_store=False,
+                      python_pool=False, ssh_multiplex=False)
+    return ZDDaemon(config)
+
+def serving(daemon, scenario):
+    """Run scenario(client) against the daemon, then shut it down."""
+    async def main():
+        server = asyncio.create_task(daemon.zd_serve())
+        client = ZDDaemonClient(daemon.socket_path)
+        while not await client.zd_available():
+            await asyncio.sleep(0.01)
+        try:
+            return await scenario(client)
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+
+    return asyncio.run(main())
+
+def test_socket_is_created_group_writable_and_removed(daemon):
+    async def scenario(client):
+        mode = os.stat(daemon.socket_path).st_mode
+        return stat.S_ISSOCK(mode), stat.S_IMODE(mode), await client.zd_status()
+
+    is_socket, mode, jobs = serving(daemon, scenario)
+    assert is_socket and mode == 0o660
+    assert jobs == []
+    assert not daemon.socket_path.exists()
+    # Nothing but the socket was ever created beside it
+    assert list(daemon.socket_path.parent.iterdir()) == []
+    assert "Session Ended" in daemon.audit_logger.log_file.read_text()
+
+def test_peers_outside_the_socket_group_are_refused(daemon, monkeypatch):
+    monkeypatch.setattr(ZDDaemon, "_zd_peer", staticmethod(lambda writer: (54321, 54321)))
+
+    async def scenario(client):
+        with pytest.raises(RuntimeError, match="Permission denied"):
+            await client.zd_status()
+
+    serving(daemon, scenario)
+    assert "daemon_denied | uid 54321" in daemon.audit_logger.log_file.read_text()
+
+def test_job_status_follows_dispatch(daemon):
+    def job(seq, targets):
+        queued = ZDJob(f"job-{seq}", [], 0, set(targets), seq)
+        daemon._pending.append(queued)
+        return queued
+
+    async def scenario():
+        started = []
+
+        async def fake_run(queued):
+            started.append(queued.job_id)
+            await asyncio.Event().wait()
+
+        daemon._zd_run_job = fake_run
+        daemon.config.daemon_max_jobs = 2
+        first, blocked, other, queued = job(1, ["prod"]), job(2, ["prod"]), job(3, ["dev"]), job(4, ["qa"])
+        dispatcher = asyncio.create_task(daemon._zd_dispatch())
+        daemon._wakeup.set()
+        await asyncio.sleep(0.01)
+        statuses = [j.status for j in (first, blocked, other, queued)]
+        dispatcher.cancel()
+        for task in list(daemon._job_tasks):
+            task.cancel()
+        await asyncio.gather(dispatcher, *daemon._job_tasks, return_exceptions=True)
+        return started, statuses
+
+    started, statuses = asyncio.run(scenario())
+    assert started == ["job-1", "job-3"]
+    assert statuses == ["running", "waiting", "running", "queued"]
+
+def test_shutdown_closes_the_run_history(daemon, tmp_path):
+    daemon.run_history = ZDRunHistory(tmp_path / "history.sqlite")
+
+    async def scenario(client):
+        return await client.zd_status()
+
+    assert serving(daemon, scenario) == []
+    with pytest.raises(sqlite3.ProgrammingError):
+        daemon.run_history.zd_start_run(1)